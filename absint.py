@@ -0,0 +1,432 @@
+from __future__ import annotations
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    CfgNode,
+    CondNode,
+    EndNode,
+    StartNode,
+    get_nodes,
+)
+from expr import (
+    And,
+    BinaryExpr,
+    BoolValue,
+    Expr,
+    INT,
+    IfThenElse,
+    IntValue,
+    NEGATED_RELATION,
+    Not,
+    Or,
+    Predicate,
+    RelExpr,
+    Then,
+    UnaryExpr,
+    Variable,
+    from_linear_form,
+    is_int,
+    linear_form,
+)
+
+# the number of times the state at a cut point is joined before it's widened
+WIDENING_DELAY = 3
+# the number of decreasing iterations run after widening
+NARROWING = 2
+# `a op b` as `b op a`
+SWAPPED_RELATION = {"==": "==", "!=": "!=", "<": ">", ">": "<", "<=": ">=", ">=": "<="}
+
+
+@dataclass(frozen=True)
+class Interval:
+    """
+    the integers from `lo` to `hi`, `None` bounds are infinite
+    """
+
+    lo: Optional[int] = None
+    hi: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return self.lo is not None and self.hi is not None and self.lo > self.hi
+
+    def is_top(self) -> bool:
+        return self.lo is None and self.hi is None
+
+    def join(self, other: Interval) -> Interval:
+        return Interval(
+            None if self.lo is None or other.lo is None else min(self.lo, other.lo),
+            None if self.hi is None or other.hi is None else max(self.hi, other.hi),
+        )
+
+    def meet(self, other: Interval) -> Interval:
+        return Interval(bound(max, self.lo, other.lo), bound(min, self.hi, other.hi))
+
+    def widen(self, other: Interval) -> Interval:
+        # the bounds that grew are dropped
+        return Interval(
+            None
+            if self.lo is None or other.lo is None or other.lo < self.lo
+            else self.lo,
+            None
+            if self.hi is None or other.hi is None or other.hi > self.hi
+            else self.hi,
+        )
+
+    def __neg__(self) -> Interval:
+        return Interval(
+            None if self.hi is None else -self.hi, None if self.lo is None else -self.lo
+        )
+
+    def __add__(self, other: Interval) -> Interval:
+        return Interval(
+            None if self.lo is None or other.lo is None else self.lo + other.lo,
+            None if self.hi is None or other.hi is None else self.hi + other.hi,
+        )
+
+    def __sub__(self, other: Interval) -> Interval:
+        return self + -other
+
+    def __mul__(self, other: Interval) -> Interval:
+        if self == ZERO or other == ZERO:
+            return ZERO
+        bounds = (self.lo, self.hi, other.lo, other.hi)
+        if any(b is None for b in bounds):
+            return TOP
+        products = [a * b for a in (self.lo, self.hi) for b in (other.lo, other.hi)]
+        return Interval(min(products), max(products))
+
+
+def bound(
+    tighter: Callable[[int, int], int], a: Optional[int], b: Optional[int]
+) -> Optional[int]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return tighter(a, b)
+
+
+TOP = Interval()
+ZERO = Interval(0, 0)
+
+# the interval of an int variable `x` is stored under `x`, the interval of a
+# difference `x - y` under `(x, y)` with `x < y`
+Key = Union[str, tuple[str, str]]
+# the facts known at a node, `None` if it's unreachable, missing keys are unbounded
+State = Optional[dict[Key, Interval]]
+
+
+def get(state: dict[Key, Interval], x: str) -> Interval:
+    return state.get(x, TOP)
+
+
+def get_difference(state: dict[Key, Interval], x: str, y: str) -> Interval:
+    """
+    the interval of `x - y`, which is at least as precise as that of the intervals
+    """
+    if x < y:
+        stored = state.get((x, y), TOP)
+    else:
+        stored = -state.get((y, x), TOP)
+    return stored.meet(get(state, x) - get(state, y))
+
+
+def constrain(state: State, key: Key, interval: Interval) -> State:
+    if state is None:
+        return None
+    if not isinstance(key, str) and key[0] > key[1]:
+        key, interval = (key[1], key[0]), -interval
+    value = state.get(key, TOP).meet(interval)
+    if value.is_empty():
+        return None
+    if value.is_top():
+        return state
+    return {**state, key: value}
+
+
+def exclude(state: State, key: Key, value: int) -> State:
+    """
+    removes `value` from the interval of `key` if it's one of its ends
+    """
+    if state is None:
+        return None
+    if not isinstance(key, str) and key[0] > key[1]:
+        key, value = (key[1], key[0]), -value
+    interval = lookup(state, key)
+    if interval.lo == value:
+        return constrain(state, key, Interval(value + 1, None))
+    elif interval.hi == value:
+        return constrain(state, key, Interval(None, value - 1))
+    return state
+
+
+def lookup(state: dict[Key, Interval], key: Key) -> Interval:
+    return get(state, key) if isinstance(key, str) else get_difference(state, *key)
+
+
+def join(a: State, b: State) -> State:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    # a difference only one side stores is still bounded by the intervals of the
+    # other, e.g. `i - n` after `i = 0`
+    joined = {key: lookup(a, key).join(lookup(b, key)) for key in {**a, **b}}
+    return {key: value for key, value in joined.items() if not value.is_top()}
+
+
+def widen(a: State, b: State) -> State:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    widened = {key: lookup(a, key).widen(lookup(b, key)) for key in {**a, **b}}
+    return {key: value for key, value in widened.items() if not value.is_top()}
+
+
+def evaluate(expr: Expr, state: dict[Key, Interval]) -> Interval:
+    if isinstance(expr, IntValue):
+        return Interval(expr.number, expr.number)
+    elif isinstance(expr, Variable):
+        return get(state, expr.var) if expr.type_ == INT else TOP
+    elif isinstance(expr, UnaryExpr) and expr.operator in ("+", "-"):
+        value = evaluate(expr.operand, state)
+        return -value if expr.operator == "-" else value
+    elif isinstance(expr, BinaryExpr) and expr.operator in ("+", "-", "*"):
+        lhs, rhs = evaluate(expr.lhs, state), evaluate(expr.rhs, state)
+        if expr.operator == "+":
+            return lhs + rhs
+        elif expr.operator == "-":
+            return lhs - rhs
+        return lhs * rhs
+    elif isinstance(expr, IfThenElse):
+        return evaluate(expr.value_true, state).join(evaluate(expr.value_false, state))
+    else:
+        # division, array reads, casts, ...
+        return TOP
+
+
+def get_offset(expr: Expr) -> Optional[tuple[str, int]]:
+    """
+    `(y, c)` if `expr` is `y + c` for an int variable `y`
+    """
+    form = linear_form(expr) if is_int(expr) else None
+    if form is None or len(form[0]) != 1:
+        return None
+    ((atom, coefficient),) = form[0].items()
+    if coefficient != 1 or not isinstance(atom, Variable) or atom.type_ != INT:
+        return None
+    return atom.var, form[1]
+
+
+def assign(state: dict[Key, Interval], var: str, expr: Expr) -> State:
+    value = evaluate(expr, state)
+    offset = get_offset(expr)
+    kept = {
+        key: interval
+        for key, interval in state.items()
+        if key != var and (isinstance(key, str) or var not in key)
+    }
+    new: State = constrain(kept, var, value)
+    if offset is None:
+        return new
+    source, c = offset
+    shift = Interval(c, c)
+    # `x := y + c` keeps the differences of `y`, `x := x + c` shifts its own
+    names = {name for key in state for name in ([key] if isinstance(key, str) else key)}
+    for other in sorted(names - {source, var}):
+        new = constrain(new, (var, other), get_difference(state, source, other) + shift)
+    if source != var:
+        new = constrain(new, (var, source), shift)
+    return new
+
+
+def refine(state: State, cond: Expr, positive: bool = True) -> State:
+    """
+    the states of `state` in which `cond` is `positive`
+    """
+    if state is None:
+        return None
+    if isinstance(cond, BoolValue):
+        return state if cond.value == positive else None
+    elif isinstance(cond, Not):
+        return refine(state, cond.operand, not positive)
+    elif isinstance(cond, (And, Or)):
+        if isinstance(cond, And) == positive:
+            for operand in cond.args:
+                state = refine(state, operand, positive)
+            return state
+        result: State = None
+        for operand in cond.args:
+            result = join(result, refine(state, operand, positive))
+        return result
+    elif isinstance(cond, Then):
+        return refine(state, Or((Not(cond.if_), cond.then)), positive)
+    elif isinstance(cond, RelExpr):
+        operator = cond.operator if positive else NEGATED_RELATION[cond.operator]
+        return refine_relation(state, operator, cond.lhs, cond.rhs)
+    else:
+        return state
+
+
+def refine_relation(
+    state: dict[Key, Interval], operator: str, lhs: Expr, rhs: Expr
+) -> State:
+    if not is_int(lhs) or not is_int(rhs):
+        return state
+    form = linear_form(BinaryExpr("-", lhs, rhs))
+    if form is None:
+        return state
+    terms = {atom: c for atom, c in form[0].items() if c != 0}
+    if not all(isinstance(a, Variable) and a.type_ == INT for a in terms):
+        return state
+    # `terms op constant`
+    constant = -form[1]
+    coefficients = sorted(terms.values())
+    if coefficients == [1] or coefficients == [-1]:
+        ((atom, c),) = terms.items()
+        assert isinstance(atom, Variable)
+        key: Key = atom.var
+        if c == -1:
+            operator, constant = SWAPPED_RELATION[operator], -constant
+        x, y = key, None
+    elif coefficients == [-1, 1]:
+        x, y = (a.var for a, c in sorted(terms.items(), key=lambda t: -t[1]))
+        key = (x, y)
+    else:
+        return state
+    if operator == "!=":
+        return exclude(state, key, constant)
+    interval = {
+        "<": Interval(None, constant - 1),
+        "<=": Interval(None, constant),
+        ">": Interval(constant + 1, None),
+        ">=": Interval(constant, None),
+        "==": Interval(constant, constant),
+    }[operator]
+    new = constrain(state, key, interval)
+    if y is None or new is None:
+        return new
+    # `x - y` in `interval` also bounds `x` and `y`
+    new = constrain(new, x, get(new, y) + interval)
+    if new is None:
+        return None
+    return constrain(new, y, get(new, x) - interval)
+
+
+def transfer(node: CfgNode, state: State) -> list[tuple[CfgNode, State]]:
+    """
+    the states at the successors of `node` when `state` holds before it
+    """
+    if state is None:
+        return []
+    if isinstance(node, StartNode):
+        if node.requires is not None:
+            state = refine(state, node.requires)
+        return [(node.next_node, state)]
+    elif isinstance(node, AssignmentNode):
+        if node.var.type_ == INT:
+            state = assign(state, node.var.var, node.expression)
+        return [(node.next_node, state)]
+    elif isinstance(node, AssumeNode):
+        return [(node.next_node, refine(state, node.expression))]
+    elif isinstance(node, AssertNode):
+        # executions go on only if the assertion holds
+        for fact in node.remembers + (node.assertion,):
+            if not isinstance(fact, Predicate):
+                state = refine(state, fact)
+        return [(node.next_node, state)]
+    elif isinstance(node, CondNode):
+        return [
+            (node.true_br, refine(state, node.condition)),
+            (node.false_br, refine(state, node.condition, False)),
+        ]
+    else:
+        assert isinstance(node, EndNode), f"unexpected node of type {type(node)}"
+        return []
+
+
+def analyze(cfg: CfgNode) -> dict[int, State]:
+    """
+    the states at the entry of the nodes of `cfg` (by id), every cycle of `cfg`
+    must go through an `AssertNode` (see `get_paths()`), that's where it's widened
+    """
+    nodes = get_nodes(cfg)
+    indices = {id(node): i for i, node in enumerate(nodes)}
+    states: dict[int, State] = {id(cfg): {}}
+    joins: dict[int, int] = defaultdict(int)
+    # nodes are visited in depth-first order so that loops stabilize inside out
+    pending = [0]
+    while pending:
+        node = nodes[heapq.heappop(pending)]
+        for successor, out in transfer(node, states[id(node)]):
+            if out is None:
+                continue
+            old = states.get(id(successor))
+            new = join(old, out)
+            if isinstance(successor, AssertNode) and old is not None:
+                joins[id(successor)] += 1
+                if joins[id(successor)] > WIDENING_DELAY:
+                    new = widen(old, new)
+            if new != old:
+                states[id(successor)] = new
+                if indices[id(successor)] not in pending:
+                    heapq.heappush(pending, indices[id(successor)])
+    # decreasing iterations recover some of the bounds that widening dropped,
+    # each one is still a sound over-approximation
+    for _ in range(NARROWING):
+        entries: dict[int, State] = {id(cfg): {}}
+        for node in nodes:
+            for successor, out in transfer(node, states.get(id(node))):
+                entries[id(successor)] = join(entries.get(id(successor)), out)
+        states = entries
+    return states
+
+
+def get_facts(state: State) -> tuple[Expr, ...]:
+    """
+    `state` as a conjunction, differences are only stated where they're tighter
+    than the bounds of their variables
+    """
+    if state is None:
+        return (BoolValue(False),)
+    facts: list[Expr] = []
+    for key in sorted(state, key=lambda k: (not isinstance(k, str), k)):
+        interval = state[key]
+        if isinstance(key, str):
+            var: Expr = Variable(key, INT)
+            if interval.lo is not None and interval.lo == interval.hi:
+                facts.append(RelExpr("==", var, IntValue(interval.lo)))
+                continue
+            if interval.lo is not None:
+                facts.append(RelExpr("<=", IntValue(interval.lo), var))
+            if interval.hi is not None:
+                facts.append(RelExpr("<=", var, IntValue(interval.hi)))
+            continue
+        x, y = Variable(key[0], INT), Variable(key[1], INT)
+        implied = get(state, key[0]) - get(state, key[1])
+        if interval.hi is not None and (implied.hi is None or interval.hi < implied.hi):
+            facts.append(RelExpr("<=", x, from_linear_form({y: 1}, interval.hi)))
+        if interval.lo is not None and (implied.lo is None or interval.lo > implied.lo):
+            facts.append(RelExpr(">=", x, from_linear_form({y: 1}, interval.lo)))
+    return tuple(facts)
+
+
+def seed_facts(cfg: CfgNode) -> int:
+    """
+    sets the `facts` of the `AssertNode`s of `cfg` to the bounds that hold there,
+    returns their number
+    """
+    states = analyze(cfg)
+    count = 0
+    for node in get_nodes(cfg):
+        if isinstance(node, AssertNode):
+            node.facts = get_facts(states.get(id(node)))
+            count += len(node.facts)
+    return count
@@ -1,22 +1,68 @@
 from __future__ import annotations
 
 import json
+import select
+import socket
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain
 import subprocess
 from html import escape
-from dataclasses import asdict
-from typing import Any, cast
+from dataclasses import asdict, replace
+from typing import Any, Iterator, Optional, cast
 import os
 
 import z3
 from flask import Flask, request
 
 from cast import AstRange
-from cfg import BasicPath
-from expr import And, Not
-from function import BaseFunction, Function, HornFunction, HornOk
+from cfg import BasicPath, PathBudgetExceeded, count_paths
+from expr import And, Expr
+from function import (
+    BaseFunction,
+    Budget,
+    CounterExample,
+    Function,
+    HornFunction,
+    HornOk,
+    Options,
+    PathCache,
+    PathReport,
+    Timeout,
+    z3_context,
+)
 from main import get_functions
+from warmstart import InvariantStore
 
 app = Flask(__name__)
+# the number of inputs counterexamples are looked for on before z3 is asked
+MODEL_SAMPLES = 256
+# functions with more paths are checked without listing their paths
+MAX_PATHS = 10_000
+# the seconds a request may take, the milliseconds z3 may spend on one of its
+# obligations and the megabytes of memory it may use on one
+REQUEST_TIMEOUT = 60.0
+OBLIGATION_TIMEOUT = 10_000
+MAX_MEMORY = 4_096
+# the options requests get unless they set lower ones, they can't raise them
+LIMITS = {
+    "max_paths": MAX_PATHS,
+    "request_timeout": REQUEST_TIMEOUT,
+    "timeout": OBLIGATION_TIMEOUT,
+    "max_memory": MAX_MEMORY,
+}
+# seconds between two looks at whether the client of a request is still there
+DISCONNECT_INTERVAL = 0.2
+# the invariants of the previous horn runs, edits are mostly checked against them
+INVARIANTS = InvariantStore()
+# requests are served on several threads but spacer runs in z3's global context
+HORN_LOCK = threading.Lock()
+# the path reports of the most recent editing sessions, so that re-verifying after
+# an edit only checks the paths it changed
+MAX_SESSIONS = 64
+SESSIONS: OrderedDict[str, PathCache] = OrderedDict()
+SESSIONS_LOCK = threading.Lock()
 app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 
 
@@ -59,21 +105,132 @@ def get_function(horn: bool) -> BaseFunction | dict[str, Any]:
 
 @app.route("/verify", methods=["POST"])
 def verify():
+    # requests are served on several threads, each needs a z3 context of its own
+    with z3_context() as ctx, request_budget() as budget:
+        return verify_in_context(ctx, budget)
+
+
+def is_disconnected(client: socket.socket) -> bool:
+    try:
+        readable, _, _ = select.select([client], [], [], 0)
+        # a closed connection is readable with nothing to read
+        return bool(readable) and not client.recv(1, socket.MSG_PEEK)
+    except (OSError, ValueError):
+        return True
+
+
+def get_limit(options: dict[str, Any], key: str) -> Any:
+    """
+    the limit `key` of a request (see `LIMITS`), values that aren't positive numbers
+    are ignored
+    """
+    value = options.get(key, None)
+    # bools are ints, nan isn't in any range
+    if type(value) in (int, float) and 0 < value < LIMITS[key]:
+        return value
+    return LIMITS[key]
+
+
+def get_options(options: dict[str, Any], ctx: Optional[z3.Context] = None) -> Options:
+    """
+    the options of a request within the limits of the server
+    """
+    limits = {key: get_limit(options, key) for key in LIMITS}
+    return Options.from_json({**options, **limits}, ctx)
+
+
+@contextmanager
+def request_budget(watch_client: bool = True) -> Iterator[Budget]:
+    """
+    the budget of the current request (see `REQUEST_TIMEOUT`), with `watch_client`
+    it's cancelled when the client disconnects
+    """
+    budget = Budget.of(get_limit(request.get_json(), "request_timeout"))
+    client = request.environ.get("werkzeug.socket")
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(DISCONNECT_INTERVAL):
+            if is_disconnected(client):
+                budget.cancel()
+                return
+
+    if watch_client and client is not None:
+        threading.Thread(target=watch, daemon=True).start()
+    try:
+        yield budget
+    finally:
+        done.set()
+
+
+def verify_in_context(ctx: z3.Context, time_budget: Budget):
     f = get_function(horn=False)
     if isinstance(f, dict):
         return f
     assert isinstance(f, Function)
 
+    options: dict[str, Any] = request.get_json()
+    sliced = bool(options.get("slice", False))
+    split = bool(options.get("split", False))
+    try:
+        vc_options = get_options(options, ctx)
+    except ValueError as e:
+        return dict(ok=False, err=str(e))
+    vc_options = replace(vc_options, budget=time_budget)
+    reports: list[PathReport] = []
+    # set when the paths go over the budgets of the options
+    budget: Optional[str] = None
+    verified: Optional[bool] = None
+    # the number of obligations z3 ran out of time or memory on
+    timeouts = 0
+    # the failing paths and the conjuncts of the proof rule of each that fail
+    paths: list[BasicPath]
+    conjuncts: list[list[Expr]]
     try:
-        paths = list(f.get_failing_paths())
+        if options.get("houdini", False):
+            f.infer_invariants(vc_options)
+        if split:
+            paths, conjuncts = [], []
+            for path, results in f.get_failing_conjuncts(options=vc_options):
+                timeouts += sum(isinstance(r, Timeout) for _, r in results)
+                failing = [c for c, r in results if not isinstance(r, Timeout)]
+                # paths whose conjuncts all timed out aren't known to fail
+                if failing:
+                    paths.append(path)
+                    conjuncts.append(failing)
+        elif sliced:
+            failing_paths = list(f.get_failing_path_results(sliced, vc_options))
+            timeouts = sum(isinstance(r, Timeout) for _, r in failing_paths)
+            paths = [p for p, r in failing_paths if not isinstance(r, Timeout)]
+            conjuncts = [[] for _ in paths]
+        else:
+            cache = get_session(str(options.get("session", "default")))
+            reports = f.get_path_reports(vc_options, cache)
+            timeouts = sum(report.timeout for report in reports)
+            paths = [r.path for r in reports if not r.valid and not r.timeout]
+            conjuncts = [[] for _ in paths]
+        slice_stats = f.get_slice_stats(vc_options) if sliced else []
+    except PathBudgetExceeded as e:
+        # there are too many paths to report on, the function is checked whole
+        budget = str(e)
+        result = f.check(vc_options)
+        verified, timeouts = result.is_ok(), int(isinstance(result, Timeout))
+        paths, conjuncts, slice_stats = [], [], []
     except Exception as e:
         return dict(ok=False, err=str(e))
-    models = []
-    for path in paths:
-        s = z3.Solver()
-        s.add(Not(path.get_proof_rule()).as_z3())
-        assert s.check().r == 1
-        models.append(s.model())
+    # models are looked for on sampled inputs in one batch, z3 is only asked for
+    # the paths none of the inputs violates
+    models = f.get_violations(paths, replace(vc_options, falsify=MODEL_SAMPLES))
+    for index, path in enumerate(paths):
+        if models[index] is not None:
+            continue
+        s = vc_options.limit(z3.Solver(ctx=vc_options.encoding.ctx))
+        s.add(z3.Not(vc_options.to_z3(path.get_proof_rule())))
+        # paths that failed because z3 gave up on them have no model
+        if vc_options.check(s) == z3.sat:
+            models[index] = CounterExample.from_z3(s.model()).model
+        else:
+            models[index] = {}
 
     paths_ = [
         {
@@ -82,29 +239,74 @@ def verify():
             if path.reachability
             else "True",
             "transformation": [
-                escape(f"{var} := {val}") for var, val in path.transformation.items()
-            ],
-            "model": [
-                escape(f"{var.name()} := {model.get_interp(var)}")
-                for var in model.decls()
+                escape(f"{var} := {val}")
+                for var, val in chain(path.definitions, path.transformation.items())
             ],
+            "model": [escape(f"{var} := {value}") for var, value in model.items()],
             "ranges": [asdict(r) for r in get_ranges(path)],
             "prop": escape(str(path.get_proof_rule())),
+            "conjuncts": [escape(str(c)) for c in failing_conjuncts],
         }
-        for index, (path, model) in enumerate(zip(paths, models))
+        for index, (path, model, failing_conjuncts) in enumerate(
+            zip(paths, models, conjuncts)
+        )
     ]
 
-    return {"ok": True, "body": paths_, "verified": not paths_}
+    return {
+        "ok": True,
+        "body": paths_,
+        "verified": (not paths_ and not timeouts) if verified is None else verified,
+        "timeouts": timeouts,
+        "budget": budget,
+        "path_count": count_paths(f.cfg),
+        "float_mode": vc_options.encoding.float_mode,
+        "int_mode": vc_options.encoding.int_mode,
+        "slicing": [asdict(s) for s in slice_stats],
+        "paths": [
+            {
+                "logic": report.logic,
+                "time": report.time,
+                "valid": report.valid,
+                "reused": report.reused,
+                "timeout": report.timeout,
+            }
+            for report in reports
+        ],
+        "reused": sum(report.reused for report in reports),
+    }
+
+
+def get_session(session: str) -> PathCache:
+    with SESSIONS_LOCK:
+        cache = SESSIONS.pop(session, None) or PathCache()
+        SESSIONS[session] = cache
+        while len(SESSIONS) > MAX_SESSIONS:
+            SESSIONS.popitem(last=False)
+        return cache
 
 
 @app.route("/horn", methods=["POST"])
 def horn():
+    with HORN_LOCK:
+        return horn_in_global_context()
+
+
+def horn_in_global_context():
+    try:
+        options = get_options(request.get_json())
+    except ValueError as e:
+        return dict(ok=False, err=str(e))
     f = get_function(horn=True)
     if isinstance(f, dict):
         return f
     assert isinstance(f, HornFunction)
 
-    result = f.check()
+    # spacer starts from the bounds abstract interpretation finds
+    if request.get_json().get("absint", True):
+        f.seed_invariants()
+    # spacer runs in z3's global context, which a disconnect can't interrupt alone
+    with request_budget(watch_client=False) as budget:
+        result = INVARIANTS.check(f, replace(options, budget=budget))
     if isinstance(result, HornOk):
 
         ranges = [cast(AstRange, cp.code_location) for cp in f.cutpoints]
@@ -122,4 +324,4 @@ def horn():
 
         return dict(ok=True, verified=True, invariants=invariants)
     else:
-        return dict(ok=True, verified=False)
+        return dict(ok=True, verified=False, timeout=isinstance(result, Timeout))
@@ -0,0 +1,416 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+import numpy as np
+
+from cfg import BasicPath
+from expr import (
+    And,
+    ArraySelect,
+    ArrayStore,
+    ArrayType,
+    AsInt,
+    AsReal,
+    AtomicType,
+    BinaryExpr,
+    BOOL,
+    BoolValue,
+    BV_WIDTH,
+    DEFAULT_ENCODING,
+    Encoding,
+    Exists,
+    Expr,
+    ForAllRange,
+    IfThenElse,
+    INT,
+    IntValue,
+    Let,
+    Not,
+    Or,
+    Prop,
+    RealValue,
+    RelExpr,
+    Then,
+    Type,
+    UnaryExpr,
+    Variable,
+)
+from interp import MAX_RANGE, SMALL
+
+# ints of the int encoding are tracked while they fit in this bound, so that the
+# products of two of them still fit in an int64
+BOUND = 2 ** 31
+# the indices of the cells that arrays hold explicitly
+WINDOW = np.arange(-1, SMALL)
+
+
+@dataclass(frozen=True)
+class ArrayColumn:
+    """
+    a batch of arrays, `cells[:, j]` holds index `WINDOW[j]` and every other index
+    holds `default`
+    """
+
+    default: np.ndarray
+    cells: np.ndarray
+
+    def select(self, index: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        in_window = (index >= WINDOW[0]) & (index <= WINDOW[-1])
+        column = np.where(in_window, index - WINDOW[0], 0)
+        cells = self.cells[np.arange(len(index)), column]
+        return np.where(in_window, cells, self.default), np.ones(len(index), bool)
+
+    def store(
+        self, index: np.ndarray, value: np.ndarray
+    ) -> tuple[ArrayColumn, np.ndarray]:
+        # stores outside of the window can't be represented
+        in_window = (index >= WINDOW[0]) & (index <= WINDOW[-1])
+        cells = self.cells.copy()
+        lanes = np.flatnonzero(in_window)
+        cells[lanes, index[lanes] - WINDOW[0]] = value[lanes]
+        return ArrayColumn(self.default, cells), in_window
+
+    def equals(self, other: ArrayColumn) -> np.ndarray:
+        return eq(self.default, other.default) & eq(self.cells, other.cells).all(1)
+
+    def __getitem__(self, lane: int) -> str:
+        values = ", ".join(f"{i}: {v}" for i, v in zip(WINDOW, self.cells[lane]))
+        return f"[{values}, else: {self.default[lane]}]"
+
+
+Column = Union[np.ndarray, ArrayColumn]
+Columns = dict[str, Column]
+
+
+def eq(lhs: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    # `==` on floats is SMT-LIB's `=`: NaN equals itself and the zeros differ
+    if lhs.dtype != np.float64:
+        return lhs == rhs
+    same = (lhs == rhs) & (np.signbit(lhs) == np.signbit(rhs))
+    return same | (np.isnan(lhs) & np.isnan(rhs))
+
+
+def wrap(value: Any) -> Any:
+    return (value + 2 ** (BV_WIDTH - 1)) % 2 ** BV_WIDTH - 2 ** (BV_WIDTH - 1)
+
+
+def type_of(expr: Expr) -> Type:
+    # propositions don't implement `get_type()`
+    return BOOL if isinstance(expr, Prop) else expr.get_type()
+
+
+def unknown(type_: Type, n: int) -> tuple[Column, np.ndarray]:
+    """
+    placeholder values of `type_` that are known nowhere
+    """
+    if isinstance(type_, ArrayType):
+        default = unknown(type_.element_type, n)[0]
+        cells = np.zeros((n, len(WINDOW)), default.dtype)
+        return ArrayColumn(default, cells), np.zeros(n, bool)
+    dtype = {"bool": bool, "int": np.int64, "float": np.float64}[str(type_)]
+    return np.zeros(n, dtype), np.zeros(n, bool)
+
+
+def sample_columns(
+    vars: list[Variable],
+    n: int,
+    encoding: Encoding = DEFAULT_ENCODING,
+    seed: int = 0,
+) -> Columns:
+    """
+    `n` random values of each of `vars`, with the same bias as `interp.sample()`
+    real floats have no vectorized form, they're left unsampled (unknown)
+    """
+    rng = np.random.default_rng(seed)
+
+    def sample(type_: Type, shape: tuple[int, ...]) -> Optional[np.ndarray]:
+        assert isinstance(type_, AtomicType)
+        if type_.name == "bool":
+            return rng.random(shape) < 0.5
+        elif type_.name == "int":
+            bound = 2 ** (BV_WIDTH - 1)
+            edges = rng.choice([-bound, bound - 1], shape)
+            large = np.where(
+                rng.random(shape) < 0.5, edges, rng.integers(-bound, bound, shape)
+            )
+            small = rng.integers(-SMALL, SMALL + 1, shape)
+            return np.where(rng.random(shape) < 0.9, small, large).astype(np.int64)
+        elif encoding.float_mode == "real":
+            return None
+        specials = np.array([0.0, -0.0, np.inf, -np.inf, np.nan, 1e308, 5e-324])
+        small = rng.integers(-4 * SMALL, 4 * SMALL + 1, shape) / rng.choice(
+            [1, 2, 4], shape
+        )
+        return np.where(
+            rng.random(shape) < 0.9, small, rng.choice(specials, shape)
+        ).astype(np.float64)
+
+    columns: Columns = {}
+    for var in vars:
+        if isinstance(var.type_, ArrayType):
+            default = sample(var.type_.element_type, (n,))
+            cells = sample(var.type_.element_type, (n, len(WINDOW)))
+            if default is not None and cells is not None:
+                columns[var.var] = ArrayColumn(default, cells)
+        else:
+            column = sample(var.type_, (n,))
+            if column is not None:
+                columns[var.var] = column
+    return columns
+
+
+def evaluate(
+    expr: Expr, columns: Columns, n: int, encoding: Encoding = DEFAULT_ENCODING
+) -> tuple[Any, np.ndarray]:
+    """
+    evaluates `expr` on `n` states at once, returns its values and a mask of the
+    states in which the value is known
+    values are unknown where z3 leaves them unspecified (e.g. division by zero),
+    where they can't be represented and where they depend on unsampled variables
+    values follow `encoding` like `interp.compile_expr()`
+    """
+    bv = encoding.int_mode == "bv32"
+    real = encoding.float_mode == "real"
+
+    def ev(e: Expr, cols: Columns = columns) -> tuple[Any, np.ndarray]:
+        return evaluate(e, cols, n, encoding)
+
+    def track(value: np.ndarray, known: np.ndarray) -> tuple[Any, np.ndarray]:
+        if bv:
+            return wrap(value), known
+        # ints that outgrow the bound are dropped, they could overflow later on
+        fits = np.abs(value) <= BOUND
+        return np.where(fits, value, 0), known & fits
+
+    if isinstance(expr, IntValue):
+        number = wrap(expr.number) if bv else expr.number
+        if abs(number) > BOUND:
+            return unknown(INT, n)
+        return np.full(n, number, np.int64), np.ones(n, bool)
+    elif isinstance(expr, RealValue):
+        if real:
+            return unknown(type_of(expr), n)
+        return np.full(n, expr.number, np.float64), np.ones(n, bool)
+    elif isinstance(expr, BoolValue):
+        return np.full(n, expr.value), np.ones(n, bool)
+    elif isinstance(expr, Variable):
+        if expr.var not in columns:
+            return unknown(expr.type_, n)
+        return columns[expr.var], np.ones(n, bool)
+    elif isinstance(expr, Not):
+        value, known = ev(expr.operand)
+        return ~value, known
+    elif isinstance(expr, (And, Or, Then)):
+        args = expr.args if isinstance(expr, (And, Or)) else (expr.if_, expr.then)
+        results = [ev(a) for a in args]
+        if isinstance(expr, Then):
+            (if_, if_known), (then, then_known) = results
+            # `if_ → then` is `¬if_ ∨ then`
+            results = [(~if_, if_known), (then, then_known)]
+        if isinstance(expr, And):
+            return conjunction(results, n)
+        negated = conjunction([(~v, k) for v, k in results], n)
+        return ~negated[0], negated[1]
+    elif isinstance(expr, IfThenElse):
+        cond, cond_known = ev(expr.condition)
+        (true, true_known), (false, false_known) = (
+            ev(expr.value_true),
+            ev(expr.value_false),
+        )
+        known = cond_known & np.where(cond, true_known, false_known)
+        if isinstance(true, ArrayColumn):
+            return (
+                ArrayColumn(
+                    np.where(cond, true.default, false.default),
+                    np.where(cond[:, None], true.cells, false.cells),
+                ),
+                known,
+            )
+        return np.where(cond, true, false), known
+    elif isinstance(expr, RelExpr):
+        (lhs, lhs_known), (rhs, rhs_known) = ev(expr.lhs), ev(expr.rhs)
+        known = lhs_known & rhs_known
+        if isinstance(lhs, ArrayColumn):
+            assert expr.operator in ("==", "!=")
+            same = lhs.equals(rhs)
+        elif expr.operator in ("==", "!="):
+            same = eq(lhs, rhs)
+        else:
+            with np.errstate(invalid="ignore"):
+                return RelExpr.SYM2OPERATOR[expr.operator](lhs, rhs), known
+        return (same if expr.operator == "==" else ~same), known
+    elif isinstance(expr, UnaryExpr):
+        value, known = ev(expr.operand)
+        if expr.operator == "+":
+            return value, known
+        if expr.get_type() != INT:
+            return -value, known
+        assert bv or expr.operator != "~", "~ requires bv32 ints"
+        return track(UnaryExpr.SYM2OPERATOR[expr.operator](value), known)
+    elif isinstance(expr, BinaryExpr):
+        (lhs, lhs_known), (rhs, rhs_known) = ev(expr.lhs), ev(expr.rhs)
+        known = lhs_known & rhs_known
+        if expr.get_type() != INT:
+            if expr.operator == "%":
+                # IEEE's remainder has no vectorized counterpart
+                return unknown(type_of(expr), n)
+            with np.errstate(all="ignore"):
+                return BinaryExpr.SYM2OPERATOR[expr.operator](lhs, rhs), known
+        value, valid = binary_int(expr.operator, lhs, rhs, bv)
+        return track(value, known & valid)
+    elif isinstance(expr, AsInt):
+        value, known = ev(expr.expr)
+        if real:
+            return unknown(type_of(expr), n)
+        finite = np.isfinite(value) & (np.abs(value) < BOUND)
+        truncated = np.trunc(np.where(finite, value, 0)).astype(np.int64)
+        return track(truncated, known & finite)
+    elif isinstance(expr, AsReal):
+        value, known = ev(expr.expr)
+        if real:
+            return unknown(type_of(expr), n)
+        return value.astype(np.float64), known
+    elif isinstance(expr, ArraySelect):
+        (array, array_known), (index, index_known) = ev(expr.array), ev(expr.index)
+        value, known = array.select(index)
+        return value, array_known & index_known & known
+    elif isinstance(expr, ArrayStore):
+        (array, array_known), (index, index_known) = ev(expr.array), ev(expr.index)
+        value, value_known = ev(expr.value)
+        stored, known = array.store(index, value)
+        return stored, array_known & index_known & value_known & known
+    elif isinstance(expr, Let):
+        cols, known = dict(columns), np.ones(n, bool)
+        for var, value in expr.bindings:
+            cols[var.var], value_known = ev(value, cols)
+            # a binding is only unknown where it's used, but that's rarely useful
+            known &= value_known
+        value, body_known = ev(expr.body, cols)
+        return value, known & body_known
+    elif isinstance(expr, ForAllRange) or (
+        isinstance(expr, Exists) and not isinstance(expr.domain, Type)
+    ):
+        domain = expr.range if isinstance(expr, ForAllRange) else expr.domain
+        assert isinstance(domain, tuple)
+        (lo, lo_known), (hi, hi_known) = ev(domain[0]), ev(domain[1])
+        # states with larger ranges are left unknown, empty ranges need no iteration
+        known = lo_known & hi_known & (hi - lo <= MAX_RANGE)
+        iterated = known & (lo < hi)
+        start, end = 0, 0
+        if iterated.any():
+            start, end = lo[iterated].min(), hi[iterated].max()
+        if end - start > MAX_RANGE:
+            return unknown(type_of(expr), n)
+        cols = dict(columns)
+        results = []
+        for i in range(start, end):
+            cols[expr.var.var] = np.full(n, i, np.int64)
+            value, value_known = ev(expr.prop, cols)
+            in_range = (lo <= i) & (i < hi)
+            if isinstance(expr, Exists):
+                value = ~value
+            results.append((value | ~in_range, value_known | ~in_range))
+        value, value_known = conjunction(results, n)
+        if isinstance(expr, Exists):
+            value = ~value
+        return value, known & value_known
+    else:
+        # unbounded quantifiers and horn predicates
+        return unknown(type_of(expr), n)
+
+
+def conjunction(
+    results: list[tuple[np.ndarray, np.ndarray]], n: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # a conjunction is known where all of its arguments are or one is known false
+    value, all_known, false = np.ones(n, bool), np.ones(n, bool), np.zeros(n, bool)
+    for v, known in results:
+        value &= v
+        all_known &= known
+        false |= known & ~v
+    return value & ~false, all_known | false
+
+
+def binary_int(
+    operator: str, lhs: np.ndarray, rhs: np.ndarray, bv: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    the (unwrapped) value of an int operation and where it's defined
+    """
+    defined = np.ones(len(lhs), bool)
+    if operator in "/%":
+        # division by zero is unspecified
+        defined = rhs != 0
+        divisor = np.where(defined, rhs, 1)
+        if bv:
+            # `bvsdiv` truncates towards zero, `bvsrem` takes the dividend's sign
+            quotient = np.sign(lhs) * np.sign(divisor) * (abs(lhs) // abs(divisor))
+            remainder = np.sign(lhs) * (abs(lhs) % abs(divisor))
+        else:
+            quotient = np.where(divisor > 0, lhs // divisor, -(lhs // -divisor))
+            remainder = lhs - divisor * quotient
+        return quotient if operator == "/" else remainder, defined
+    assert bv or operator in "+-*", f"{operator} requires bv32 ints"
+    if operator in ("<<", ">>"):
+        # the amount is unsigned, large amounts shift every bit out
+        amount = rhs % 2 ** BV_WIDTH
+        if operator == ">>":
+            return lhs >> np.minimum(amount, BV_WIDTH), defined
+        shifted = wrap(lhs << np.minimum(amount, BV_WIDTH - 1))
+        return np.where(amount < BV_WIDTH, shifted, 0), defined
+    return BinaryExpr.SYM2OPERATOR[operator](lhs, rhs), defined
+
+
+def violations(
+    prop: Expr, columns: Columns, n: int, encoding: Encoding = DEFAULT_ENCODING
+) -> np.ndarray:
+    """
+    the states in which `prop` is known to be false
+    """
+    value, known = evaluate(prop, columns, n, encoding)
+    return known & ~value
+
+
+def reachable(
+    path: BasicPath, columns: Columns, n: int, encoding: Encoding = DEFAULT_ENCODING
+) -> np.ndarray:
+    """
+    the states from which `path` is known to be taken
+    """
+    condition: Expr = And(tuple(path.reachability))
+    if path.definitions:
+        condition = Let(path.definitions, condition)
+    value, known = evaluate(condition, columns, n, encoding)
+    return known & value
+
+
+def find_violations(
+    paths: list[BasicPath],
+    vars: list[Variable],
+    samples: int,
+    encoding: Encoding = DEFAULT_ENCODING,
+    seed: int = 0,
+) -> list[Optional[dict[str, str]]]:
+    """
+    evaluates the proof rule of each of `paths` on the same `samples` random
+    values of `vars`, the proof rules of paths none of them takes aren't evaluated
+    returns, for each path, the values of a state that violates its proof rule if
+    any
+    """
+    columns = sample_columns(vars, samples, encoding, seed)
+    models: list[Optional[dict[str, str]]] = []
+    for path in paths:
+        taken = reachable(path, columns, samples, encoding)
+        if not taken.any():
+            models.append(None)
+            continue
+        prop = path.get_proof_rule()
+        lanes = np.flatnonzero(taken & violations(prop, columns, samples, encoding))
+        if len(lanes) == 0:
+            models.append(None)
+        else:
+            models.append(
+                {var: str(column[lanes[0]]) for var, column in columns.items()}
+            )
+    return models
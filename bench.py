@@ -0,0 +1,240 @@
+from __future__ import annotations
+import argparse
+import pickle
+import time
+from typing import Any, Callable
+
+import z3
+
+import ir
+import main
+from cfg import count_paths, get_paths
+from expr import Encoding
+from function import Options
+from strategy import StrategyStore, check_paths
+from warmstart import InvariantStore
+
+
+def timed(fn: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_hoisting(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f = fns[name]
+        plain, plain_result = timed(lambda: len(list(f.get_failing_paths())))
+        hoisted, hoisted_result = timed(
+            lambda: len(list(f.get_failing_paths_hoisted()))
+        )
+        assert plain_result == hoisted_result
+        print(
+            f"{name}: plain {plain:.3f}s, hoisted {hoisted:.3f}s "
+            f"(x{plain / hoisted:.2f}), failing paths: {plain_result}"
+        )
+
+
+def bench_logic(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    generic, specialized = Options(), Options(select_logic=True)
+    for name in names or list(fns):
+        f = fns[name]
+        plain = f.get_path_reports(generic)
+        selected = f.get_path_reports(specialized)
+        assert [r.valid for r in plain] == [r.valid for r in selected]
+        times: dict[str, tuple[float, float]] = {}
+        for before, after in zip(plain, selected):
+            total_before, total_after = times.get(after.logic, (0.0, 0.0))
+            times[after.logic] = (total_before + before.time, total_after + after.time)
+        for logic, (before, after) in sorted(times.items()):
+            print(f"{name} [{logic}]: generic {before:.3f}s, specialized {after:.3f}s")
+
+
+def bench_floats(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f = fns[name]
+        times = []
+        for float_mode in ("fp", "real"):
+            options = Options(encoding=Encoding(float_mode=float_mode))
+            times.append(timed(lambda: f.check(options).is_ok()))
+        (fp, fp_ok), (real, real_ok) = times
+        print(f"{name}: fp {fp:.3f}s ({fp_ok}), real {real:.3f}s ({real_ok})")
+
+
+def bench_bitvectors(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    bv = Options(encoding=Encoding(int_mode="bv32"), select_logic=True)
+    for name in names or list(fns):
+        f = fns[name]
+        unbounded, unbounded_result = timed(lambda: f.check())
+        bounded, bounded_result = timed(lambda: f.check(bv))
+        print(
+            f"{name}: int {unbounded:.3f}s ({unbounded_result}), "
+            f"bv32 {bounded:.3f}s ({bounded_result})"
+        )
+
+
+def bench_ir(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f = fns[name]
+        paths = list(get_paths(f.cfg))
+        encoded, data = timed(lambda: ir.dumps(paths))
+        decoded, _ = timed(lambda: ir.loads(data))
+        print(
+            f"{name}: {len(paths)} paths, ir {len(data)}B "
+            f"(encode {encoded:.4f}s, decode {decoded:.4f}s), "
+            f"pickle {len(pickle.dumps(paths))}B"
+        )
+
+
+def bench_falsify(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    falsify = Options(falsify=1000)
+    for name in names or list(fns):
+        f = fns[name]
+        solver, solver_result = timed(lambda: f.check())
+        concrete, concrete_result = timed(lambda: f.check(falsify))
+        print(
+            f"{name}: z3 {solver:.4f}s ({solver_result.is_ok()}), "
+            f"falsify+z3 {concrete:.4f}s ({type(concrete_result).__name__})"
+        )
+
+
+def bench_batch(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    batch = Options(falsify=1000)
+    for name in names or list(fns):
+        f = fns[name]
+        paths = list(get_paths(f.cfg))
+        evaluated, models = timed(lambda: f.get_violations(paths, batch))
+        flagged = sum(model is not None for model in models)
+        solved, failing = timed(lambda: len(list(f.get_failing_paths())))
+        print(
+            f"{name}: {len(paths)} paths, batch {evaluated:.4f}s "
+            f"({flagged} flagged), z3 {solved:.4f}s ({failing} failing)"
+        )
+
+
+def bench_bmc(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f = fns[name]
+        elapsed, result = timed(lambda: f.check_bmc(50))
+        print(f"{name}: bmc {elapsed:.3f}s ({result})")
+
+
+def bench_kinduction(filename: str, names: list[str]):
+    # meant for the `horn_*` benchmarks, spacer infers the invariants there
+    fns = main.compile_functions(filename, horn=True)
+    for name in names or list(fns):
+        f = fns[name]
+        horn_time, horn_result = timed(f.check)
+        k_time, k_result = timed(lambda: f.check_kinduction(10))
+        print(
+            f"{name}: horn {horn_time:.3f}s ({horn_result}),"
+            f" k-induction {k_time:.3f}s ({k_result})"
+        )
+
+
+def bench_absint(filename: str, names: list[str]):
+    # the CFGs are compiled twice, seeding changes their cut points
+    plain = main.compile_functions(filename, horn=True)
+    seeded = main.compile_functions(filename, horn=True)
+    for name in names or list(plain):
+        f, g = plain[name], seeded[name]
+        elapsed, result = timed(f.check)
+        seed_time, count = timed(g.seed_invariants)
+        seeded_time, seeded_result = timed(g.check)
+        saved = elapsed - seed_time - seeded_time
+        print(
+            f"{name}: horn {elapsed:.3f}s ({type(result).__name__}), "
+            f"absint {seed_time:.3f}s ({count} facts) + horn {seeded_time:.3f}s "
+            f"({type(seeded_result).__name__}), saved {saved:.3f}s"
+        )
+
+
+def bench_houdini(filename: str, names: list[str]):
+    # meant for the `horn_*` benchmarks, their loops have no invariants
+    horn = main.compile_functions(filename, horn=True)
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f, g = fns[name], horn[name]
+        infer_time, nodes = timed(f.infer_invariants)
+        check_time, result = timed(f.check)
+        horn_time, horn_result = timed(g.check)
+        print(
+            f"{name}: houdini {infer_time:.3f}s ({len(nodes)} cut points) + check "
+            f"{check_time:.3f}s ({result}), horn {horn_time:.3f}s ({horn_result})"
+        )
+
+
+def bench_warmstart(filename: str, names: list[str]):
+    # each run gets a fresh CFG, as after an edit in the editor
+    store = InvariantStore()
+    for name in names or list(main.compile_functions(filename, horn=True)):
+        for run in ("cold", "warm"):
+            f = main.compile_functions(filename, horn=True)[name]
+            elapsed, result = timed(lambda: store.check(f))
+            print(f"{name}: {run} {elapsed:.3f}s ({type(result).__name__})")
+
+
+def bench_merged(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    for name in names or list(fns):
+        f = fns[name]
+        paths_time, paths_result = timed(f.check)
+        merged_time, merged_result = timed(lambda: f.check(Options(merge=True)))
+        assert paths_result.is_ok() == merged_result.is_ok()
+        print(
+            f"{name}: {count_paths(f.cfg)} paths {paths_time:.3f}s,"
+            f" merged {merged_time:.3f}s ({merged_result})"
+        )
+
+
+def bench_strategy(filename: str, names: list[str]):
+    fns = main.compile_functions(filename)
+    store = StrategyStore()
+    for name in names or list(fns):
+        f = fns[name]
+        monolithic, _ = timed(f.check)
+        paths, _ = timed(lambda: check_paths(f, Options()))
+        cold, (first, _) = timed(lambda: store.check(f))
+        warm, (then, result) = timed(lambda: store.check(f))
+        print(
+            f"{name}: monolithic {monolithic:.3f}s, paths {paths:.3f}s,"
+            f" auto ({first}) {cold:.3f}s, then ({then}) {warm:.3f}s ({result})"
+        )
+
+
+BENCHMARKS: dict[str, Callable[[str, list[str]], None]] = {
+    "hoisting": bench_hoisting,
+    "logic": bench_logic,
+    "floats": bench_floats,
+    "bitvectors": bench_bitvectors,
+    "ir": bench_ir,
+    "falsify": bench_falsify,
+    "batch": bench_batch,
+    "bmc": bench_bmc,
+    "kinduction": bench_kinduction,
+    "absint": bench_absint,
+    "houdini": bench_houdini,
+    "warmstart": bench_warmstart,
+    "merged": bench_merged,
+    "strategy": bench_strategy,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("filename")
+    parser.add_argument("functions", nargs="*")
+    parser.add_argument("--timeout", type=int, help="z3 timeout in milliseconds")
+    args = parser.parse_args()
+    if args.timeout is not None:
+        z3.set_param("timeout", args.timeout)
+    BENCHMARKS[args.benchmark](args.filename, args.functions)
@@ -0,0 +1,32 @@
+#include "common.h"
+
+int count_to(int n) {
+    requires(n >= 0 && n <= 3);
+    ensures(ret == n);
+    int i = 0;
+    while (i != n) {
+        i++;
+    }
+    return i;
+}
+
+int count_to_bug(int n) {
+    requires(n >= 0 && n <= 3);
+    ensures(ret == n);
+    int i = 0;
+    while (i < n) {
+        i += 2;
+    }
+    return i;
+}
+
+int count_up(int n) {
+    requires(n >= 0);
+    ensures(ret == n);
+    int i = 0;
+    while (i != n) {
+        i++;
+        assert(0 <= i && i <= n);
+    }
+    return i;
+}
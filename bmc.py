@@ -0,0 +1,194 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Union
+
+import z3
+
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    CfgNode,
+    CondNode,
+    EndNode,
+    StartNode,
+    get_nodes,
+    get_successors,
+)
+from expr import (
+    And,
+    DEFAULT_ENCODING,
+    Encoding,
+    Expr,
+    INT,
+    IfThenElse,
+    IntValue,
+    Not,
+    Or,
+    RelExpr,
+    Variable,
+)
+
+if TYPE_CHECKING:
+    from function import Options, Unknown
+
+
+@dataclass(frozen=True)
+class TransitionSystem:
+    """
+    a CFG as a transition system whose state is the program counter (the index of
+    a node in `nodes`) and the values of `vars`
+    unrolling it doesn't need loop invariants, states of step `i` are the
+    variables `x@i`
+    """
+
+    nodes: list[CfgNode]
+    vars: list[Variable]
+    # the index of each node by its id
+    indices: dict[int, int]
+
+    @staticmethod
+    def from_cfg(cfg: CfgNode, vars: list[Variable]) -> TransitionSystem:
+        nodes = get_nodes(cfg)
+        return TransitionSystem(nodes, vars, {id(n): i for i, n in enumerate(nodes)})
+
+    def pc(self, step: int) -> Variable:
+        return Variable(f"@pc@{step}", INT)
+
+    def state(self, step: int) -> dict[str, Expr]:
+        return {var.var: Variable(f"{var.var}@{step}", var.type_) for var in self.vars}
+
+    def get_index(self, node: CfgNode) -> int:
+        return self.indices[id(node)]
+
+    def initial(self) -> Expr:
+        start = self.nodes[0]
+        assert isinstance(start, StartNode)
+        pc = RelExpr("==", self.pc(0), IntValue(0))
+        if start.requires is None:
+            return pc
+        return And((pc, start.requires.assign(self.state(0))))
+
+    def successors(self, indices: set[int]) -> set[int]:
+        return {
+            self.get_index(successor)
+            for index in indices
+            for successor in get_successors(self.nodes[index])
+        }
+
+    def transition(self, step: int, frontier: set[int]) -> Expr:
+        """
+        the transition from step `step` to step `step + 1`, end nodes have none
+        `frontier` holds the nodes the program counter may be at on step `step`
+        """
+        current, next_ = self.state(step), self.state(step + 1)
+        transitions: list[Expr] = []
+        for index in sorted(frontier):
+            node = self.nodes[index]
+            guards: list[Expr] = [RelExpr("==", self.pc(step), IntValue(index))]
+            updates: dict[str, Expr] = {}
+            if isinstance(node, CondNode):
+                target: Expr = IfThenElse(
+                    node.condition.assign(current),
+                    IntValue(self.get_index(node.true_br)),
+                    IntValue(self.get_index(node.false_br)),
+                )
+            elif isinstance(node, EndNode):
+                continue
+            else:
+                assert isinstance(
+                    node, (StartNode, AssignmentNode, AssumeNode, AssertNode)
+                )
+                target = IntValue(self.get_index(node.next_node))
+            if isinstance(node, AssignmentNode):
+                updates[node.var.var] = node.expression.assign(current)
+            elif isinstance(node, AssumeNode):
+                guards.append(node.expression.assign(current))
+            transitions.append(
+                And(
+                    tuple(guards)
+                    + (RelExpr("==", self.pc(step + 1), target),)
+                    + tuple(
+                        RelExpr("==", next_[var], updates.get(var, current[var]))
+                        for var in current
+                    )
+                )
+            )
+        return Or(tuple(transitions))
+
+    def violation(self, step: int, frontier: set[int]) -> Expr:
+        """
+        an assertion fails at step `step`
+        """
+        violations: list[Expr] = []
+        for index in sorted(frontier):
+            node = self.nodes[index]
+            if isinstance(node, AssertNode):
+                assertion: Optional[Expr] = node.get_assertion()
+            elif isinstance(node, EndNode):
+                assertion = node.assertion
+            else:
+                continue
+            if assertion is not None:
+                violations.append(
+                    And(
+                        (
+                            RelExpr("==", self.pc(step), IntValue(index)),
+                            Not(assertion.assign(self.state(step))),
+                        )
+                    )
+                )
+        return Or(tuple(violations))
+
+    def get_trace(
+        self, model: z3.ModelRef, depth: int, encoding: Encoding = DEFAULT_ENCODING
+    ) -> list[tuple[CfgNode, dict[str, str]]]:
+        """
+        the nodes and values of the steps of the execution described by `model`
+        """
+        trace = []
+        for step in range(depth + 1):
+            pc = model.eval(self.pc(step).as_z3(encoding), model_completion=True)
+            node = self.nodes[pc.as_signed_long() if z3.is_bv(pc) else pc.as_long()]
+            values = {
+                var: str(model.eval(value.as_z3(encoding), model_completion=True))
+                for var, value in self.state(step).items()
+            }
+            trace.append((node, values))
+        return trace
+
+
+def bmc(
+    system: TransitionSystem, max_depth: int, options: Options
+) -> tuple[Union[z3.CheckSatResult, Unknown, None], int, Optional[z3.ModelRef]]:
+    """
+    looks for an execution of at most `max_depth` steps that fails an assertion,
+    the unrolling is deepened one step at a time on a single incremental solver
+    whose queries get the limits of `options`
+    returns:
+    - `sat`, the depth and a model of the execution if one was found
+    - `unsat` and the depth at which every execution had ended if there's none
+    - `Unknown` (see `Options.get_unknown()`) and the depth at which z3 gave up
+    - `None` and `max_depth` if there may be longer failing executions
+    """
+    encoding = options.encoding
+    solver = z3.Solver(ctx=encoding.ctx)
+    solver.add(system.initial().as_z3(encoding))
+    # the nodes that are reachable in exactly `depth` steps of the CFG, the
+    # formulas of a step only mention these
+    frontier = {0}
+    for depth in range(max_depth + 1):
+        solver.push()
+        solver.add(system.violation(depth, frontier).as_z3(encoding))
+        result = options.check(options.limit(solver))
+        if result == z3.sat:
+            return result, depth, solver.model()
+        elif result == z3.unknown:
+            return options.get_unknown(solver), depth, None
+        solver.pop()
+        solver.add(system.transition(depth, frontier).as_z3(encoding))
+        frontier = system.successors(frontier)
+        # no execution is longer than this depth, all of them were checked
+        if not frontier or options.check(options.limit(solver)) == z3.unsat:
+            return z3.unsat, depth, None
+    return None, max_depth, None
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import hashlib
 from itertools import chain
 from typing import Iterator, Optional, cast
 from dataclasses import dataclass
@@ -17,7 +18,10 @@ from expr import (
     Environment,
     Expr,
     IntValue,
+    Let,
+    RealValue,
     RelExpr,
+    Type,
     Variable,
     Then,
     Not,
@@ -25,6 +29,20 @@ from expr import (
 )
 
 
+@dataclass(frozen=True)
+class SliceStats:
+    conjuncts_before: int
+    conjuncts_after: int
+    size_before: int
+    size_after: int
+
+    def __str__(self) -> str:
+        return (
+            f"conjuncts: {self.conjuncts_before} -> {self.conjuncts_after}, "
+            f"size: {self.size_before} -> {self.size_after}"
+        )
+
+
 @dataclass(frozen=True)
 class BasicPath:
     reachability: list[Expr]
@@ -32,10 +50,18 @@ class BasicPath:
     assertion_start: Optional[Expr]
     assertion_end: Optional[Expr]
     nodes: list[CfgNode]
+    # facts introduced by `remember()` that are in scope at the ends of the path
+    # `remembers_end` is kept untransformed (see `get_assertion_end()`)
+    remembers_start: tuple[Expr, ...] = ()
+    remembers_end: tuple[Expr, ...] = ()
+    # when `lazy` is set assigned values aren't substituted into the transformation,
+    # instead they're bound to fresh (SSA) variables in `definitions`
+    lazy: bool = False
+    definitions: tuple[tuple[Variable, Expr], ...] = ()
 
     @staticmethod
-    def empty() -> BasicPath:
-        return BasicPath([], {}, None, None, [])
+    def empty(lazy: bool = False) -> BasicPath:
+        return BasicPath([], {}, None, None, [], lazy=lazy)
 
     def copy(self) -> BasicPath:
         return BasicPath(
@@ -44,6 +70,10 @@ class BasicPath:
             self.assertion_start,
             self.assertion_end,
             self.nodes.copy(),
+            self.remembers_start,
+            self.remembers_end,
+            self.lazy,
+            self.definitions,
         )
 
     def condition(self, cond: Expr) -> BasicPath:
@@ -51,36 +81,181 @@ class BasicPath:
         cp.reachability.append(cond.assign(self.transformation))
         return cp
 
-    def transform(self, var: str, expr: Expr) -> BasicPath:
+    def transform(
+        self, var: str, expr: Expr, type_: Optional[Type] = None
+    ) -> BasicPath:
         cp = self.copy()
-        cp.transformation[var] = expr.assign(self.transformation)
+        value = expr.assign(self.transformation)
+        if self.lazy and not isinstance(
+            value, (Variable, IntValue, BoolValue, RealValue)
+        ):
+            assert type_ is not None
+            definition = Variable(f"{var}#{len(self.definitions)}", type_)
+            cp = dataclasses.replace(
+                cp, definitions=self.definitions + ((definition, value),)
+            )
+            value = definition
+        cp.transformation[var] = value
         return cp
 
-    def assert_start(self, prop: Expr) -> BasicPath:
-        return dataclasses.replace(self, assertion_start=prop)
+    def assert_start(self, prop: Expr, remembers: tuple[Expr, ...] = ()) -> BasicPath:
+        return dataclasses.replace(
+            self, assertion_start=prop, remembers_start=remembers
+        )
+
+    def assert_end(self, prop: Expr, remembers: tuple[Expr, ...] = ()) -> BasicPath:
+        return dataclasses.replace(
+            self,
+            assertion_end=prop.assign(self.transformation),
+            remembers_end=remembers,
+        )
 
-    def assert_end(self, prop: Expr) -> BasicPath:
-        return dataclasses.replace(self, assertion_end=prop.assign(self.transformation))
+    def get_assertion_start(self) -> Optional[Expr]:
+        if self.assertion_start is None or not self.remembers_start:
+            return self.assertion_start
+        return And(self.remembers_start + (self.assertion_start,))
+
+    def get_assertion_end(self) -> Optional[Expr]:
+        if self.assertion_end is None or not self.remembers_end:
+            return self.assertion_end
+        return And(
+            tuple(r.assign(self.transformation) for r in self.remembers_end)
+            + (self.assertion_end,)
+        )
+
+    def fingerprint(self) -> str:
+        """
+        a hash of the kinds of the nodes of the path and of its expressions, source
+        locations don't count, so edits elsewhere in the function don't change it
+        """
+        content = (
+            tuple(type(node).__name__ for node in self.nodes),
+            self.reachability,
+            sorted(self.transformation.items()),
+            self.get_assertion_start(),
+            self.get_assertion_end(),
+            self.definitions,
+        )
+        return hashlib.blake2b(repr(content).encode(), digest_size=16).hexdigest()
 
     def get_proof_rule(self) -> Expr:
-        assert self.assertion_end is not None
+        return self.make_proof_rule(
+            self.get_assertion_start(), self.get_assertion_end()
+        )
+
+    def make_proof_rule(
+        self, assertion_start: Optional[Expr], assertion_end: Optional[Expr]
+    ) -> Expr:
+        assert assertion_end is not None
         # FIXME: handle the case when `reachability` is empty
-        if self.assertion_start is not None:
-            return Then(
-                And(tuple(self.reachability) + (self.assertion_start,)),
-                self.assertion_end,
+        if assertion_start is not None:
+            rule: Expr = Then(
+                And(tuple(self.reachability) + (assertion_start,)), assertion_end,
             )
         else:
-            return (
+            rule = (
                 Then(
                     And(tuple(self.reachability))
                     if len(self.reachability) >= 2
                     else self.reachability[0],
-                    self.assertion_end,
+                    assertion_end,
                 )
                 if self.reachability
-                else self.assertion_end
+                else assertion_end
             )
+        return Let(self.definitions, rule) if self.definitions else rule
+
+    def get_hoisted_proof_rule(self) -> tuple[tuple[Expr, ...], list[Expr]]:
+        """
+        returns the remembered facts that hold at the start of the path, which may be
+        used as background assumptions, and the obligations that prove the path
+        under these assumptions
+
+        a remembered fact is proved only when it's introduced by the path or when the
+        path modifies one of its variables, otherwise it follows from the background
+        """
+        obligations = [self.make_proof_rule(self.assertion_start, self.assertion_end)]
+        for fact in self.remembers_end:
+            in_background = any(fact is r for r in self.remembers_start)
+            if in_background and fact.free_vars().isdisjoint(self.transformation):
+                continue
+            obligations.append(
+                self.make_proof_rule(
+                    self.assertion_start, fact.assign(self.transformation)
+                )
+            )
+        return self.remembers_start, obligations
+
+    def slice(self) -> tuple[BasicPath, SliceStats]:
+        """
+        cone-of-influence slicing: keeps only the hypotheses (reachability conditions
+        and conjuncts of `assertion_start`) that are transitively connected to
+        `assertion_end` through shared variables
+
+        dropping hypotheses only strengthens the proof rule, so if the sliced path is
+        valid then so is the original one (the converse fails only when the dropped
+        hypotheses are unsatisfiable by themselves)
+        """
+        assertion_start = self.get_assertion_start()
+        assertion_end = self.get_assertion_end()
+        assert assertion_end is not None
+        reachability = [c for r in self.reachability for c in r.conjuncts()]
+        start = list(assertion_start.conjuncts()) if assertion_start is not None else []
+        hypotheses = [(c, c.free_vars()) for c in reachability + start]
+
+        relevant = set(assertion_end.free_vars())
+        kept: set[int] = set()
+        changed = True
+        while changed:
+            changed = False
+            for i, (_, vars) in enumerate(hypotheses):
+                # hypotheses without variables are kept as they may be trivially false
+                if i not in kept and (not vars or not vars.isdisjoint(relevant)):
+                    kept.add(i)
+                    relevant |= vars
+                    changed = True
+            # a definition connects its variable with the variables of its value
+            for var, value in reversed(self.definitions):
+                if var.var in relevant and not value.free_vars() <= relevant:
+                    relevant |= value.free_vars()
+                    changed = True
+
+        kept_reachability = [c for i, c in enumerate(reachability) if i in kept]
+        kept_start = [c for i, c in enumerate(start, len(reachability)) if i in kept]
+        sliced = BasicPath(
+            kept_reachability,
+            self.transformation.copy(),
+            None
+            if not kept_start
+            else kept_start[0]
+            if len(kept_start) == 1
+            else And(tuple(kept_start)),
+            assertion_end,
+            self.nodes.copy(),
+            lazy=self.lazy,
+            definitions=tuple(
+                (var, value) for var, value in self.definitions if var.var in relevant
+            ),
+        )
+        stats = SliceStats(
+            conjuncts_before=len(hypotheses),
+            conjuncts_after=len(kept),
+            size_before=self.get_proof_rule().size(),
+            size_after=sliced.get_proof_rule().size(),
+        )
+        return sliced, stats
+
+    def split(self) -> list[BasicPath]:
+        """
+        splits the path into one path per top-level conjunct of `assertion_end`
+        the original path is valid iff all of the returned paths are valid
+        """
+        assertion_end = self.get_assertion_end()
+        assert assertion_end is not None
+        return [
+            dataclasses.replace(self, assertion_end=conjunct, remembers_end=())
+            for conjunct in assertion_end.conjuncts()
+        ]
 
     def append(self, node: CfgNode) -> BasicPath:
         cp = self.copy()
@@ -220,7 +395,8 @@ class AssignmentNode(CfgNode):
         self, path: BasicPath, visited_asserts: set[int],
     ) -> Iterator[BasicPath]:
         yield from self.next_node.generate_paths(
-            path.transform(self.var.var, self.expression).append(self), visited_asserts
+            path.transform(self.var.var, self.expression, self.var.type_).append(self),
+            visited_asserts,
         )
 
     def replace(self, dummy: DummyNode, node: CfgNode, visited: set[int]):
@@ -255,16 +431,28 @@ class AssumeNode(CfgNode):
 class AssertNode(CfgNode):
     assertion: Expr
     next_node: CfgNode
+    # the facts introduced by `remember()` in the enclosing scopes
+    remembers: tuple[Expr, ...] = ()
+    # facts that are known to hold here (see `absint.seed_facts()`), they're
+    # assumed by the paths that start here but not checked by those that end here
+    facts: tuple[Expr, ...] = ()
+
+    def get_assertion(self) -> Expr:
+        if not self.remembers:
+            return self.assertion
+        return And(self.remembers + (self.assertion,))
 
     def generate_paths(
         self, path: BasicPath, visited_asserts: set[int],
     ) -> Iterator[BasicPath]:
-        yield path.assert_end(self.assertion).append(self)
+        yield path.assert_end(self.assertion, self.remembers).append(self)
         if id(self) in visited_asserts:
             return
         visited_asserts.add(id(self))
         yield from self.next_node.generate_paths(
-            BasicPath.empty().assert_start(self.assertion).append(self),
+            BasicPath.empty(path.lazy)
+            .assert_start(self.assertion, self.remembers + self.facts)
+            .append(self),
             visited_asserts,
         )
 
@@ -434,13 +622,11 @@ class StatementEnvironment:
             ):
                 fn = ast[0][0].text
                 if fn == "assert":
-                    assertion = Expr.from_ast(ast[0][2], self.env)
-                    remembers = tuple(chain.from_iterable(self.remembers))
-                    assertion = (
-                        And(remembers + (assertion,)) if remembers else assertion
-                    )
                     return AssertNode(
-                        ast.range, assertion=assertion, next_node=self.next_node,
+                        ast.range,
+                        assertion=Expr.from_ast(ast[0][2], self.env),
+                        next_node=self.next_node,
+                        remembers=tuple(chain.from_iterable(self.remembers)),
                     )
                 elif fn == "ensures":
                     assert self.end_node.assertion is None
@@ -611,7 +797,24 @@ def create_cfg(ast: AstNode, requires: Optional[Expr], env: Environment) -> CfgN
     return builder.start_node
 
 
-def get_paths(cfg: CfgNode) -> Iterator[BasicPath]:
+class PathBudgetExceeded(Exception):
+    """
+    raised by `get_paths()` when the paths of a CFG go over a budget
+    """
+
+
+def get_paths(
+    cfg: CfgNode,
+    lazy: bool = False,
+    max_paths: Optional[int] = None,
+    max_size: Optional[int] = None,
+) -> Iterator[BasicPath]:
+    """
+    the basic paths of `cfg`
+    with `max_paths` CFGs with more paths (see `count_paths()`) raise
+    `PathBudgetExceeded` before any path is generated, with `max_size` the
+    enumeration raises it once the proof rules of the paths have more nodes
+    """
     graph = nx.DiGraph()
     id2node: dict[int, CfgNode] = {}
 
@@ -648,4 +851,142 @@ def get_paths(cfg: CfgNode) -> Iterator[BasicPath]:
         next(nx.simple_cycles(graph), None) is None
     ), "found cycle without a cutpoint in cfg"
 
-    return cfg.generate_paths(BasicPath.empty(), set())
+    if max_paths is not None:
+        count = count_paths(cfg)
+        if count > max_paths:
+            raise PathBudgetExceeded(f"{count} paths, more than {max_paths}")
+    paths = cfg.generate_paths(BasicPath.empty(lazy), set())
+    if max_size is not None:
+        return limit_size(paths, max_size)
+    return paths
+
+
+def limit_size(paths: Iterator[BasicPath], max_size: int) -> Iterator[BasicPath]:
+    size = 0
+    for path in paths:
+        size += path.get_proof_rule().size()
+        if size > max_size:
+            raise PathBudgetExceeded(f"proof rules of more than {max_size} nodes")
+        yield path
+
+
+def count_paths(cfg: CfgNode) -> int:
+    """
+    the number of paths `get_paths()` generates, without generating them
+    the paths from each node to the assertions that end them are counted once per
+    node, in reverse topological order of the graph where assertions have no
+    successors, a path starts at the start node and after each assertion
+    end nodes end a single path (see `EndNode.generate_paths()`)
+    """
+    nodes = get_nodes(cfg)
+    ways: dict[int, int] = {}
+    visiting: set[int] = set()
+    stack: list[tuple[CfgNode, bool]] = [(node, False) for node in nodes]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in ways:
+            continue
+        successors = [] if isinstance(node, AssertNode) else get_successors(node)
+        if not expanded:
+            assert id(node) not in visiting, "found cycle without a cutpoint in cfg"
+            visiting.add(id(node))
+            stack.append((node, True))
+            stack.extend((successor, False) for successor in successors)
+            continue
+        visiting.remove(id(node))
+        if isinstance(node, AssertNode):
+            ways[id(node)] = 1
+        else:
+            ways[id(node)] = sum(ways[id(successor)] for successor in successors)
+
+    count = ways[id(cfg)]
+    for node in nodes:
+        if isinstance(node, AssertNode):
+            count += ways[id(node.next_node)]
+        elif isinstance(node, EndNode) and node.assertion is not None:
+            count += 1
+    return count
+
+
+def get_successors(node: CfgNode) -> list[CfgNode]:
+    if isinstance(node, CondNode):
+        return [node.true_br, node.false_br]
+    elif isinstance(node, (StartNode, AssignmentNode, AssumeNode, AssertNode)):
+        return [node.next_node]
+    else:
+        return []
+
+
+def get_nodes(cfg: CfgNode) -> list[CfgNode]:
+    """
+    the nodes reachable from `cfg` (which comes first) in depth-first order
+    """
+    nodes: list[CfgNode] = []
+    visited: set[int] = set()
+    stack = [cfg]
+    while stack:
+        node = stack.pop()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+        nodes.append(node)
+        stack.extend(reversed(get_successors(node)))
+    return nodes
+
+
+def get_cutpoints(cfg: CfgNode) -> list[CfgNode]:
+    """
+    nodes that cut every cycle of `cfg` that doesn't go through an `AssertNode`,
+    the nodes that are on the most remaining cycles are picked first
+    """
+    graph = nx.DiGraph()
+    id2node: dict[int, CfgNode] = {}
+    for node in get_nodes(cfg):
+        id2node[id(node)] = node
+        # assertions already cut the cycles they're on
+        if not isinstance(node, AssertNode):
+            graph.add_node(id(node))
+            for successor in get_successors(node):
+                graph.add_edge(id(node), id(successor))
+
+    cycles = list(nx.simple_cycles(graph))
+    node2cycle: dict[int, set[int]] = {}
+    for i, c in enumerate(cycles):
+        for n in c:
+            node2cycle.setdefault(n, set()).add(i)
+
+    cutpoints: list[CfgNode] = []
+    while node2cycle:
+        point = max(node2cycle, key=lambda n: len(node2cycle[n]))
+        cutpoints.append(id2node[point])
+        for i in node2cycle[point]:
+            for n in cycles[i]:
+                if n == point:
+                    continue
+                node2cycle[n].remove(i)
+                if not node2cycle[n]:
+                    del node2cycle[n]
+        del node2cycle[point]
+    return cutpoints
+
+
+def insert_assert(cfg: CfgNode, node: CfgNode, assertion: Expr) -> AssertNode:
+    """
+    inserts an assertion of `assertion` between `node` and its predecessors
+    """
+    predecessors = [
+        n for n in get_nodes(cfg) if any(s is node for s in get_successors(n))
+    ]
+    new_node = AssertNode(node.code_location, assertion, node)
+    for predecessor in predecessors:
+        if isinstance(predecessor, CondNode):
+            if predecessor.true_br is node:
+                predecessor.true_br = new_node
+            if predecessor.false_br is node:
+                predecessor.false_br = new_node
+        else:
+            assert isinstance(
+                predecessor, (AssertNode, AssignmentNode, StartNode, AssumeNode)
+            ), f"unexpected node of type {type(predecessor)}"
+            predecessor.next_node = new_node
+    return new_node
@@ -0,0 +1,431 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import socketserver
+import sys
+import threading
+from dataclasses import asdict, dataclass, field, replace
+from typing import IO, Any, Callable, Optional
+
+import z3
+
+from cast import AstRange
+from cfg import PathBudgetExceeded, count_paths
+from function import (
+    BaseFunction,
+    Budget,
+    Function,
+    HornFunction,
+    HornOk,
+    Options,
+    PathCache,
+    PathReport,
+    Timeout,
+    z3_context,
+)
+from main import compile_functions, get_functions
+from strategy import STRATEGIES, StrategyStore
+from warmstart import InvariantStore
+
+# seconds between two looks at the watched benchmarks
+WATCH_INTERVAL = 0.5
+
+# functions with more paths are checked without reporting on their paths
+MAX_PATHS = 10_000
+
+# json-rpc error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    # the modification time of the source the functions were compiled from
+    mtime: float
+    functions: dict[str, BaseFunction]
+
+
+class Connection:
+    """
+    a client, messages are json objects one per line, notifications about watched
+    benchmarks are written from the watcher thread
+    """
+
+    def __init__(self, output: IO[bytes]):
+        self.output = output
+        self.lock = threading.Lock()
+
+    def send(self, message: dict[str, Any]):
+        with self.lock:
+            self.output.write(json.dumps(message).encode() + b"\n")
+            self.output.flush()
+
+
+def get_report(report: PathReport) -> dict[str, Any]:
+    ranges = [n.code_location for n in report.path.nodes]
+    return {
+        "logic": report.logic,
+        "time": report.time,
+        "valid": report.valid,
+        "reused": report.reused,
+        "timeout": report.timeout,
+        "ranges": [asdict(r) for r in ranges if isinstance(r, AstRange)],
+    }
+
+
+@dataclass(frozen=True)
+class Daemon:
+    """
+    serves json-rpc requests about the functions of the benchmarks (by name,
+    without `.c`) and keeps what they have in common between requests:
+    - the compiled functions, benchmarks are only compiled again once they change
+    - the path reports (see `PathCache`), so a benchmark is verified again only
+      along the paths that changed
+    - the invariants horn found (see `InvariantStore`)
+    - the strategies that checked functions fastest (see `StrategyStore`)
+    - z3 contexts (see `z3_context()`)
+    """
+
+    benchmarks: dict[str, Benchmark] = field(default_factory=dict)
+    paths: PathCache = field(default_factory=PathCache)
+    invariants: InvariantStore = field(default_factory=InvariantStore)
+    strategies: StrategyStore = field(default_factory=StrategyStore)
+    # the benchmarks clients watch with their options, by client and benchmark
+    watched: dict[tuple[int, str], tuple[Connection, dict[str, Any]]] = field(
+        default_factory=dict
+    )
+    # the modification times of the watched benchmarks when they were last polled
+    polled: dict[str, float] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # spacer runs in z3's global context
+    horn_lock: threading.Lock = field(default_factory=threading.Lock)
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+    def get_methods(self) -> dict[str, Callable[[Connection, dict[str, Any]], Any]]:
+        return {
+            "load": self.load,
+            "verify": self.verify,
+            "check": self.check,
+            "horn": self.horn,
+            "watch": self.watch,
+            "unwatch": self.unwatch,
+            "shutdown": self.shutdown,
+        }
+
+    def handle(self, connection: Connection, line: bytes) -> Optional[dict[str, Any]]:
+        """
+        the response to the request `line`, `None` for notifications
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            # json errors and bytes that aren't text
+            return {"jsonrpc": "2.0", "id": None, "error": error(PARSE_ERROR, e)}
+        if not isinstance(request, dict):
+            invalid = error(INVALID_REQUEST, "a request is a json object")
+            return {"jsonrpc": "2.0", "id": None, "error": invalid}
+        id_ = request.get("id")
+        method = self.get_methods().get(request.get("method"))
+        params = request.get("params", {})
+        if method is None:
+            response: dict[str, Any] = {
+                "error": error(METHOD_NOT_FOUND, request.get("method"))
+            }
+        elif not isinstance(params, dict):
+            response = {"error": error(INVALID_PARAMS, "params are a json object")}
+        else:
+            try:
+                response = {"result": method(connection, params)}
+            except KeyError as e:
+                response = {"error": error(INVALID_PARAMS, f"missing {e}")}
+            except FileNotFoundError as e:
+                # benchmarks that don't exist
+                response = {"error": error(INVALID_PARAMS, e)}
+            except ValueError as e:
+                response = {"error": error(INVALID_PARAMS, e)}
+            except Exception as e:
+                response = {"error": error(INTERNAL_ERROR, e)}
+        if id_ is None:
+            return None
+        return {"jsonrpc": "2.0", "id": id_, **response}
+
+    def get_benchmark(self, filename: str) -> Benchmark:
+        mtime = os.path.getmtime(get_source(filename))
+        # the frontend's output is written to the same files for every request
+        with self.lock:
+            benchmark = self.benchmarks.get(filename)
+            if benchmark is None or benchmark.mtime != mtime:
+                refresh_copy(filename)
+                benchmark = Benchmark(mtime, compile_functions(filename))
+                self.benchmarks[filename] = benchmark
+            return benchmark
+
+    def get_functions(
+        self, params: dict[str, Any], horn: bool = False
+    ) -> list[BaseFunction]:
+        """
+        the functions `params` asks for, all the functions of the benchmark unless
+        it names one
+        the functions of requests that change CFGs (horn, houdini) are built again
+        from the frontend's output, the cached ones are left as they are
+        """
+        benchmark = self.get_benchmark(params["filename"])
+        functions = benchmark.functions
+        if horn or params.get("options", {}).get("houdini", False):
+            functions = get_functions(f"benchmarks/{params['filename']}.json", horn)
+        if "function" in params:
+            return [functions[params["function"]]]
+        return list(functions.values())
+
+    def load(self, connection: Connection, params: dict[str, Any]) -> list[str]:
+        return list(self.get_benchmark(params["filename"]).functions)
+
+    def verify(
+        self, connection: Connection, params: dict[str, Any]
+    ) -> dict[str, dict[str, Any]]:
+        """
+        the reports of the paths of each function, paths whose report is reused
+        from a previous request aren't checked again
+        """
+        results: dict[str, dict[str, Any]] = {}
+        with z3_context() as ctx:
+            options = get_options(params, ctx)
+            for f in self.get_functions(params):
+                assert isinstance(f, Function)
+                if params.get("options", {}).get("houdini", False):
+                    f.infer_invariants(options)
+                try:
+                    reports = f.get_path_reports(options, self.paths)
+                except PathBudgetExceeded as e:
+                    result = f.check(options)
+                    results[f.name] = {
+                        "verified": result.is_ok(),
+                        "timeout": isinstance(result, Timeout),
+                        "budget": str(e),
+                        "path_count": count_paths(f.cfg),
+                    }
+                    continue
+                results[f.name] = {
+                    "verified": all(report.valid for report in reports),
+                    "reused": sum(report.reused for report in reports),
+                    "timeouts": sum(report.timeout for report in reports),
+                    "path_count": len(reports),
+                    "paths": [get_report(report) for report in reports],
+                }
+        return results
+
+    def check(
+        self, connection: Connection, params: dict[str, Any]
+    ) -> dict[str, dict[str, Any]]:
+        """
+        checks each function as a whole with the strategy `params["strategy"]`,
+        "auto" (the default) starts with the one that won last time and races the
+        other one (see `StrategyStore`)
+        """
+        strategy = params.get("strategy", "auto")
+        if strategy != "auto" and strategy not in STRATEGIES:
+            raise ValueError(f"unknown strategy {strategy!r}")
+        results: dict[str, dict[str, Any]] = {}
+        with z3_context() as ctx:
+            options = get_options(params, ctx)
+            for f in self.get_functions(params):
+                assert isinstance(f, Function)
+                if params.get("options", {}).get("houdini", False):
+                    f.infer_invariants(options)
+                if strategy == "auto":
+                    used, result = self.strategies.check(f, options)
+                else:
+                    result = STRATEGIES[strategy](f, options, threading.Event())
+                    used = strategy
+                results[f.name] = {
+                    "verified": result.is_ok(),
+                    "result": str(result),
+                    "timeout": isinstance(result, Timeout),
+                    "strategy": used,
+                }
+        return results
+
+    def horn(
+        self, connection: Connection, params: dict[str, Any]
+    ) -> dict[str, dict[str, Any]]:
+        results: dict[str, dict[str, Any]] = {}
+        with self.horn_lock:
+            for f in self.get_functions(params, horn=True):
+                assert isinstance(f, HornFunction)
+                if params.get("absint", True):
+                    f.seed_invariants()
+                options = get_options(params, None)
+                result = self.invariants.check(f, options)
+                invariants = []
+                if isinstance(result, HornOk):
+                    invariants = [
+                        {
+                            "name": invariant.name,
+                            "expr": str(invariant),
+                            "range": asdict(node.code_location)
+                            if node.code_location is not None
+                            else None,
+                        }
+                        for invariant, node in zip(result.invariants, f.cutpoints)
+                    ]
+                results[f.name] = {
+                    "verified": result.is_ok(),
+                    "timeout": isinstance(result, Timeout),
+                    "invariants": invariants,
+                }
+        return results
+
+    def watch(
+        self, connection: Connection, params: dict[str, Any]
+    ) -> dict[str, dict[str, Any]]:
+        """
+        verifies the benchmark now and again every time it changes, the results
+        of the latter are sent as `verified` notifications
+        """
+        result = self.verify(connection, params)
+        with self.lock:
+            key = (id(connection), params["filename"])
+            self.watched[key] = (connection, params)
+        return result
+
+    def unwatch(self, connection: Connection, params: dict[str, Any]):
+        with self.lock:
+            self.watched.pop((id(connection), params["filename"]), None)
+
+    def disconnect(self, connection: Connection):
+        with self.lock:
+            for key in [key for key in self.watched if key[0] == id(connection)]:
+                del self.watched[key]
+
+    def shutdown(self, connection: Connection, params: dict[str, Any]):
+        self.stopped.set()
+
+    def poll(self):
+        """
+        verifies the watched benchmarks that changed since they were last compiled
+        """
+        with self.lock:
+            watched = list(self.watched.values())
+        changed: set[str] = set()
+        for filename in {params["filename"] for _, params in watched}:
+            try:
+                mtime = os.path.getmtime(get_source(filename))
+            except OSError:
+                continue
+            benchmark = self.benchmarks.get(filename)
+            # a benchmark that fails to compile is only reported once per change
+            if self.polled.get(filename) != mtime and (
+                benchmark is None or benchmark.mtime != mtime
+            ):
+                changed.add(filename)
+            self.polled[filename] = mtime
+        for connection, params in watched:
+            if params["filename"] not in changed:
+                continue
+            try:
+                message: dict[str, Any] = {"result": self.verify(connection, params)}
+            except Exception as e:
+                message = {"error": error(INTERNAL_ERROR, e)}
+            notification = {
+                "jsonrpc": "2.0",
+                "method": "verified",
+                "params": {"filename": params["filename"], **message},
+            }
+            try:
+                connection.send(notification)
+            except OSError:
+                self.disconnect(connection)
+
+    def watch_benchmarks(self):
+        while not self.stopped.wait(WATCH_INTERVAL):
+            self.poll()
+
+    def serve(self, input: IO[bytes], output: IO[bytes]):
+        """
+        answers the requests of one client until it disconnects or the daemon is
+        shut down
+        """
+        connection = Connection(output)
+        try:
+            for line in input:
+                if not line.strip():
+                    continue
+                response = self.handle(connection, line)
+                if response is not None:
+                    connection.send(response)
+                if self.stopped.is_set():
+                    break
+        finally:
+            self.disconnect(connection)
+
+
+def get_source(filename: str) -> str:
+    """
+    the file benchmark `filename` is watched through, its copy in tmp/ only if
+    it's not in benchmarks/
+    """
+    if os.path.exists(f"benchmarks/{filename}.c"):
+        return f"benchmarks/{filename}.c"
+    return f"tmp/{filename}.c"
+
+
+def refresh_copy(filename: str):
+    """
+    the frontend compiles the copy of the benchmark in tmp/, which it only makes
+    when there's none (see comp-benchmark.sh), so it's replaced when the
+    benchmark is newer
+    """
+    source, copy = f"benchmarks/{filename}.c", f"tmp/{filename}.c"
+    if not os.path.exists(source) or not os.path.exists(copy):
+        return
+    if os.path.getmtime(source) > os.path.getmtime(copy):
+        shutil.copyfile(source, copy)
+
+
+def error(code: int, e: Any) -> dict[str, Any]:
+    return {"code": code, "message": str(e)}
+
+
+def get_options(params: dict[str, Any], ctx: Optional[z3.Context]) -> Options:
+    """
+    the options of a request, its budget is `params["request_timeout"]` seconds
+    """
+    json_options = {"max_paths": MAX_PATHS, **params.get("options", {})}
+    options = Options.from_json(json_options, ctx)
+    return replace(options, budget=Budget.of(params.get("request_timeout")))
+
+
+def main(socket_path: Optional[str]):
+    daemon = Daemon()
+    threading.Thread(target=daemon.watch_benchmarks, daemon=True).start()
+    if socket_path is None:
+        daemon.serve(sys.stdin.buffer, sys.stdout.buffer)
+        daemon.stopped.set()
+        return
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            daemon.serve(self.rfile, self.wfile)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        daemon.stopped.wait()
+        server.shutdown()
+    os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="answers json-rpc requests (one per line) on stdin or a socket"
+    )
+    parser.add_argument("--socket", help="the path of a unix socket to listen on")
+    args = parser.parse_args()
+    main(args.socket)
@@ -1,7 +1,11 @@
 from __future__ import annotations
 import operator
+import re
+import struct
+import zlib
 from collections import defaultdict
 from dataclasses import dataclass
+from fractions import Fraction
 from typing import Any, Callable, ClassVar, Optional
 
 import z3
@@ -9,9 +13,57 @@ import z3
 from cast import AstNode, AstType
 
 
+@dataclass(frozen=True)
+class Encoding:
+    """
+    controls how expressions are translated into z3
+    """
+
+    # annotate range quantifiers with the array reads of their bound variable as
+    # E-matching patterns, see `ForAllRange.get_triggers()`
+    triggers: bool = False
+    # "fp" encodes floats as IEEE doubles, "real" abstracts them as ideal reals
+    float_mode: str = "fp"
+    # "int" encodes ints as unbounded integers, "bv32" as 32-bit two's complement
+    # bitvectors, which also enables the bitwise operators
+    int_mode: str = "int"
+    # the context z3 terms are created in (z3's global context by default)
+    # z3 contexts aren't thread-safe so each thread needs a context of its own
+    ctx: Optional[z3.Context] = None
+
+    def __post_init__(self):
+        if self.float_mode not in FLOAT_MODES:
+            raise ValueError(f"unknown float_mode {self.float_mode!r}")
+        if self.int_mode not in INT_MODES:
+            raise ValueError(f"unknown int_mode {self.int_mode!r}")
+
+
+FLOAT_MODES = ("fp", "real")
+INT_MODES = ("int", "bv32")
+DEFAULT_ENCODING = Encoding()
+BV_WIDTH = 32
+
+
+def smt2_bv(value: int) -> str:
+    return f"(_ bv{value % 2 ** BV_WIDTH} {BV_WIDTH})"
+
+
+def smt2_symbol(name: str) -> str:
+    if re.fullmatch(r"[a-zA-Z~!@$%^&*_+=<>.?/-][a-zA-Z0-9~!@$%^&*_+=<>.?/-]*", name):
+        return name
+    return f"|{name}|"
+
+
+def smt2_app(op: str, *args: str) -> str:
+    return f"({op} {' '.join(args)})"
+
+
 @dataclass(frozen=True)
 class Type:
-    def as_z3(self):
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        raise NotImplementedError
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
         raise NotImplementedError
 
     def __str__(self) -> str:
@@ -20,7 +72,7 @@ class Type:
     @staticmethod
     def from_z3(sort: z3.ArithSortRef) -> Type:
         name = sort.name()
-        if name == "Int":
+        if name in ("Int", "BitVec"):
             return AtomicType("int")
         elif name == "Bool":
             return AtomicType("bool")
@@ -37,13 +89,31 @@ class Type:
 class AtomicType(Type):
     name: str  # "int", "float", "bool"
 
-    def as_z3(self):
-        if self.name == "int":
-            return z3.IntSort()
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        if self.name == "int" and encoding.int_mode == "bv32":
+            return z3.BitVecSort(BV_WIDTH, encoding.ctx)
+        elif self.name == "int":
+            return z3.IntSort(encoding.ctx)
+        elif self.name == "float" and encoding.float_mode == "real":
+            return z3.RealSort(encoding.ctx)
         elif self.name == "float":
-            return z3.FloatDouble()
+            return z3.FloatDouble(encoding.ctx)
         elif self.name == "bool":
-            return z3.BoolSort()
+            return z3.BoolSort(encoding.ctx)
+        else:
+            assert False
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if self.name == "int" and encoding.int_mode == "bv32":
+            return f"(_ BitVec {BV_WIDTH})"
+        elif self.name == "int":
+            return "Int"
+        elif self.name == "float" and encoding.float_mode == "real":
+            return "Real"
+        elif self.name == "float":
+            return "(_ FloatingPoint 11 53)"
+        elif self.name == "bool":
+            return "Bool"
         else:
             assert False
 
@@ -55,8 +125,12 @@ class AtomicType(Type):
 class ArrayType(Type):
     element_type: Type
 
-    def as_z3(self):
-        return z3.ArraySort(z3.IntSort(), self.element_type.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        return z3.ArraySort(INT.as_z3(encoding), self.element_type.as_z3(encoding))
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        index = INT.as_smt2(encoding)
+        return f"(Array {index} {self.element_type.as_smt2(encoding)})"
 
     def __str__(self) -> str:
         return f"{self.element_type}[]"
@@ -77,7 +151,7 @@ class Environment:
     @staticmethod
     def empty():
         return Environment(
-            scopes=[{}], vars={}, names_count=defaultdict(lambda: 0), renamer=[{}],
+            scopes=[{}], vars={}, names_count=defaultdict(int), renamer=[{}],
         )
 
     def __getitem__(self, var: str) -> Type:
@@ -125,12 +199,45 @@ class Expr:
     def __str__(self) -> str:
         raise NotImplementedError
 
-    def as_z3(self):
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        raise NotImplementedError
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        """
+        the expression in SMT-LIB2 syntax, equivalent to `as_z3()`
+        """
         raise NotImplementedError
 
     def get_type(self) -> Type:
         raise NotImplementedError
 
+    def children(self) -> tuple[Expr, ...]:
+        raise NotImplementedError
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Expr:
+        """
+        rebuilds the expression with `fn` applied to each of its children
+        """
+        raise NotImplementedError
+
+    def free_vars(self) -> frozenset[str]:
+        """
+        the names of the variables that occur free in the expression
+        """
+        return frozenset().union(*(c.free_vars() for c in self.children()))
+
+    def size(self) -> int:
+        """
+        the number of nodes in the expression tree
+        """
+        return 1 + sum(c.size() for c in self.children())
+
+    def conjuncts(self) -> tuple[Expr, ...]:
+        """
+        the top-level conjuncts of the expression (nested `And`s are flattened)
+        """
+        return (self,)
+
     @staticmethod
     def from_ast(ast: AstNode, env: Environment) -> Expr:
         if ast.type in (AstType.relational_expression, AstType.equality_expression):
@@ -303,10 +410,14 @@ class Expr:
             return ArraySelect(*(Expr.from_z3(z.arg(i), ctx) for i in range(2)))
         elif fn == "store":
             return ArrayStore(*(Expr.from_z3(z.arg(i), ctx) for i in range(3)))
-        elif fn in (">=", "<=", "<", ">", "=", "!="):
+        elif fn in (">=", "<=", "<", ">", "=", "!=", "distinct"):
+            # `RelExpr` spells z3's `=` and `distinct` as `==` and `!=`
+            fn = {"=": "==", "distinct": "!="}.get(fn, fn)
             return RelExpr(fn, Expr.from_z3(z.arg(0), ctx), Expr.from_z3(z.arg(1), ctx))
         elif fn == "Int":
             return IntValue(z.as_long())
+        elif fn in ("true", "false"):
+            return BoolValue(fn == "true")
         else:
             return Variable(fn, INT)
 
@@ -326,6 +437,23 @@ class RelExpr(Expr):
         ">=": operator.ge,
     }
     SYM2PRETTY: ClassVar[dict[str, str]] = {"<=": "≤", ">=": "≥", "==": "=", "!=": "≠"}
+    SYM2SMT2: ClassVar[dict[str, str]] = {"==": "=", "!=": "distinct"}
+    SYM2FP: ClassVar[dict[str, str]] = {
+        "==": "=",
+        "!=": "distinct",
+        "<": "fp.lt",
+        "<=": "fp.leq",
+        ">": "fp.gt",
+        ">=": "fp.geq",
+    }
+    SYM2BV: ClassVar[dict[str, str]] = {
+        "==": "=",
+        "!=": "distinct",
+        "<": "bvslt",
+        "<=": "bvsle",
+        ">": "bvsgt",
+        ">=": "bvsge",
+    }
 
     def assign(self, vars: dict[str, Expr]) -> RelExpr:
         return RelExpr(
@@ -338,12 +466,29 @@ class RelExpr(Expr):
         op = self.SYM2PRETTY.get(self.operator, self.operator)
         return f"{self.lhs} {op} {self.rhs}"
 
-    def as_z3(self) -> z3.ExprRef:
-        return self.SYM2OPERATOR[self.operator](self.lhs.as_z3(), self.rhs.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        return self.SYM2OPERATOR[self.operator](
+            self.lhs.as_z3(encoding), self.rhs.as_z3(encoding)
+        )
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if self.lhs.get_type() == FLOAT and encoding.float_mode == "fp":
+            op = self.SYM2FP[self.operator]
+        elif self.lhs.get_type() == INT and encoding.int_mode == "bv32":
+            op = self.SYM2BV[self.operator]
+        else:
+            op = self.SYM2SMT2.get(self.operator, self.operator)
+        return smt2_app(op, self.lhs.as_smt2(encoding), self.rhs.as_smt2(encoding))
 
     def get_type(self) -> Type:
         return BOOL
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.lhs, self.rhs)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> RelExpr:
+        return RelExpr(operator=self.operator, lhs=fn(self.lhs), rhs=fn(self.rhs))
+
 
 @dataclass(frozen=True)
 class And(Expr):
@@ -358,12 +503,28 @@ class And(Expr):
             for p in self.args
         )
 
-    def as_z3(self):
-        return z3.And(*(a.as_z3() for a in self.args))
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        # the context is explicit since it can't be inferred from no arguments
+        ctx = encoding.ctx or z3.main_ctx()
+        return z3.And(*(a.as_z3(encoding) for a in self.args), ctx)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if not self.args:
+            return "true"
+        return smt2_app("and", *(a.as_smt2(encoding) for a in self.args))
 
     def get_type(self) -> Type:
         return BOOL
 
+    def children(self) -> tuple[Expr, ...]:
+        return self.args
+
+    def map(self, fn: Callable[[Expr], Expr]) -> And:
+        return And(args=tuple(fn(a) for a in self.args))
+
+    def conjuncts(self) -> tuple[Expr, ...]:
+        return tuple(c for a in self.args for c in a.conjuncts())
+
 
 @dataclass(frozen=True)
 class Or(Expr):
@@ -378,12 +539,25 @@ class Or(Expr):
             for p in self.args
         )
 
-    def as_z3(self):
-        return z3.Or(*(a.as_z3() for a in self.args))
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        # the context is explicit since it can't be inferred from no arguments
+        ctx = encoding.ctx or z3.main_ctx()
+        return z3.Or(*(a.as_z3(encoding) for a in self.args), ctx)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if not self.args:
+            return "false"
+        return smt2_app("or", *(a.as_smt2(encoding) for a in self.args))
 
     def get_type(self) -> Type:
         return BOOL
 
+    def children(self) -> tuple[Expr, ...]:
+        return self.args
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Or:
+        return Or(args=tuple(fn(a) for a in self.args))
+
 
 @dataclass(frozen=True)
 class Not(Expr):
@@ -395,12 +569,21 @@ class Not(Expr):
     def __str__(self) -> str:
         return f"¬({self.operand})"
 
-    def as_z3(self):
-        return z3.Not(self.operand.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        return z3.Not(self.operand.as_z3(encoding))
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_app("not", self.operand.as_smt2(encoding))
 
     def get_type(self) -> Type:
         return BOOL
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.operand,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Not:
+        return Not(operand=fn(self.operand))
+
 
 @dataclass(frozen=True)
 class Variable(Expr):
@@ -413,12 +596,24 @@ class Variable(Expr):
     def __str__(self) -> str:
         return self.var
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.Const(self.var, self.type_.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        return z3.Const(self.var, self.type_.as_z3(encoding))
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_symbol(self.var)
 
     def get_type(self) -> Type:
         return self.type_
 
+    def children(self) -> tuple[Expr, ...]:
+        return ()
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Variable:
+        return self
+
+    def free_vars(self) -> frozenset[str]:
+        return frozenset((self.var,))
+
 
 @dataclass(frozen=True)
 class BinaryExpr(Expr):
@@ -432,11 +627,44 @@ class BinaryExpr(Expr):
         "/": operator.truediv,  # NOTE: truediv for z3 integer expressions performs integer division (floordiv isn't defined)
         "%": operator.mod,
         "*": operator.mul,
-        # "^": operator.xor,
-        # "&": operator.and_,
-        # "|": operator.or_,
-        # ">>": operator.rshift,
-        # "<<": operator.lshift,
+        # bitwise operators are only defined in the bv32 int encoding
+        "^": operator.xor,
+        "&": operator.and_,
+        "|": operator.or_,
+        ">>": operator.rshift,  # NOTE: arithmetic shift for z3 bitvectors
+        "<<": operator.lshift,
+    }
+    SYM2SMT2: ClassVar[dict[str, str]] = {
+        "+": "+",
+        "-": "-",
+        "/": "div",
+        "%": "mod",
+        "*": "*",
+    }
+    SYM2FP: ClassVar[dict[str, str]] = {
+        "+": "fp.add RNE",
+        "-": "fp.sub RNE",
+        "/": "fp.div RNE",
+        "%": "fp.rem",
+        "*": "fp.mul RNE",
+    }
+    SYM2FP_Z3: ClassVar[dict[str, Callable[..., Any]]] = {
+        "+": z3.fpAdd,
+        "-": z3.fpSub,
+        "/": z3.fpDiv,
+        "*": z3.fpMul,
+    }
+    SYM2BV: ClassVar[dict[str, str]] = {
+        "+": "bvadd",
+        "-": "bvsub",
+        "/": "bvsdiv",
+        "%": "bvsrem",
+        "*": "bvmul",
+        "^": "bvxor",
+        "&": "bvand",
+        "|": "bvor",
+        ">>": "bvashr",
+        "<<": "bvshl",
     }
 
     def assign(self, vars: dict[str, Expr]) -> BinaryExpr:
@@ -473,14 +701,52 @@ class BinaryExpr(Expr):
                 else f"{self.rhs}"
             )
         else:
-            assert False
-
-    def as_z3(self) -> z3.ExprRef:
-        return self.SYM2OPERATOR[self.operator](self.lhs.as_z3(), self.rhs.as_z3())
+            lhs, rhs = (
+                f"({e})" if isinstance(e, BinaryExpr) else f"{e}"
+                for e in (self.lhs, self.rhs)
+            )
+            return f"{lhs} {self.operator} {rhs}"
+
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        lhs, rhs = self.lhs.as_z3(encoding), self.rhs.as_z3(encoding)
+        if self.get_type() == INT and encoding.int_mode == "bv32":
+            # C's `%` truncates like `bvsrem`, z3's `%` on bitvectors is `bvsmod`
+            if self.operator == "%":
+                return z3.SRem(lhs, rhs)
+        else:
+            assert self.operator in "+-*/%", f"{self.operator} requires bv32 ints"
+        if self.get_type() == FLOAT and encoding.float_mode == "fp":
+            # z3's operators would create the rounding mode in the global context
+            if self.operator == "%":
+                return z3.fpRem(lhs, rhs, lhs.ctx)
+            rm = z3.RNE(lhs.ctx)
+            return self.SYM2FP_Z3[self.operator](rm, lhs, rhs, lhs.ctx)
+        if self.get_type() == FLOAT:
+            assert self.operator != "%", "% isn't defined on reals"
+        return self.SYM2OPERATOR[self.operator](lhs, rhs)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if self.get_type() == FLOAT and encoding.float_mode == "fp":
+            op = self.SYM2FP[self.operator]
+        elif self.get_type() == FLOAT:
+            assert self.operator != "%", "% isn't defined on reals"
+            op = self.operator
+        elif encoding.int_mode == "bv32":
+            op = self.SYM2BV[self.operator]
+        else:
+            assert self.operator in "+-*/%", f"{self.operator} requires bv32 ints"
+            op = self.SYM2SMT2[self.operator]
+        return smt2_app(op, self.lhs.as_smt2(encoding), self.rhs.as_smt2(encoding))
 
     def get_type(self) -> Type:
         return self.lhs.get_type()
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.lhs, self.rhs)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> BinaryExpr:
+        return BinaryExpr(operator=self.operator, lhs=fn(self.lhs), rhs=fn(self.rhs))
+
 
 @dataclass(frozen=True)
 class UnaryExpr(Expr):
@@ -490,7 +756,8 @@ class UnaryExpr(Expr):
     SYM2OPERATOR: ClassVar[dict[str, Callable[[Any], Any]]] = {
         "+": operator.pos,
         "-": operator.neg,
-        # "~": operator.inv,
+        # only defined in the bv32 int encoding
+        "~": operator.invert,
     }
 
     def assign(self, vars: dict[str, Expr]) -> UnaryExpr:
@@ -503,12 +770,35 @@ class UnaryExpr(Expr):
             else f"{self.operand}"
         )
 
-    def as_z3(self) -> z3.ExprRef:
-        return self.SYM2OPERATOR[self.operator](self.operand.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        if self.operator == "~":
+            assert encoding.int_mode == "bv32", "~ requires bv32 ints"
+        operand = self.operand.as_z3(encoding)
+        if self.operator == "-" and z3.is_fp(operand):
+            return z3.fpNeg(operand, operand.ctx)
+        return self.SYM2OPERATOR[self.operator](operand)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if self.operator == "+":
+            return self.operand.as_smt2(encoding)
+        fp = self.get_type() == FLOAT and encoding.float_mode == "fp"
+        bv = self.get_type() == INT and encoding.int_mode == "bv32"
+        if self.operator == "~":
+            assert bv, "~ requires bv32 ints"
+            op = "bvnot"
+        else:
+            op = "fp.neg" if fp else "bvneg" if bv else "-"
+        return smt2_app(op, self.operand.as_smt2(encoding))
 
     def get_type(self) -> Type:
         return self.operand.get_type()
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.operand,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> UnaryExpr:
+        return UnaryExpr(operator=self.operator, operand=fn(self.operand))
+
 
 @dataclass(frozen=True)
 class AsInt(Expr):
@@ -520,12 +810,43 @@ class AsInt(Expr):
     def __str__(self) -> str:
         return f"int({self.expr})"
 
-    def as_z3(self):
-        return z3.ToInt(self.expr.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        # C casts truncate towards zero while `to_int` rounds down
+        value = self.expr.as_z3(encoding)
+        bv = encoding.int_mode == "bv32"
+        if encoding.float_mode == "fp" and bv:
+            sort = z3.BitVecSort(BV_WIDTH, value.ctx)
+            return z3.fpToSBV(z3.RTZ(value.ctx), value, sort, value.ctx)
+        elif encoding.float_mode == "fp":
+            truncated = z3.fpRoundToIntegral(z3.RTZ(value.ctx), value, value.ctx)
+            integer = z3.ToInt(z3.fpToReal(truncated, value.ctx))
+        else:
+            integer = z3.If(value >= 0, z3.ToInt(value), -z3.ToInt(-value))
+        return z3.Int2BV(integer, BV_WIDTH) if bv else integer
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        value = self.expr.as_smt2(encoding)
+        bv = encoding.int_mode == "bv32"
+        if encoding.float_mode == "fp" and bv:
+            return f"((_ fp.to_sbv {BV_WIDTH}) RTZ {value})"
+        elif encoding.float_mode == "fp":
+            integer = f"(to_int (fp.to_real (fp.roundToIntegral RTZ {value})))"
+        else:
+            integer = (
+                f"(ite (>= {value} 0.0) "
+                f"(to_int {value}) (- (to_int (- {value}))))"
+            )
+        return f"((_ int2bv {BV_WIDTH}) {integer})" if bv else integer
 
     def get_type(self) -> Type:
         return INT
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.expr,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> AsInt:
+        return AsInt(expr=fn(self.expr))
+
 
 @dataclass(frozen=True)
 class AsReal(Expr):
@@ -537,12 +858,42 @@ class AsReal(Expr):
     def __str__(self) -> str:
         return f"real({self.expr})"
 
-    def as_z3(self):
-        return z3.ToReal(self.expr.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        value = self.expr.as_z3(encoding)
+        if encoding.int_mode == "bv32" and encoding.float_mode == "fp":
+            sort = z3.Float64(value.ctx)
+            return z3.fpSignedToFP(z3.RNE(value.ctx), value, sort, value.ctx)
+        elif encoding.int_mode == "bv32":
+            value = z3.BV2Int(value, is_signed=True)
+        value = z3.ToReal(value)
+        if encoding.float_mode == "fp":
+            sort = z3.Float64(value.ctx)
+            return z3.fpToFP(z3.RNE(value.ctx), value, sort, value.ctx)
+        return value
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        value = self.expr.as_smt2(encoding)
+        if encoding.int_mode == "bv32" and encoding.float_mode == "fp":
+            return f"((_ to_fp 11 53) RNE {value})"
+        elif encoding.int_mode == "bv32":
+            value = (
+                f"(ite (bvslt {value} {smt2_bv(0)}) "
+                f"(- (bv2int {value}) {2 ** BV_WIDTH}) (bv2int {value}))"
+            )
+        value = smt2_app("to_real", value)
+        if encoding.float_mode == "fp":
+            return f"((_ to_fp 11 53) RNE {value})"
+        return value
 
     def get_type(self) -> Type:
         return FLOAT
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.expr,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> AsReal:
+        return AsReal(expr=fn(self.expr))
+
 
 @dataclass(frozen=True)
 class IntValue(Expr):
@@ -554,12 +905,27 @@ class IntValue(Expr):
     def __str__(self) -> str:
         return f"{self.number}"
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.IntVal(int(self.number))
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        if encoding.int_mode == "bv32":
+            return z3.BitVecVal(int(self.number), BV_WIDTH, encoding.ctx)
+        return z3.IntVal(int(self.number), encoding.ctx)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if encoding.int_mode == "bv32":
+            return smt2_bv(self.number)
+        if self.number < 0:
+            return smt2_app("-", str(-self.number))
+        return str(self.number)
 
     def get_type(self) -> Type:
         return INT
 
+    def children(self) -> tuple[Expr, ...]:
+        return ()
+
+    def map(self, fn: Callable[[Expr], Expr]) -> IntValue:
+        return self
+
 
 @dataclass(frozen=True)
 class RealValue(Expr):
@@ -571,12 +937,31 @@ class RealValue(Expr):
     def __str__(self) -> str:
         return f"{self.number}"
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.FPVal(self.number)
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        if encoding.float_mode == "real":
+            return z3.RealVal(self.number, encoding.ctx)
+        return z3.FPVal(self.number, ctx=encoding.ctx)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if encoding.float_mode == "real":
+            # the same rational as `z3.RealVal()`
+            value = Fraction(str(self.number))
+            real = f"(/ {abs(value.numerator)}.0 {value.denominator}.0)"
+            return smt2_app("-", real) if value < 0 else real
+        # the exact bits of the double, as `z3.FPVal()` would produce
+        (bits,) = struct.unpack(">Q", struct.pack(">d", self.number))
+        sign, exponent, significand = bits >> 63, (bits >> 52) & 0x7FF, bits
+        return f"(fp #b{sign} #b{exponent:011b} #b{significand % 2 ** 52:052b})"
 
     def get_type(self) -> Type:
         return FLOAT
 
+    def children(self) -> tuple[Expr, ...]:
+        return ()
+
+    def map(self, fn: Callable[[Expr], Expr]) -> RealValue:
+        return self
+
 
 @dataclass(frozen=True)
 class BoolValue(Expr):
@@ -588,12 +973,21 @@ class BoolValue(Expr):
     def __str__(self) -> str:
         return f"{self.value}"
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.BoolVal(self.value)
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        return z3.BoolVal(self.value, encoding.ctx)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return "true" if self.value else "false"
 
     def get_type(self) -> Type:
         return BOOL
 
+    def children(self) -> tuple[Expr, ...]:
+        return ()
+
+    def map(self, fn: Callable[[Expr], Expr]) -> BoolValue:
+        return self
+
 
 @dataclass(frozen=True)
 class IfThenElse(Expr):
@@ -611,13 +1005,33 @@ class IfThenElse(Expr):
     def __str__(self) -> str:
         return f"({self.condition}?{{{self.value_true}}}:{{{self.value_false}}})"
 
-    def as_z3(self):
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
         return z3.If(
-            self.condition.as_z3(), self.value_true.as_z3(), self.value_false.as_z3()
+            self.condition.as_z3(encoding),
+            self.value_true.as_z3(encoding),
+            self.value_false.as_z3(encoding),
+        )
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_app(
+            "ite",
+            self.condition.as_smt2(encoding),
+            self.value_true.as_smt2(encoding),
+            self.value_false.as_smt2(encoding),
         )
 
     def get_type(self) -> Type:
-        return BOOL
+        return self.value_true.get_type()
+
+    def children(self) -> tuple[Expr, ...]:
+        return (self.condition, self.value_true, self.value_false)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> IfThenElse:
+        return IfThenElse(
+            condition=fn(self.condition),
+            value_true=fn(self.value_true),
+            value_false=fn(self.value_false),
+        )
 
 
 @dataclass(frozen=True)
@@ -636,12 +1050,32 @@ class ArrayStore(Expr):
     def __str__(self) -> str:
         return f"Store({self.array}, {self.index}, {self.value})"
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.Store(self.array.as_z3(), self.index.as_z3(), self.value.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        return z3.Store(
+            self.array.as_z3(encoding),
+            self.index.as_z3(encoding),
+            self.value.as_z3(encoding),
+        )
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_app(
+            "store",
+            self.array.as_smt2(encoding),
+            self.index.as_smt2(encoding),
+            self.value.as_smt2(encoding),
+        )
 
     def get_type(self) -> Type:
         return self.array.get_type()
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.array, self.index, self.value)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> ArrayStore:
+        return ArrayStore(
+            array=fn(self.array), index=fn(self.index), value=fn(self.value)
+        )
+
 
 @dataclass(frozen=True)
 class ArraySelect(Expr):
@@ -656,14 +1090,86 @@ class ArraySelect(Expr):
     def __str__(self) -> str:
         return f"{self.array}[{self.index}]"
 
-    def as_z3(self) -> z3.ExprRef:
-        return z3.Select(self.array.as_z3(), self.index.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING) -> z3.ExprRef:
+        return z3.Select(self.array.as_z3(encoding), self.index.as_z3(encoding))
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_app(
+            "select", self.array.as_smt2(encoding), self.index.as_smt2(encoding)
+        )
 
     def get_type(self) -> Type:
         ty = self.array.get_type()
         assert isinstance(ty, ArrayType)
         return ty.element_type
 
+    def children(self) -> tuple[Expr, ...]:
+        return (self.array, self.index)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> ArraySelect:
+        return ArraySelect(array=fn(self.array), index=fn(self.index))
+
+
+@dataclass(frozen=True)
+class Let(Expr):
+    """
+    sequential definitions: each variable in `bindings` may be used by the bindings
+    that follow it and by `body`
+    """
+
+    bindings: tuple[tuple[Variable, Expr], ...]
+    body: Expr
+
+    def assign(self, vars: dict[str, Expr]) -> Let:
+        vars = {v: e for v, e in vars.items() if v not in self.get_bound()}
+        return Let(
+            bindings=tuple((var, value.assign(vars)) for var, value in self.bindings),
+            body=self.body.assign(vars),
+        )
+
+    def __str__(self) -> str:
+        bindings = ", ".join(f"{var} := {value}" for var, value in self.bindings)
+        return f"let {bindings} in {self.body}"
+
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        # each definition is translated once and substituted into its users, z3
+        # shares the resulting subterms so the size of the formula stays linear
+        definitions: dict[str, tuple[z3.ExprRef, z3.ExprRef]] = {}
+
+        def resolve(expr: Expr) -> z3.ExprRef:
+            z = expr.as_z3(encoding)
+            pairs = [definitions[v] for v in expr.free_vars() if v in definitions]
+            return z3.substitute(z, *pairs) if pairs else z
+
+        for var, value in self.bindings:
+            definitions[var.var] = (var.as_z3(encoding), resolve(value))
+        return resolve(self.body)
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        # SMT-LIB's `let` is parallel so sequential bindings become nested `let`s
+        res = self.body.as_smt2(encoding)
+        for var, value in reversed(self.bindings):
+            res = f"(let (({var.as_smt2(encoding)} {value.as_smt2(encoding)})) {res})"
+        return res
+
+    def get_type(self) -> Type:
+        return self.body.get_type()
+
+    def children(self) -> tuple[Expr, ...]:
+        return tuple(value for _, value in self.bindings) + (self.body,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Let:
+        return Let(
+            bindings=tuple((var, fn(value)) for var, value in self.bindings),
+            body=fn(self.body),
+        )
+
+    def free_vars(self) -> frozenset[str]:
+        return super().free_vars() - self.get_bound()
+
+    def get_bound(self) -> frozenset[str]:
+        return frozenset(var.var for var, _ in self.bindings)
+
 
 @dataclass(frozen=True)
 class Prop(Expr):
@@ -686,8 +1192,17 @@ class Then(Prop):
             res += f"{self.then}"
         return res
 
-    def as_z3(self):
-        return z3.Implies(self.if_.as_z3(), self.then.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        return z3.Implies(self.if_.as_z3(encoding), self.then.as_z3(encoding))
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        return smt2_app("=>", self.if_.as_smt2(encoding), self.then.as_smt2(encoding))
+
+    def children(self) -> tuple[Expr, ...]:
+        return (self.if_, self.then)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Then:
+        return Then(if_=fn(self.if_), then=fn(self.then))
 
 
 @dataclass(frozen=True)
@@ -707,8 +1222,26 @@ class ForAll(Prop):
             + f".{self.prop}"
         )
 
-    def as_z3(self):
-        return z3.ForAll([var.as_z3() for var in self.vars], self.prop.as_z3())
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        return z3.ForAll(
+            [var.as_z3(encoding) for var in self.vars], self.prop.as_z3(encoding)
+        )
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        vars = " ".join(
+            f"({var.as_smt2(encoding)} {var.type_.as_smt2(encoding)})"
+            for var in self.vars
+        )
+        return f"(forall ({vars}) {self.prop.as_smt2(encoding)})"
+
+    def children(self) -> tuple[Expr, ...]:
+        return (self.prop,)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> ForAll:
+        return ForAll(vars=self.vars, prop=fn(self.prop))
+
+    def free_vars(self) -> frozenset[str]:
+        return self.prop.free_vars() - {var.var for var in self.vars}
 
 
 @dataclass(frozen=True)
@@ -730,14 +1263,90 @@ class ForAllRange(Prop):
     def __str__(self) -> str:
         return f"∀{self.var.var}∈({self.range[0]},{self.range[1]}).{self.prop}"
 
-    def as_z3(self):
-        var = self.var.as_z3()
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        var = self.var.as_z3(encoding)
+        patterns = []
+        if encoding.triggers:
+            patterns = [trigger.as_z3(encoding) for trigger in self.get_triggers()]
         return z3.ForAll(
             [var],
             z3.Implies(
-                z3.And(var >= self.range[0].as_z3(), var < self.range[1].as_z3()),
-                self.prop.as_z3(),
+                z3.And(
+                    var >= self.range[0].as_z3(encoding),
+                    var < self.range[1].as_z3(encoding),
+                ),
+                self.prop.as_z3(encoding),
             ),
+            qid=self.get_qid(),
+            patterns=patterns,
+        )
+
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        var = self.var.as_smt2(encoding)
+        body = smt2_app(
+            "=>",
+            smt2_app(
+                "and",
+                RelExpr(">=", self.var, self.range[0]).as_smt2(encoding),
+                RelExpr("<", self.var, self.range[1]).as_smt2(encoding),
+            ),
+            self.prop.as_smt2(encoding),
+        )
+        attributes = f":qid {self.get_qid()}"
+        if encoding.triggers:
+            for trigger in self.get_triggers():
+                attributes += f" :pattern ({trigger.as_smt2(encoding)})"
+        sort = self.var.type_.as_smt2(encoding)
+        return f"(forall (({var} {sort})) (! {body} {attributes}))"
+
+    def get_qid(self) -> str:
+        """
+        a stable identifier of the quantifier, used to attribute z3's statistics
+        """
+        return f"forall!{zlib.crc32(str(self).encode()):08x}"
+
+    def get_triggers(self) -> list[ArraySelect]:
+        """
+        the array reads in `prop` that are indexed by the bound variable and don't
+        depend on variables bound by nested quantifiers
+        each of them is used as an alternative E-matching pattern
+        """
+        triggers: list[ArraySelect] = []
+
+        def collect(expr: Expr, bound: frozenset[str]):
+            if isinstance(expr, ArraySelect):
+                vars = expr.free_vars()
+                if (
+                    self.var.var in vars
+                    and vars.isdisjoint(bound)
+                    and expr not in triggers
+                ):
+                    triggers.append(expr)
+            if isinstance(expr, (ForAllRange, Exists)):
+                bound = bound | {expr.var.var}
+            elif isinstance(expr, ForAll):
+                bound = bound | {var.var for var in expr.vars}
+            for child in expr.children():
+                collect(child, bound)
+
+        collect(self.prop, frozenset())
+        return triggers
+
+    def children(self) -> tuple[Expr, ...]:
+        return (*self.range, self.prop)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> ForAllRange:
+        return ForAllRange(
+            var=self.var,
+            range=(fn(self.range[0]), fn(self.range[1])),
+            prop=fn(self.prop),
+        )
+
+    def free_vars(self) -> frozenset[str]:
+        return (
+            self.range[0].free_vars()
+            | self.range[1].free_vars()
+            | (self.prop.free_vars() - {self.var.var})
         )
 
 
@@ -764,19 +1373,59 @@ class Exists(Prop):
         )
         return f"∃{self.var.var}∈{domain}.{self.prop}"
 
-    def as_z3(self):
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
         if isinstance(self.domain, Type):
-            return z3.Exists([self.var.as_z3()], self.prop.as_z3())
+            return z3.Exists([self.var.as_z3(encoding)], self.prop.as_z3(encoding))
         else:
-            var = self.var.as_z3()
+            var = self.var.as_z3(encoding)
             return z3.Exists(
                 [var],
                 z3.And(
-                    z3.And(var >= self.domain[0].as_z3(), var < self.domain[1].as_z3()),
-                    self.prop.as_z3(),
+                    z3.And(
+                        var >= self.domain[0].as_z3(encoding),
+                        var < self.domain[1].as_z3(encoding),
+                    ),
+                    self.prop.as_z3(encoding),
                 ),
             )
 
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        var = self.var.as_smt2(encoding)
+        if isinstance(self.domain, Type):
+            return (
+                f"(exists (({var} {self.domain.as_smt2(encoding)})) "
+                f"{self.prop.as_smt2(encoding)})"
+            )
+        body = smt2_app(
+            "and",
+            smt2_app(
+                "and",
+                RelExpr(">=", self.var, self.domain[0]).as_smt2(encoding),
+                RelExpr("<", self.var, self.domain[1]).as_smt2(encoding),
+            ),
+            self.prop.as_smt2(encoding),
+        )
+        return f"(exists (({var} {self.var.type_.as_smt2(encoding)})) {body})"
+
+    def children(self) -> tuple[Expr, ...]:
+        if isinstance(self.domain, Type):
+            return (self.prop,)
+        return (*self.domain, self.prop)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Exists:
+        domain = self.domain
+        if isinstance(domain, tuple):
+            domain = (fn(domain[0]), fn(domain[1]))
+        return Exists(var=self.var, domain=domain, prop=fn(self.prop))
+
+    def free_vars(self) -> frozenset[str]:
+        domain = (
+            frozenset()
+            if isinstance(self.domain, Type)
+            else self.domain[0].free_vars() | self.domain[1].free_vars()
+        )
+        return domain | (self.prop.free_vars() - {self.var.var})
+
 
 @dataclass(frozen=True)
 class Predicate(Prop):
@@ -797,8 +1446,368 @@ class Predicate(Prop):
         args = ",".join(str(a) for a in self.arguments)
         return f"{self.name}({args})"
 
-    def as_z3(self):
-        return z3.Function(self.name, *self.sorts, z3.BoolSort())(
-            *(a.as_z3() for a in self.arguments)
+    def as_z3(self, encoding: Encoding = DEFAULT_ENCODING):
+        sorts = (var.type_.as_z3(encoding) for var in self.vars)
+        return z3.Function(self.name, *sorts, z3.BoolSort(encoding.ctx))(
+            *(a.as_z3(encoding) for a in self.arguments)
         )
 
+    def as_smt2(self, encoding: Encoding = DEFAULT_ENCODING) -> str:
+        if not self.arguments:
+            return smt2_symbol(self.name)
+        return smt2_app(
+            smt2_symbol(self.name), *(a.as_smt2(encoding) for a in self.arguments)
+        )
+
+    def children(self) -> tuple[Expr, ...]:
+        return tuple(self.arguments)
+
+    def map(self, fn: Callable[[Expr], Expr]) -> Predicate:
+        return Predicate(
+            name=self.name,
+            arguments=[fn(a) for a in self.arguments],
+            sorts=self.sorts,
+            vars=self.vars,
+        )
+
+
+def smt_div(a: int, b: int) -> int:
+    """
+    integer division as defined by SMT-LIB (and z3): `a = b * q + r` with `0 <= r < |b|`
+    """
+    return a // b if b > 0 else -(a // -b)
+
+
+def smt_mod(a: int, b: int) -> int:
+    return a - b * smt_div(a, b)
+
+
+def constant_value(expr: Expr) -> Optional[int]:
+    """
+    evaluates integer expressions that don't contain variables
+    returns `None` if `expr` isn't such an expression
+    """
+    if isinstance(expr, IntValue):
+        return expr.number
+    elif isinstance(expr, UnaryExpr) and expr.operator in ("+", "-"):
+        value = constant_value(expr.operand)
+        if value is None:
+            return None
+        return -value if expr.operator == "-" else value
+    elif isinstance(expr, BinaryExpr) and expr.operator in "+-*/%":
+        lhs, rhs = constant_value(expr.lhs), constant_value(expr.rhs)
+        if lhs is None or rhs is None:
+            return None
+        if expr.operator in "/%":
+            if rhs == 0:
+                return None
+            return smt_div(lhs, rhs) if expr.operator == "/" else smt_mod(lhs, rhs)
+        return BinaryExpr.SYM2OPERATOR[expr.operator](lhs, rhs)
+    else:
+        return None
+
+
+def get_logic(expr: Expr, encoding: Encoding = DEFAULT_ENCODING) -> str:
+    """
+    the smallest SMT-LIB logic that `expr` belongs to, e.g. `QF_ALIA` for
+    quantifier-free linear integer arithmetic with arrays
+    propositions that mix floats with other theories get `ALL`
+    """
+
+    def is_constant(expr: Expr) -> bool:
+        return isinstance(expr, RealValue) or constant_value(expr) is not None
+
+    quantifiers = arrays = uninterpreted = nonlinear = ints = floats = False
+    seen: set[int] = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.extend(node.children())
+        if isinstance(node, (ForAll, ForAllRange, Exists)):
+            quantifiers = True
+        elif isinstance(node, Predicate):
+            uninterpreted = True
+        elif isinstance(node, (ArraySelect, ArrayStore)):
+            arrays = True
+        elif isinstance(node, (RealValue, AsReal)):
+            floats = True
+        elif isinstance(node, (IntValue, AsInt)):
+            ints = True
+        elif isinstance(node, Variable):
+            type_ = node.type_
+            while isinstance(type_, ArrayType):
+                arrays = ints = True
+                type_ = type_.element_type
+            floats |= type_ == FLOAT
+            ints |= type_ == INT
+        elif isinstance(node, BinaryExpr) and node.operator in "*/%":
+            if node.operator == "*" and is_constant(node.lhs):
+                continue
+            nonlinear |= not is_constant(node.rhs)
+    bv = ints and encoding.int_mode == "bv32"
+    if floats and encoding.float_mode == "fp":
+        if quantifiers or uninterpreted or (ints or arrays) and not bv:
+            return "ALL"
+        return "QF_" + ("A" if arrays else "") + ("BV" if bv else "") + "FP"
+    elif floats and ints:
+        return "ALL"
+    if bv:
+        arithmetic = "BV"
+    elif floats or ints:
+        arithmetic = ("N" if nonlinear else "L") + ("RA" if floats else "IA")
+    else:
+        arithmetic = ""
+    logic = "" if quantifiers else "QF_"
+    logic += "A" if arrays else ""
+    logic += "UF" if uninterpreted or not arithmetic else ""
+    return logic + arithmetic
+
+
+def expand_quantifiers(expr: Expr, threshold: int) -> Expr:
+    """
+    replaces quantifiers over constant integer ranges of at most `threshold` values
+    with the equivalent finite conjunction (`ForAllRange`) or disjunction (`Exists`)
+
+    outer quantifiers are expanded first so the bounds of inner quantifiers that
+    depend on them may become constant
+    """
+    if isinstance(expr, ForAllRange):
+        bounds: Optional[tuple[Expr, Expr]] = expr.range
+    elif isinstance(expr, Exists) and isinstance(expr.domain, tuple):
+        bounds = expr.domain
+    else:
+        bounds = None
+    if bounds is not None:
+        assert isinstance(expr, (ForAllRange, Exists))
+        start, end = constant_value(bounds[0]), constant_value(bounds[1])
+        if start is not None and end is not None and end - start <= threshold:
+            instances = tuple(
+                expand_quantifiers(
+                    expr.prop.assign({expr.var.var: IntValue(i)}), threshold
+                )
+                for i in range(start, end)
+            )
+            if len(instances) == 1:
+                return instances[0]
+            elif isinstance(expr, ForAllRange):
+                return And(instances) if instances else BoolValue(True)
+            else:
+                return Or(instances) if instances else BoolValue(False)
+    return expr.map(lambda e: expand_quantifiers(e, threshold))
+
+
+def is_int(expr: Expr) -> bool:
+    if isinstance(expr, (IntValue, AsInt)):
+        return True
+    elif isinstance(expr, Variable):
+        return expr.type_ == INT
+    elif isinstance(expr, BinaryExpr):
+        return is_int(expr.lhs) and is_int(expr.rhs)
+    elif isinstance(expr, UnaryExpr):
+        return is_int(expr.operand)
+    elif isinstance(expr, IfThenElse):
+        return is_int(expr.value_true)
+    elif isinstance(expr, ArraySelect):
+        array = expr.array
+        while isinstance(array, ArrayStore):
+            array = array.array
+        return isinstance(array, Variable) and array.type_ == ArrayType(INT)
+    else:
+        return False
+
+
+def linear_form(expr: Expr) -> Optional[tuple[dict[Expr, int], int]]:
+    """
+    writes an integer expression as `sum(coefficient * atom) + constant`
+    where the atoms are the maximal subexpressions that aren't linear operations
+    """
+    if isinstance(expr, IntValue):
+        return {}, expr.number
+    elif isinstance(expr, UnaryExpr) and expr.operator in ("+", "-"):
+        form = linear_form(expr.operand)
+        if form is None or expr.operator == "+":
+            return form
+        return {atom: -c for atom, c in form[0].items()}, -form[1]
+    elif isinstance(expr, BinaryExpr) and expr.operator in ("+", "-", "*"):
+        lhs, rhs = linear_form(expr.lhs), linear_form(expr.rhs)
+        if lhs is None or rhs is None:
+            return None
+        if expr.operator == "*":
+            if lhs[0] and rhs[0]:
+                return linear_atom(expr)
+            (terms, constant), factor = (lhs, rhs[1]) if lhs[0] else (rhs, lhs[1])
+            return {atom: c * factor for atom, c in terms.items()}, constant * factor
+        sign = 1 if expr.operator == "+" else -1
+        terms = lhs[0].copy()
+        for atom, c in rhs[0].items():
+            terms[atom] = terms.get(atom, 0) + sign * c
+        return terms, lhs[1] + sign * rhs[1]
+    elif is_int(expr):
+        return linear_atom(expr)
+    else:
+        return None
+
+
+def linear_atom(expr: Expr) -> Optional[tuple[dict[Expr, int], int]]:
+    try:
+        hash(expr)
+    except TypeError:
+        # e.g. contains a `ForAll`
+        return None
+    return {expr: 1}, 0
+
+
+def from_linear_form(terms: dict[Expr, int], constant: int) -> Expr:
+    expr: Optional[Expr] = None
+    for atom, c in terms.items():
+        if c == 0:
+            continue
+        term = atom if abs(c) == 1 else BinaryExpr("*", IntValue(abs(c)), atom)
+        if expr is None:
+            expr = term if c > 0 else UnaryExpr("-", term)
+        else:
+            expr = BinaryExpr("+" if c > 0 else "-", expr, term)
+    if expr is None:
+        return IntValue(constant)
+    elif constant == 0:
+        return expr
+    return BinaryExpr("+" if constant > 0 else "-", expr, IntValue(abs(constant)))
+
+
+NEGATED_RELATION = {"==": "!=", "!=": "==", "<": ">=", ">=": "<", ">": "<=", "<=": ">"}
+
+TRUE = BoolValue(True)
+FALSE = BoolValue(False)
+
+
+def simplify(expr: Expr, encoding: Encoding = DEFAULT_ENCODING) -> Expr:
+    """
+    rewrites `expr` into an equivalent (and usually smaller) expression:
+    - constant folding and normalization of linear integer arithmetic
+    - flattening of `And`/`Or`, removal of `True`/`False` operands and of double
+      negations
+    - read-over-write folding: `Store(a, i, v)[j]` is `v` if `i = j` and `a[j]` if
+      `i - j` is a non-zero constant
+    - implications whose conclusions are among their hypotheses fold to `True`
+
+    floating point terms are left as they are since their arithmetic isn't exact,
+    and so is integer arithmetic when ints are encoded as (wrapping) bitvectors
+    shared subexpressions are simplified once
+    """
+    memo: dict[int, Expr] = {}
+
+    def go(expr: Expr) -> Expr:
+        key = id(expr)
+        if key not in memo:
+            memo[key] = simplify_node(expr.map(go), encoding)
+        return memo[key]
+
+    return go(expr)
+
+
+def simplify_node(expr: Expr, encoding: Encoding = DEFAULT_ENCODING) -> Expr:
+    """
+    simplifies the root of `expr`, assuming its children are already simplified
+    """
+    unbounded = encoding.int_mode == "int"
+    if isinstance(expr, (BinaryExpr, UnaryExpr)) and is_int(expr) and unbounded:
+        value = constant_value(expr)
+        if value is not None:
+            return IntValue(value)
+        form = linear_form(expr)
+        if form is None:
+            return expr
+        normalized = from_linear_form(*form)
+        return normalized if normalized.size() <= expr.size() else expr
+    elif isinstance(expr, RelExpr):
+        if isinstance(expr.lhs, BoolValue) and isinstance(expr.rhs, BoolValue):
+            return BoolValue(
+                RelExpr.SYM2OPERATOR[expr.operator](expr.lhs.value, expr.rhs.value)
+            )
+        if not (is_int(expr.lhs) and is_int(expr.rhs) and unbounded):
+            return expr
+        form = linear_form(BinaryExpr("-", expr.lhs, expr.rhs))
+        if form is not None and not any(form[0].values()):
+            return BoolValue(RelExpr.SYM2OPERATOR[expr.operator](form[1], 0))
+        return expr
+    elif isinstance(expr, (And, Or)):
+        unit, zero = (TRUE, FALSE) if isinstance(expr, And) else (FALSE, TRUE)
+        args: list[Expr] = []
+        for arg in expr.args:
+            for a in arg.args if type(arg) is type(expr) else (arg,):
+                if a == zero:
+                    return zero
+                if a != unit and a not in args:
+                    args.append(a)
+        if not args:
+            return unit
+        elif len(args) == 1:
+            return args[0]
+        return type(expr)(tuple(args))
+    elif isinstance(expr, Not):
+        operand = expr.operand
+        if isinstance(operand, BoolValue):
+            return BoolValue(not operand.value)
+        elif isinstance(operand, Not):
+            return operand.operand
+        elif (
+            isinstance(operand, RelExpr)
+            and is_int(operand.lhs)
+            and is_int(operand.rhs)
+        ):
+            return RelExpr(NEGATED_RELATION[operand.operator], operand.lhs, operand.rhs)
+        return expr
+    elif isinstance(expr, Then):
+        if expr.if_ == TRUE:
+            return expr.then
+        elif expr.if_ == FALSE or expr.then == TRUE:
+            return TRUE
+        hypotheses = expr.if_.conjuncts()
+        conclusions = [c for c in expr.then.conjuncts() if c not in hypotheses]
+        if not conclusions:
+            return TRUE
+        elif len(conclusions) < len(expr.then.conjuncts()):
+            return Then(
+                expr.if_,
+                conclusions[0] if len(conclusions) == 1 else And(tuple(conclusions)),
+            )
+        return expr
+    elif isinstance(expr, IfThenElse):
+        if expr.condition == TRUE or expr.value_true == expr.value_false:
+            return expr.value_true
+        elif expr.condition == FALSE:
+            return expr.value_false
+        return expr
+    elif isinstance(expr, ArraySelect) and isinstance(expr.array, ArrayStore):
+        store = expr.array
+        if store.index == expr.index:
+            return store.value
+        if is_int(store.index) and is_int(expr.index):
+            form = linear_form(BinaryExpr("-", store.index, expr.index))
+            if form is not None and not any(form[0].values()):
+                offset = form[1] if unbounded else form[1] % 2**BV_WIDTH
+                if offset == 0:
+                    return store.value
+                return simplify_node(ArraySelect(store.array, expr.index), encoding)
+        return expr
+    elif isinstance(expr, (ForAllRange, ForAll)):
+        if expr.prop == TRUE:
+            return TRUE
+        if isinstance(expr, ForAllRange):
+            start, end = constant_value(expr.range[0]), constant_value(expr.range[1])
+            if start is not None and end is not None and end <= start:
+                return TRUE
+        return expr
+    elif isinstance(expr, Exists):
+        if expr.prop == FALSE:
+            return FALSE
+        if isinstance(expr.domain, tuple):
+            start, end = constant_value(expr.domain[0]), constant_value(expr.domain[1])
+            if start is not None and end is not None and end <= start:
+                return FALSE
+        return expr
+    else:
+        return expr
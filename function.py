@@ -1,13 +1,22 @@
 from __future__ import annotations
+import os
+import sys
+import tempfile
+import threading
+import time
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Iterator, Optional, cast
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Iterable, Iterator, Optional, cast
 
 import z3
 from pygraphviz.agraph import AGraph
-import networkx as nx
 
-from cast import AstNode, AstType
+from absint import seed_facts
+from batch import find_violations
+from bmc import TransitionSystem, bmc
+from cast import AstNode, AstRange, AstType
 from cfg import (
     AssertNode,
     AssignmentNode,
@@ -17,9 +26,14 @@ from cfg import (
     CondNode,
     DummyNode,
     EndNode,
+    PathBudgetExceeded,
+    SliceStats,
     StartNode,
     create_cfg,
+    get_cutpoints,
+    get_nodes,
     get_paths,
+    insert_assert,
 )
 from expr import (
     And,
@@ -33,8 +47,19 @@ from expr import (
     Predicate,
     Prop,
     Then,
+    DEFAULT_ENCODING,
+    Encoding,
+    ForAllRange,
     Variable,
+    expand_quantifiers,
+    get_logic,
+    simplify,
 )
+from houdini import infer_invariants
+from interp import falsify
+from kinduction import CutpointSystem, kinduction
+from merged import get_merged_proof_rule
+from smt2 import parse_props, write_smt2
 
 
 @dataclass(frozen=True)
@@ -53,6 +78,17 @@ class Unknown(Fail):
     code: int
 
 
+@dataclass(frozen=True)
+class Timeout(Unknown):
+    """
+    z3 ran out of the time or memory of the options (see `Options.timeout`), or
+    the check was cancelled
+    """
+
+    # the reason z3 gave
+    reason: str = "timeout"
+
+
 @dataclass(frozen=True)
 class Ok(CheckResult):
     def is_ok(self) -> bool:
@@ -90,7 +126,445 @@ class HornFail(Fail):
 
 @dataclass(frozen=True)
 class CounterExample(Fail):
-    model: z3.ModelRef
+    # the printed value of each declaration of the model, z3 models can't outlive
+    # their context or be sent to other processes
+    model: dict[str, str]
+
+    @staticmethod
+    def from_z3(model: z3.ModelRef) -> CounterExample:
+        return CounterExample({d.name(): str(model[d]) for d in model.decls()})
+
+
+@dataclass(frozen=True)
+class ConcreteCounterExample(CounterExample):
+    """
+    inputs on which running the function fails an assertion, found without z3
+    """
+
+    # the location of the assertion that failed
+    location: Optional[AstRange]
+
+
+@dataclass(frozen=True)
+class TraceStep:
+    location: Optional[AstRange]
+    values: dict[str, str]
+
+
+@dataclass(frozen=True)
+class BmcCounterExample(CounterExample):
+    """
+    an execution that fails an assertion, found by bounded model checking
+    `model` holds the inputs and `trace` the location and values of each step
+    """
+
+    trace: list[TraceStep]
+
+
+@dataclass(frozen=True)
+class Bounded(CheckResult):
+    """
+    no execution of at most `depth` steps fails an assertion, longer ones may
+    """
+
+    depth: int
+
+
+# tactic pipelines used instead of the default solvers of these logics
+TACTICS: dict[str, tuple[str, ...]] = {
+    "QF_BV": ("simplify", "solve-eqs", "bit-blast", "sat"),
+    "QF_BVFP": ("simplify", "fpa2bv", "simplify", "solve-eqs", "bit-blast", "sat"),
+    "QF_FP": ("simplify", "fpa2bv", "simplify", "solve-eqs", "bit-blast", "sat"),
+}
+
+
+# what z3 says when it gives up because of a limit or an interruption
+BUDGET_REASONS = ("timeout", "canceled", "memory", "limit")
+
+
+@dataclass(frozen=True)
+class Budget:
+    """
+    the time left to a request and whether it was cancelled (e.g. because its
+    client went away), obligations get at most the time that's left and the
+    queries that are running when it's cancelled are interrupted
+    """
+
+    # the `time.monotonic()` the request has to be done by
+    deadline: Optional[float] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    # the contexts of the running queries
+    contexts: dict[int, z3.Context] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @staticmethod
+    def of(seconds: Optional[float]) -> Budget:
+        return Budget(None if seconds is None else time.monotonic() + seconds)
+
+    def remaining(self) -> Optional[float]:
+        """
+        the seconds that are left, `None` if there's no deadline
+        """
+        if self.cancelled.is_set():
+            return 0.0
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def is_over(self) -> bool:
+        return self.remaining() == 0.0
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock:
+            for ctx in self.contexts.values():
+                ctx.interrupt()
+
+    @contextmanager
+    def watch(self, ctx: z3.Context) -> Iterator[None]:
+        """
+        interrupts `ctx` if the budget is cancelled while in the `with` block
+        """
+        with self.lock:
+            self.contexts[id(ctx)] = ctx
+        try:
+            if self.cancelled.is_set():
+                ctx.interrupt()
+            yield
+        finally:
+            with self.lock:
+                self.contexts.pop(id(ctx), None)
+
+
+@dataclass(frozen=True)
+class Options:
+    """
+    transformations applied to proof rules before they're sent to z3
+    """
+
+    # quantifiers over constant ranges of at most this many integers are expanded
+    expand_threshold: Optional[int] = None
+    # proof rules are simplified and the ones that fold to `True` aren't sent to z3
+    simplify: bool = False
+    # paths bind assigned values to SSA variables instead of substituting them
+    lazy: bool = False
+    # proof rules are emitted as SMT-LIB2 and parsed by z3 in a single batch
+    smt2: bool = False
+    # each proof rule is solved by a solver specialized for its logic
+    select_logic: bool = False
+    # before z3 is called the function is run on this many random inputs, a run
+    # that fails an assertion is returned as a `ConcreteCounterExample`, and paths
+    # are checked on as many inputs (see `Function.get_violations()`)
+    falsify: int = 0
+    encoding: Encoding = DEFAULT_ENCODING
+    # budgets on the paths that are enumerated (see `get_paths()`), the proof rule
+    # of `Function.check()` merges paths (see merged.py) instead of going over them
+    # and the methods that check paths one by one raise `PathBudgetExceeded`
+    max_paths: Optional[int] = None
+    # the number of nodes of the proof rules of the paths
+    max_vc_size: Optional[int] = None
+    # the proof rule of `Function.check()` merges paths regardless of budgets
+    merge: bool = False
+    # the milliseconds z3 may spend on each obligation (query)
+    timeout: Optional[int] = None
+    # the megabytes of memory z3 may use on each obligation
+    max_memory: Optional[int] = None
+    # the budget of the whole request, obligations get at most what's left of it
+    # it doesn't count in comparisons, so `PathCache` keys don't depend on it
+    budget: Optional[Budget] = field(default=None, compare=False)
+
+    def prepare(self, prop: Expr) -> Expr:
+        if self.expand_threshold is not None:
+            prop = expand_quantifiers(prop, self.expand_threshold)
+        if self.simplify:
+            prop = simplify(prop, self.encoding)
+        return prop
+
+    def to_z3(self, prop: Expr) -> z3.BoolRef:
+        return self.encode(self.prepare(prop))
+
+    def get_paths(self, cfg: CfgNode) -> Iterator[BasicPath]:
+        return get_paths(cfg, self.lazy, self.max_paths, self.max_vc_size)
+
+    def encode(self, prop: Expr) -> z3.BoolRef:
+        """
+        translates the (prepared) `prop` into z3
+        """
+        if self.smt2:
+            return parse_props([prop], self.encoding)[0]
+        return prop.as_z3(self.encoding)
+
+    def get_solver(self, prop: Expr) -> z3.Solver:
+        """
+        a solver for the (prepared) `prop`
+        """
+        ctx = self.encoding.ctx
+        if not self.select_logic:
+            return self.limit(z3.Solver(ctx=ctx))
+        logic = get_logic(prop, self.encoding)
+        if logic in TACTICS:
+            return self.limit(z3.Then(*TACTICS[logic], ctx=ctx).solver())
+        return self.limit(z3.SolverFor(logic, ctx=ctx))
+
+    def get_timeout(self) -> Optional[int]:
+        """
+        the milliseconds the next obligation may take
+        """
+        remaining = None if self.budget is None else self.budget.remaining()
+        if remaining is None:
+            return self.timeout
+        # z3 takes 0 for no timeout
+        remaining_ms = max(1, int(remaining * 1000))
+        return remaining_ms if self.timeout is None else min(self.timeout, remaining_ms)
+
+    def limit(self, solver: z3.Solver) -> z3.Solver:
+        """
+        sets the limits of the options on `solver`
+        """
+        timeout = self.get_timeout()
+        if timeout is not None:
+            solver.set("timeout", timeout)
+        if self.max_memory is not None:
+            solver.set("max_memory", self.max_memory)
+        return solver
+
+    def check(self, solver: z3.Solver, *assumptions: z3.BoolRef) -> z3.CheckSatResult:
+        """
+        `solver.check(*assumptions)`, interrupted if the budget is cancelled
+        meanwhile and `unknown` without checking once it's over
+        """
+        if self.budget is None:
+            return solver.check(*assumptions)
+        if self.budget.is_over():
+            return z3.unknown
+        with self.budget.watch(solver.ctx):
+            return solver.check(*assumptions)
+
+    def get_unknown(self, solver: z3.Solver) -> Unknown:
+        """
+        the result of a `solver` that answered `unknown`
+        """
+        if self.budget is not None and self.budget.is_over():
+            cancelled = self.budget.cancelled.is_set()
+            return Timeout(z3.unknown.r, "canceled" if cancelled else "timeout")
+        reason = solver.reason_unknown()
+        if any(r in reason for r in BUDGET_REASONS):
+            return Timeout(z3.unknown.r, reason)
+        return Unknown(z3.unknown.r)
+
+    def in_context(self, ctx: z3.Context) -> Options:
+        return replace(self, encoding=replace(self.encoding, ctx=ctx))
+
+    @staticmethod
+    def from_json(options: dict[str, Any], ctx: Optional[z3.Context] = None) -> Options:
+        """
+        the options of a request to the web interface or to the daemon
+        """
+        return Options(
+            expand_threshold=options.get("expand_threshold", None),
+            simplify=bool(options.get("simplify", False)),
+            lazy=bool(options.get("lazy", False)),
+            select_logic=bool(options.get("select_logic", False)),
+            falsify=int(options.get("falsify", 0)),
+            encoding=Encoding(
+                triggers=bool(options.get("triggers", False)),
+                float_mode=options.get("float_mode", "fp"),
+                int_mode=options.get("int_mode", "int"),
+                ctx=ctx,
+            ),
+            max_paths=options.get("max_paths", None),
+            max_vc_size=options.get("max_vc_size", None),
+            merge=bool(options.get("merge", False)),
+            timeout=get_positive_int(options, "timeout"),
+            max_memory=get_positive_int(options, "max_memory"),
+        )
+
+
+def get_positive_int(options: dict[str, Any], key: str) -> Optional[int]:
+    value = options.get(key, None)
+    # bools are ints
+    if value is not None and (type(value) is not int or value <= 0):
+        raise ValueError(f"{key} must be a positive integer, not {value!r}")
+    return value
+
+
+_contexts: list[z3.Context] = []
+_contexts_lock = threading.Lock()
+
+
+@contextmanager
+def z3_context() -> Iterator[z3.Context]:
+    """
+    lends a z3 context to the current thread, z3 contexts aren't thread-safe
+    contexts are recycled rather than freed since z3 may crash when the garbage
+    collector frees a context before the terms that were created in it
+    """
+    with _contexts_lock:
+        if _contexts:
+            ctx = _contexts.pop()
+        else:
+            ctx = z3.Context()
+            # the garbage collector may release terms on any thread
+            z3.Z3_enable_concurrent_dec_ref(ctx.ref())
+    try:
+        yield ctx
+    finally:
+        with _contexts_lock:
+            _contexts.append(ctx)
+
+
+@dataclass(frozen=True)
+class PathReport:
+    path: BasicPath
+    logic: str
+    # solving time in seconds
+    time: float
+    valid: bool
+    # the report is that of an earlier version of the path (see `PathCache`)
+    reused: bool = False
+    # z3 ran out of its budget on the path (see `Timeout`), `valid` is false then
+    timeout: bool = False
+
+
+@dataclass(frozen=True)
+class PathCache:
+    """
+    the reports of the paths that were checked, by the fingerprint of the path and
+    the options, a path that only changed in its source locations reuses the
+    report of its previous version
+    """
+
+    reports: dict[tuple[str, Options], PathReport] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # the oldest reports are dropped beyond this many
+    size: int = 4096
+
+    @staticmethod
+    def get_key(path: BasicPath, options: Options) -> tuple[str, Options]:
+        # the context doesn't change results
+        encoding = replace(options.encoding, ctx=None)
+        options = replace(options, encoding=encoding, budget=None)
+        return path.fingerprint(), options
+
+    def get(self, path: BasicPath, options: Options) -> Optional[PathReport]:
+        with self.lock:
+            report = self.reports.get(self.get_key(path, options))
+        if report is None:
+            return None
+        return replace(report, path=path, reused=True)
+
+    def put(self, report: PathReport, options: Options):
+        with self.lock:
+            self.reports[self.get_key(report.path, options)] = report
+            while len(self.reports) > self.size:
+                del self.reports[next(iter(self.reports))]
+
+
+# stderr is redirected for the whole process while quantifiers are profiled
+_stderr_lock = threading.Lock()
+
+
+def check_with_quantifier_stats(
+    solver: z3.Solver,
+) -> tuple[z3.CheckSatResult, dict[str, int]]:
+    """
+    checks `solver` and returns the number of instantiations of each quantifier
+    (by its qid), which z3 only reports on stderr
+    note that stderr is redirected for the whole process while solving, so only
+    one thread profiles at a time
+    """
+    solver.set("qi.profile", True)
+    with _stderr_lock, tempfile.TemporaryFile() as output:
+        sys.stderr.flush()
+        stderr = os.dup(2)
+        os.dup2(output.fileno(), 2)
+        try:
+            result = solver.check()
+        finally:
+            os.dup2(stderr, 2)
+            os.close(stderr)
+        output.seek(0)
+        lines = output.read().decode().splitlines()
+    stats: dict[str, int] = defaultdict(int)
+    for line in lines:
+        if line.startswith("[quantifier_instances]"):
+            qid, count, *_ = line[len("[quantifier_instances]") :].split(":")
+            stats[qid.strip()] += int(count)
+    return result, dict(stats)
+
+
+def check_validity(prop: Expr, options: Options = Options()) -> CheckResult:
+    """
+    `Ok` if `prop` is valid, the `Unknown` of `Options.get_unknown()` if z3 gave
+    up on it and `Fail` otherwise
+    """
+    prop = options.prepare(prop)
+    if prop == BoolValue(True):
+        return Ok()
+    solver = options.get_solver(prop)
+    solver.add(z3.Not(options.encode(prop)))
+    return get_validity(solver, options)
+
+
+def get_validity(solver: z3.Solver, options: Options) -> CheckResult:
+    """
+    checks the negation of a proof rule that was added to `solver`
+    """
+    result = options.check(solver)
+    if result == z3.unsat:
+        return Ok()
+    if result == z3.unknown:
+        return options.get_unknown(solver)
+    return Fail()
+
+
+def is_valid(prop: Expr, options: Options = Options()) -> bool:
+    return check_validity(prop, options).is_ok()
+
+
+def check_validity_smt2(
+    props: list[Expr], options: Options = Options()
+) -> list[CheckResult]:
+    """
+    checks the validity of `props` (see `check_validity()`) after translating all
+    of them into z3 with a single call to the SMT-LIB2 parser
+    """
+    props = [options.prepare(prop) for prop in props]
+    pending = [prop for prop in props if prop != BoolValue(True)]
+    queries = iter(parse_props(pending, options.encoding))
+    results: list[CheckResult] = []
+    for prop in props:
+        if prop == BoolValue(True):
+            results.append(Ok())
+            continue
+        solver = options.get_solver(prop)
+        solver.add(z3.Not(next(queries)))
+        results.append(get_validity(solver, options))
+    return results
+
+
+def check_validity_parallel(
+    props: list[Expr], workers: Optional[int] = None, options: Options = Options()
+) -> list[CheckResult]:
+    """
+    checks the validity of `props` (see `check_validity()`) on a pool of threads
+    each query is translated and solved in a z3 context of its own thread, z3
+    releases the GIL while solving
+    """
+
+    def check(prop: Expr) -> CheckResult:
+        with z3_context() as ctx:
+            return check_validity(prop, options.in_context(ctx))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(check, props))
+
+
+def get_quantifiers(prop: Expr) -> list[ForAllRange]:
+    quantifiers = [prop] if isinstance(prop, ForAllRange) else []
+    for child in prop.children():
+        quantifiers.extend(get_quantifiers(child))
+    return quantifiers
 
 
 @dataclass(frozen=True)
@@ -234,7 +708,7 @@ class BaseFunction:
                     color="purple",
                     label="assert",
                     shape="house",
-                    content=f"{node.assertion}",
+                    content=f"{node.get_assertion()}",
                 )
                 graph.add_edge(id_, get_id(node.next_node))
                 traverse(node.next_node)
@@ -259,47 +733,362 @@ class BaseFunction:
 
         graph.draw(path=filepath, prog="dot")
 
+    def check_kinduction(
+        self, max_k: int = 10, options: Options = Options()
+    ) -> CheckResult:
+        """
+        k-induction over the basic paths between cut points, the loop invariants
+        that are given are used as (possibly non-inductive) strengthenings
+        returns `Bounded(max_k)` if the assertions aren't `max_k`-inductive
+        """
+        system = CutpointSystem.from_paths(
+            list(get_paths(self.cfg)), self.params + self.vars
+        )
+        result, k, model = kinduction(system, max_k, options)
+        if isinstance(result, Unknown):
+            return result
+        elif result == z3.sat:
+            assert model is not None
+            trace = [
+                TraceStep(node.code_location, values)
+                for node, values in system.get_trace(model, k, options.encoding)
+            ]
+            return BmcCounterExample(trace[0].values, trace)
+        elif result == z3.unsat:
+            return Ok()
+        else:
+            return Bounded(max_k)
+
+    def seed_invariants(self) -> int:
+        """
+        adds the bounds that abstract interpretation finds at the cut points of the
+        CFG to them, so that spacer and path checks don't have to rediscover them
+        they assume unbounded ints, i.e. the "int" `int_mode`
+        returns the number of facts added
+        """
+        return seed_facts(self.cfg)
+
 
 @dataclass(frozen=True)
 class Function(BaseFunction):
-    def get_proof_rule(self) -> Expr:
-        rule = And(tuple(path.get_proof_rule() for path in get_paths(self.cfg)),)
+    def get_proof_rule(self, options: Options = Options()) -> Expr:
+        """
+        the conjunction of the proof rules of the paths, or their merged proof rule
+        if `options` asks for it or the paths go over its budgets
+        """
+        if options.merge:
+            return get_merged_proof_rule(self.cfg, self.params + self.vars)
+        try:
+            rule = And(
+                tuple(path.get_proof_rule() for path in options.get_paths(self.cfg))
+            )
+        except PathBudgetExceeded:
+            return get_merged_proof_rule(self.cfg, self.params + self.vars)
         if self.vars:
             return ForAll(self.vars, rule)
         else:
             return rule
 
-    def get_failing_paths(self) -> Iterator[BasicPath]:
-        for path in get_paths(self.cfg):
-            prop = path.get_proof_rule()
-            solver = z3.Solver()
-            solver.add(z3.Not(prop.as_z3()))
-            if solver.check().r != -1:
-                yield path
+    def get_failing_paths(
+        self,
+        sliced: bool = False,
+        options: Options = Options(),
+        workers: Optional[int] = None,
+    ) -> Iterator[BasicPath]:
+        """
+        the paths of `get_failing_path_results()`
+        """
+        for path, _ in self.get_failing_path_results(sliced, options, workers):
+            yield path
+
+    def get_failing_path_results(
+        self,
+        sliced: bool = False,
+        options: Options = Options(),
+        workers: Optional[int] = None,
+    ) -> Iterator[tuple[BasicPath, CheckResult]]:
+        """
+        yields each path whose proof rule isn't valid along with the result of its
+        check, a `Timeout` if z3 ran out of its budget on it
+        if `sliced` is set each path is first checked after cone-of-influence slicing
+        and only paths whose sliced proof rule fails are checked in full
+        if `workers` is set the paths are checked in parallel on that many threads
+        if `options.falsify` is set paths that fail on random inputs skip z3
+        """
+        paths: Iterable[BasicPath] = options.get_paths(self.cfg)
+        if options.falsify:
+            # paths whose proof rule fails on a sampled state don't need z3
+            paths = list(paths)
+            models = self.get_violations(paths, options)
+            failing = [p for p, model in zip(paths, models) if model is not None]
+            yield from ((path, Fail()) for path in failing)
+            paths = [p for p, model in zip(paths, models) if model is None]
+        if workers is not None:
+            paths = list(paths)
+            if sliced:
+                rules = [path.slice()[0].get_proof_rule() for path in paths]
+                results = check_validity_parallel(rules, workers, options)
+                paths = [path for path, r in zip(paths, results) if not r.is_ok()]
+            rules = [path.get_proof_rule() for path in paths]
+            results = check_validity_parallel(rules, workers, options)
+            yield from ((path, r) for path, r in zip(paths, results) if not r.is_ok())
+            return
+        if options.smt2 and not sliced:
+            paths = list(paths)
+            rules = [path.get_proof_rule() for path in paths]
+            results = check_validity_smt2(rules, options)
+            yield from ((path, r) for path, r in zip(paths, results) if not r.is_ok())
+            return
+        for path in paths:
+            if sliced and is_valid(path.slice()[0].get_proof_rule(), options):
+                continue
+            result = check_validity(path.get_proof_rule(), options)
+            if not result.is_ok():
+                yield path, result
+
+    def get_violations(
+        self, paths: list[BasicPath], options: Options = Options()
+    ) -> list[Optional[dict[str, str]]]:
+        """
+        evaluates the proof rules of `paths` on the same `options.falsify` random
+        inputs at once, returns for each path the values of an input that violates
+        its proof rule if one was found
+        """
+        return find_violations(
+            paths,
+            self.params + self.vars,
+            options.falsify,
+            options.encoding,
+        )
+
+    def get_failing_conjuncts(
+        self, workers: Optional[int] = None, options: Options = Options()
+    ) -> Iterator[tuple[BasicPath, list[tuple[Expr, CheckResult]]]]:
+        """
+        checks every conjunct of every path's `assertion_end` as an independent
+        obligation and yields each failing path along with its failing conjuncts
+        and the results of their checks, a `Timeout` if z3 ran out of its budget
+        """
+        paths = list(options.get_paths(self.cfg))
+        obligations = [
+            (path, obligation) for path in paths for obligation in path.split()
+        ]
+        results = check_validity_parallel(
+            [obligation.get_proof_rule() for _, obligation in obligations],
+            workers,
+            options,
+        )
+        failing: dict[int, list[tuple[Expr, CheckResult]]] = defaultdict(list)
+        for (path, obligation), result in zip(obligations, results):
+            if not result.is_ok():
+                assert obligation.assertion_end is not None
+                failing[id(path)].append((obligation.assertion_end, result))
+        for path in paths:
+            if id(path) in failing:
+                yield path, failing[id(path)]
+
+    def check_split(
+        self, workers: Optional[int] = None, options: Options = Options()
+    ) -> CheckResult:
+        if next(self.get_failing_conjuncts(workers, options), None) is None:
+            return Ok()
+        else:
+            return Fail()
+
+    def dump_smt2(self, directory: str, options: Options = Options()) -> list[str]:
+        """
+        writes one standalone SMT-LIB2 query per basic path into `directory` so
+        that slow or failing obligations can be replayed offline
+        """
+        filenames = []
+        for i, path in enumerate(options.get_paths(self.cfg)):
+            filename = os.path.join(directory, f"{self.name}_{i}.smt2")
+            prop = options.prepare(path.get_proof_rule())
+            write_smt2(filename, [prop], options.encoding)
+            filenames.append(filename)
+        return filenames
+
+    def get_path_reports(
+        self, options: Options = Options(), cache: Optional[PathCache] = None
+    ) -> list[PathReport]:
+        """
+        checks every path and reports the logic of its proof rule along with the
+        time it took to solve
+        with a `cache` only the paths it has no report for are checked
+        """
+        paths = list(options.get_paths(self.cfg))
+        reports: list[Optional[PathReport]] = [
+            cache.get(path, options) if cache is not None else None for path in paths
+        ]
+        todo = [path for path, report in zip(paths, reports) if report is None]
+        models: list[Optional[dict[str, str]]] = [None] * len(todo)
+        if options.falsify:
+            models = self.get_violations(todo, options)
+        new_reports = iter(
+            self.get_path_report(path, model, options)
+            for path, model in zip(todo, models)
+        )
+        for index, report in enumerate(reports):
+            if report is None:
+                reports[index] = report = next(new_reports)
+                # another try may have more time
+                if cache is not None and not report.timeout:
+                    cache.put(report, options)
+        return cast("list[PathReport]", reports)
+
+    def get_path_report(
+        self, path: BasicPath, model: Optional[dict[str, str]], options: Options
+    ) -> PathReport:
+        prop = options.prepare(path.get_proof_rule())
+        logic = get_logic(prop, options.encoding)
+        start = time.perf_counter()
+        timeout = False
+        if model is not None:
+            valid = False
+        elif prop == BoolValue(True):
+            valid = True
+        elif options.budget is not None and options.budget.is_over():
+            # obligations aren't started past the budget of the request
+            valid, timeout = False, True
+        else:
+            solver = options.get_solver(prop)
+            solver.add(z3.Not(options.encode(prop)))
+            result = options.check(solver)
+            valid = result.r == -1
+            if result == z3.unknown:
+                timeout = isinstance(options.get_unknown(solver), Timeout)
+        elapsed = time.perf_counter() - start
+        return PathReport(path, logic, elapsed, valid, timeout=timeout)
+
+    def get_slice_stats(self, options: Options = Options()) -> list[SliceStats]:
+        return [path.slice()[1] for path in options.get_paths(self.cfg)]
+
+    def get_failing_paths_hoisted(
+        self, options: Options = Options()
+    ) -> Iterator[BasicPath]:
+        """
+        like `get_failing_paths()` but the remembered facts that are in scope at the
+        start of a path are asserted once per solver session (one session per scope)
+        instead of being conjoined into the proof rule of every path
+        """
+        solvers: dict[tuple[int, ...], z3.Solver] = {}
+        for path in options.get_paths(self.cfg):
+            background, obligations = path.get_hoisted_proof_rule()
+            key = tuple(id(fact) for fact in background)
+            if key not in solvers:
+                solvers[key] = z3.Solver(ctx=options.encoding.ctx)
+                solvers[key].add(
+                    *(options.to_z3(fact) for fact in background)
+                )
+            solver = solvers[key]
+            for obligation in map(options.prepare, obligations):
+                if obligation == BoolValue(True):
+                    continue
+                solver.push()
+                solver.add(z3.Not(options.encode(obligation)))
+                result = options.check(options.limit(solver))
+                solver.pop()
+                if result.r != -1:
+                    yield path
+                    break
+
+    def check_hoisted(self, options: Options = Options()) -> CheckResult:
+        if next(self.get_failing_paths_hoisted(options), None) is None:
+            return Ok()
+        else:
+            return Fail()
+
+    def get_quantifier_stats(
+        self, options: Options = Options()
+    ) -> list[tuple[BasicPath, dict[str, int]]]:
+        """
+        checks every path and returns the number of instantiations of each of the
+        (range) quantifiers in its proof rule
+        """
+        stats = []
+        for path in options.get_paths(self.cfg):
+            prop = options.prepare(path.get_proof_rule())
+            quantifiers = {q.get_qid(): q for q in get_quantifiers(prop)}
+            solver = options.get_solver(prop)
+            solver.add(z3.Not(options.encode(prop)))
+            _, instantiations = check_with_quantifier_stats(solver)
+            stats.append(
+                (
+                    path,
+                    {
+                        str(quantifiers[qid]): count
+                        for qid, count in instantiations.items()
+                        if qid in quantifiers
+                    },
+                )
+            )
+        return stats
 
     def get_failing_props(self) -> Iterator[Expr]:
         for path in self.get_failing_paths():
             yield path.get_proof_rule()
 
-    def check(self) -> CheckResult:
+    def check(self, options: Options = Options()) -> CheckResult:
         """
         checks whether the function's proof rule is satisfiable
         if it is, `check()` returns an `Ok`/`HornOk` object
         otherwise, `check()` returns a `CounterExample`/`Unknown`/`HornFail` object
         """
 
-        solver = z3.Solver()
-        solver.add(z3.Not(self.get_proof_rule().as_z3()))
-        result = solver.check()
+        if options.falsify:
+            found = falsify(
+                self.cfg, self.params + self.vars, options.falsify, options.encoding
+            )
+            if found is not None:
+                inputs, node = found
+                model = {var: str(value) for var, value in inputs.items()}
+                return ConcreteCounterExample(model, node.code_location)
+        rule = options.prepare(self.get_proof_rule(options))
+        if rule == BoolValue(True):
+            return Ok()
+        solver = options.get_solver(rule)
+        solver.add(z3.Not(options.encode(rule)))
+        result = options.check(solver)
         if result.r == 1:
-            return CounterExample(solver.model())
+            return CounterExample.from_z3(solver.model())
         elif result.r == -1:
             return Ok()
         else:
-            return Unknown(result.r)
+            return options.get_unknown(solver)
+
+    def check_bmc(
+        self, max_depth: int = 100, options: Options = Options()
+    ) -> CheckResult:
+        """
+        bounded model checking: looks for executions of at most `max_depth` steps
+        (one step per CFG node) that fail an assertion, loops need no invariants
+        returns `Ok` if every execution ends within `max_depth` steps
+        """
+        system = TransitionSystem.from_cfg(self.cfg, self.params + self.vars)
+        result, depth, model = bmc(system, max_depth, options)
+        if isinstance(result, Unknown):
+            return result
+        elif result == z3.sat:
+            assert model is not None
+            trace = [
+                TraceStep(node.code_location, values)
+                for node, values in system.get_trace(model, depth, options.encoding)
+            ]
+            return BmcCounterExample(trace[0].values, trace)
+        elif result == z3.unsat:
+            return Ok()
+        else:
+            return Bounded(max_depth)
+
+    def infer_invariants(self, options: Options = Options()) -> list[AssertNode]:
+        """
+        cuts the loops that have no invariant with assertions of the template
+        invariants that survive Houdini, `check()` then proves the function with them
+        """
+        return infer_invariants(self.cfg, self.params + self.vars, options)
 
-    def check_iter(self) -> CheckResult:
-        if next(self.get_failing_paths(), None) is None:
+    def check_iter(self, options: Options = Options()) -> CheckResult:
+        if next(self.get_failing_paths(options=options), None) is None:
             return Ok()
         else:
             return Fail()
@@ -318,8 +1107,8 @@ class HornFunction(BaseFunction):
             for path in get_paths(self.cfg)
         ]
 
-    def make_solver(self) -> z3.Solver:
-        solver = z3.SolverFor("HORN")
+    def make_solver(self, options: Options = Options()) -> z3.Solver:
+        solver = options.limit(z3.SolverFor("HORN"))
         solver.set("engine", "spacer")
         # allow quantified variables in pobs
         solver.set("spacer.ground_pobs", False)
@@ -329,9 +1118,12 @@ class HornFunction(BaseFunction):
             solver.add(p.as_z3())
         return solver
 
-    def check(self) -> CheckResult:
-        solver = self.make_solver()
-        result = solver.check()
+    def check(self, options: Options = Options()) -> CheckResult:
+        """
+        only the limits of `options` apply, spacer runs in z3's global context
+        """
+        solver = self.make_solver(options)
+        result = options.check(solver)
         if result.r == 1:
             model = solver.model()
             invariants: list[HornInvariant] = []
@@ -356,68 +1148,18 @@ class HornFunction(BaseFunction):
         elif result.r == -1:
             return HornFail()
         else:
-            return Unknown(result.r)
+            return options.get_unknown(solver)
 
     def set_cutpoints(self):
-        graph = nx.DiGraph()
-        id2node: dict[int, CfgNode] = {}
-
-        def get_id(node: CfgNode) -> int:
-            return id(node)
-
         vars = self.vars + self.params
         sorts = [v.type_.as_z3() for v in vars]
 
-        def traverse(node: CfgNode):
-            id_ = get_id(node)
-            if id_ in id2node:
-                return
-            id2node[id_] = node
+        for node in get_nodes(self.cfg):
             if isinstance(node, AssertNode):
-                self.partial_invariants.append(node.assertion)
+                self.partial_invariants.append(node.get_assertion())
                 self.cutpoints.append(node)
-                traverse(node.next_node)
-            elif isinstance(node, (StartNode, AssignmentNode, AssumeNode)):
-                graph.add_node(id_,)
-                graph.add_edge(id_, get_id(node.next_node))
-                traverse(node.next_node)
-            elif isinstance(node, CondNode):
-                graph.add_node(id_,)
-                graph.add_edge(id_, get_id(node.true_br))
-                graph.add_edge(id_, get_id(node.false_br))
-                traverse(node.true_br)
-                traverse(node.false_br)
-            elif isinstance(node, EndNode):
-                graph.add_node(id_,)
-            elif isinstance(node, DummyNode):
-                graph.add_node(id_)
-            else:
-                assert False
-
-        traverse(self.cfg)
-
-        cycles = list(nx.simple_cycles(graph))
-        node2cycle: dict[int, set[int]] = defaultdict(set)
-        for i, c in enumerate(cycles):
-            for n in c:
-                node2cycle[n].add(i)
-
-        cutpoints: list[int] = []
-        while node2cycle:
-            point = max(node2cycle, key=lambda n: len(node2cycle[n]))
-            cutpoints.append(point)
-            for i in node2cycle[point]:
-                for n in cycles[i]:
-                    if n == point:
-                        continue
-                    node2cycle[n].remove(i)
-                    if not node2cycle[n]:
-                        del node2cycle[n]
-            del node2cycle[point]
-
-        for cp in cutpoints:
-            node_cp = id2node[cp]
 
+        for cp in get_cutpoints(self.cfg):
             invariant = Predicate(
                 name=f"P{len(self.invariants)}",
                 arguments=cast("list[Expr]", vars),
@@ -425,21 +1167,7 @@ class HornFunction(BaseFunction):
                 vars=vars,
             )
             self.invariants.append(invariant)
-            new_node = AssertNode(node_cp.code_location, invariant, node_cp)
-            self.cutpoints.append(new_node)
-            for n in graph.predecessors(cp):
-                node = id2node[n]
-                if isinstance(
-                    node, (AssertNode, AssignmentNode, StartNode, AssumeNode),
-                ):
-                    node.next_node = new_node
-                elif isinstance(node, CondNode):
-                    if node.true_br is node_cp:
-                        node.true_br = new_node
-                    else:
-                        node.false_br = new_node
-                else:
-                    assert False, f"unexpected node of type {type(node)}"
+            self.cutpoints.append(insert_assert(self.cfg, cp, invariant))
 
     @classmethod
     def from_ast(cls, filename: str, ast: AstNode) -> HornFunction:
@@ -0,0 +1,244 @@
+from __future__ import annotations
+from itertools import product
+from typing import TYPE_CHECKING, Iterator, Optional
+
+import z3
+
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    BasicPath,
+    CfgNode,
+    CondNode,
+    EndNode,
+    StartNode,
+    get_cutpoints,
+    get_nodes,
+    get_paths,
+    insert_assert,
+)
+from expr import (
+    And,
+    ArraySelect,
+    ArrayStore,
+    ArrayType,
+    BinaryExpr,
+    BoolValue,
+    DEFAULT_ENCODING,
+    Encoding,
+    Expr,
+    ForAllRange,
+    INT,
+    IntValue,
+    RelExpr,
+    Variable,
+)
+
+if TYPE_CHECKING:
+    from function import Options
+
+# the bound variable of the array templates
+INDEX = Variable("@k", INT)
+
+
+def get_exprs(node: CfgNode) -> list[Optional[Expr]]:
+    if isinstance(node, StartNode):
+        return [node.requires]
+    elif isinstance(node, EndNode):
+        return [node.assertion]
+    elif isinstance(node, CondNode):
+        return [node.condition]
+    elif isinstance(node, AssignmentNode):
+        return [node.var, node.expression]
+    elif isinstance(node, AssumeNode):
+        return [node.expression]
+    elif isinstance(node, AssertNode):
+        return [node.assertion]
+    return []
+
+
+def get_subexprs(expr: Expr) -> Iterator[Expr]:
+    yield expr
+    for child in expr.children():
+        yield from get_subexprs(child)
+
+
+def get_candidates(
+    cfg: CfgNode, vars: list[Variable], encoding: Encoding = DEFAULT_ENCODING
+) -> list[Expr]:
+    """
+    instances of the templates over the int variables and the int constants of
+    `cfg`:
+    - `a <= b` and `a < b` for terms `a` and `b`
+    - for an int array `arr` and a variable `i` that indexes some array, over
+      `0 <= k < i`: `arr[k] op t` for a term `t`, `arr[k] == other[k]`, and
+      `arr[k - 1] <= arr[k]` (sortedness) over `1 <= k < i`
+    the array templates are left out with bitvectors, z3 doesn't respect timeouts
+    on quantified bitvector queries
+    """
+    ints = [v for v in vars if v.type_ == INT]
+    arrays = [v for v in vars if v.type_ == ArrayType(INT)]
+    names = {v.var for v in ints}
+    constants = {0}
+    indices: set[str] = set()
+    for node in get_nodes(cfg):
+        for expr in get_exprs(node):
+            for e in get_subexprs(expr) if expr is not None else ():
+                if isinstance(e, IntValue):
+                    constants.add(e.number)
+                elif isinstance(e, (ArraySelect, ArrayStore)):
+                    index = e.index
+                    if isinstance(index, Variable) and index.var in names:
+                        indices.add(index.var)
+    terms: list[Expr] = [*ints, *(IntValue(c) for c in sorted(constants))]
+
+    candidates: list[Expr] = []
+    for a, b in product(terms, terms):
+        if a != b and (isinstance(a, Variable) or isinstance(b, Variable)):
+            candidates += [RelExpr("<=", a, b), RelExpr("<", a, b)]
+    if encoding.int_mode != "int":
+        return candidates
+    for array, i in product(arrays, (v for v in ints if v.var in indices)):
+        element = ArraySelect(array, INDEX)
+        props: list[Expr] = [
+            RelExpr(op, element, t) for t in terms for op in ("<=", ">=", "==")
+        ]
+        props += [
+            RelExpr("==", element, ArraySelect(other, INDEX))
+            for other in arrays
+            if other != array
+        ]
+        candidates += [ForAllRange(INDEX, (IntValue(0), i), p) for p in props]
+        previous = ArraySelect(array, BinaryExpr("-", INDEX, IntValue(1)))
+        candidates.append(
+            ForAllRange(INDEX, (IntValue(1), i), RelExpr("<=", previous, element))
+        )
+    return candidates
+
+
+class PathCheck:
+    """
+    an incremental solver for the candidates at the end of a path, the candidates
+    at its start are assumed through indicator literals
+    its queries get the limits of `options`, those z3 gives up on fail candidates
+    """
+
+    def __init__(
+        self, path: BasicPath, start: list[Expr], end: list[Expr], options: Options
+    ):
+        encoding = options.encoding
+        self.options = options
+        self.solver = z3.Solver(ctx=encoding.ctx)
+        for cond in path.reachability:
+            self.solver.add(cond.as_z3(encoding))
+        assertion_start = path.get_assertion_start()
+        if assertion_start is not None:
+            self.solver.add(assertion_start.as_z3(encoding))
+        self.indicators = [
+            z3.Bool(f"@houdini{j}", encoding.ctx) for j in range(len(start))
+        ]
+        for indicator, candidate in zip(self.indicators, start):
+            self.solver.add(z3.Implies(indicator, candidate.as_z3(encoding)))
+        self.goals = [
+            candidate.assign(path.transformation).as_z3(encoding) for candidate in end
+        ]
+
+    def check(self, *assumptions: z3.BoolRef) -> z3.CheckSatResult:
+        return self.options.check(self.options.limit(self.solver), *assumptions)
+
+    def prune(self, start: set[int], end: set[int]) -> set[int]:
+        """
+        the candidates of `end` that don't follow from those of `start`, they're
+        found in batches, one query for all of them and one per counterexample
+        """
+        failed: set[int] = set()
+        assumptions = [self.indicators[j] for j in sorted(start)]
+        while end - failed:
+            alive = sorted(end - failed)
+            self.solver.push()
+            self.solver.add(z3.Or([z3.Not(self.goals[i]) for i in alive]))
+            result = self.check(*assumptions)
+            if result == z3.sat:
+                model = self.solver.model()
+                falsified = {
+                    i
+                    for i in alive
+                    if z3.is_false(model.eval(self.goals[i], model_completion=True))
+                }
+                if not falsified:
+                    # models don't always evaluate quantified candidates
+                    self.solver.pop()
+                    self.solver.push()
+                    falsified = self.refute(alive, assumptions)
+                failed.update(falsified)
+            elif result == z3.unknown:
+                failed.update(alive)
+            self.solver.pop()
+            if result == z3.unsat:
+                break
+        return failed
+
+    def refute(self, candidates: list[int], assumptions: list[z3.BoolRef]) -> set[int]:
+        """
+        the candidates of `candidates` that don't follow one by one, or all of them
+        if z3 can't tell
+        """
+        failed = {
+            i
+            for i in candidates
+            if self.check(*assumptions, z3.Not(self.goals[i])) != z3.unsat
+        }
+        return failed or set(candidates)
+
+
+def houdini(
+    paths: list[BasicPath], candidates: dict[int, list[Expr]], options: Options
+) -> dict[int, list[Expr]]:
+    """
+    the largest subsets of `candidates` (by the id of the node they're candidate
+    invariants of) that are inductive along `paths`, as far as z3 can tell within
+    the limits of `options`
+    """
+    alive = {node: set(range(len(c))) for node, c in candidates.items()}
+    checks: list[tuple[int, int, PathCheck]] = []
+    for path in paths:
+        start, end = id(path.nodes[0]), id(path.nodes[-1])
+        if end in candidates:
+            check = PathCheck(path, candidates.get(start, []), candidates[end], options)
+            checks.append((start, end, check))
+
+    pending = list(range(len(checks)))
+    while pending:
+        start, end, check = checks[pending.pop()]
+        failed = check.prune(alive.get(start, set()), alive[end])
+        if failed:
+            alive[end] -= failed
+            # the paths that assumed them have to be checked again
+            pending += [
+                i for i, (s, _, _) in enumerate(checks) if s == end and i not in pending
+            ]
+    return {
+        node: [c for i, c in enumerate(candidates[node]) if i in alive[node]]
+        for node in candidates
+    }
+
+
+def infer_invariants(
+    cfg: CfgNode, vars: list[Variable], options: Options
+) -> list[AssertNode]:
+    """
+    cuts the cycles of `cfg` that have no assertion with `AssertNode`s that assert
+    the candidates (see `get_candidates()`) that survive Houdini, returns them
+    """
+    candidates = get_candidates(cfg, vars, options.encoding)
+    nodes = [insert_assert(cfg, node, BoolValue(True)) for node in get_cutpoints(cfg)]
+    if not nodes:
+        return []
+    invariants = houdini(
+        list(get_paths(cfg)), {id(node): candidates for node in nodes}, options
+    )
+    for node in nodes:
+        if invariants[id(node)]:
+            node.assertion = And(tuple(invariants[id(node)]))
+    return nodes
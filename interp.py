@@ -0,0 +1,445 @@
+from __future__ import annotations
+import math
+import random
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Any, Callable, Optional
+
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    CfgNode,
+    CondNode,
+    EndNode,
+    StartNode,
+)
+from expr import (
+    And,
+    ArraySelect,
+    ArrayStore,
+    ArrayType,
+    AsInt,
+    AsReal,
+    AtomicType,
+    BinaryExpr,
+    BoolValue,
+    DEFAULT_ENCODING,
+    Encoding,
+    Exists,
+    Expr,
+    ForAllRange,
+    INT,
+    IfThenElse,
+    IntValue,
+    Let,
+    Not,
+    Or,
+    RealValue,
+    RelExpr,
+    Then,
+    Type,
+    UnaryExpr,
+    Variable,
+    BV_WIDTH,
+    smt_div,
+    smt_mod,
+)
+
+State = dict[str, Any]
+Compiled = Callable[[State], Any]
+Step = Callable[[State], int]
+
+# quantifiers over larger ranges aren't evaluated
+MAX_RANGE = 10_000
+# sampled ints are mostly small so that they satisfy typical preconditions
+SMALL = 8
+
+
+class Stuck(Exception):
+    """
+    raised when an expression has no concrete value, e.g. when it divides by zero
+    (z3 leaves the result unspecified) or quantifies over an unbounded domain
+    """
+
+
+@dataclass(frozen=True, eq=False)
+class Array:
+    """
+    a concrete array, z3 arrays are total so unset indices hold `default`
+    """
+
+    default: Any
+    values: dict[int, Any]
+
+    def __eq__(self, other: object) -> bool:
+        # arrays are equal when they hold the same value at every index
+        if not isinstance(other, Array):
+            return NotImplemented
+        return fp_eq(self.default, other.default) and all(
+            fp_eq(self.select(i), other.select(i))
+            for i in self.values.keys() | other.values.keys()
+        )
+
+    def select(self, index: int) -> Any:
+        return self.values.get(index, self.default)
+
+    def store(self, index: int, value: Any) -> Array:
+        return Array(self.default, {**self.values, index: value})
+
+    def __str__(self) -> str:
+        values = ", ".join(f"{i}: {v}" for i, v in sorted(self.values.items()))
+        return f"[{values}, else: {self.default}]"
+
+
+def wrap(value: int) -> int:
+    """
+    the signed 32-bit integer `value` overflows to
+    """
+    value %= 2 ** BV_WIDTH
+    return value - 2 ** BV_WIDTH if value >= 2 ** (BV_WIDTH - 1) else value
+
+
+def fp_eq(lhs: Any, rhs: Any) -> bool:
+    # `==` on floats is SMT-LIB's `=`: NaN equals itself and the zeros differ
+    if isinstance(lhs, float) and isinstance(rhs, float):
+        if math.isnan(lhs) or math.isnan(rhs):
+            return math.isnan(lhs) and math.isnan(rhs)
+        return lhs == rhs and math.copysign(1, lhs) == math.copysign(1, rhs)
+    return lhs == rhs
+
+
+def fp_div(lhs: float, rhs: float) -> float:
+    if rhs != 0:
+        return lhs / rhs
+    if lhs == 0 or math.isnan(lhs):
+        return math.nan
+    return math.copysign(math.inf, lhs) * math.copysign(1, rhs)
+
+
+def fp_rem(lhs: float, rhs: float) -> float:
+    # `fp.rem` is IEEE's remainder, which rounds the quotient to the nearest
+    if rhs == 0 or math.isinf(lhs) or math.isnan(lhs) or math.isnan(rhs):
+        return math.nan
+    return math.remainder(lhs, rhs)
+
+
+def real_div(lhs: Fraction, rhs: Fraction) -> Fraction:
+    if rhs == 0:
+        raise Stuck("division by zero")
+    return lhs / rhs
+
+
+def int_div(lhs: int, rhs: int, bv: bool) -> int:
+    if rhs == 0:
+        raise Stuck("division by zero")
+    if bv:
+        # `bvsdiv` truncates towards zero
+        quotient = abs(lhs) // abs(rhs)
+        return wrap(quotient if (lhs < 0) == (rhs < 0) else -quotient)
+    return smt_div(lhs, rhs)
+
+
+def int_rem(lhs: int, rhs: int, bv: bool) -> int:
+    if rhs == 0:
+        raise Stuck("division by zero")
+    if bv:
+        # `bvsrem` takes the sign of the dividend
+        return wrap(int(math.copysign(abs(lhs) % abs(rhs), lhs)))
+    return smt_mod(lhs, rhs)
+
+
+def shift(operator: str, lhs: int, rhs: int) -> int:
+    # the amount is unsigned, large amounts shift every bit out
+    amount = rhs % 2 ** BV_WIDTH
+    if operator == ">>":
+        return lhs >> min(amount, BV_WIDTH)
+    return wrap(lhs << amount) if amount < BV_WIDTH else 0
+
+
+def compile_expr(expr: Expr, encoding: Encoding = DEFAULT_ENCODING) -> Compiled:
+    """
+    compiles `expr` into a closure that evaluates it on a state
+    values follow `encoding`: bv32 ints wrap around, fp floats are python floats
+    (IEEE doubles) and real floats are exact fractions
+    """
+    bv = encoding.int_mode == "bv32"
+    real = encoding.float_mode == "real"
+
+    def compile_(e: Expr) -> Compiled:
+        return compile_expr(e, encoding)
+
+    if isinstance(expr, IntValue):
+        number = wrap(expr.number) if bv else expr.number
+        return lambda state: number
+    elif isinstance(expr, RealValue):
+        number = Fraction(str(expr.number)) if real else expr.number
+        return lambda state: number
+    elif isinstance(expr, BoolValue):
+        value = expr.value
+        return lambda state: value
+    elif isinstance(expr, Variable):
+        name = expr.var
+
+        def variable(state: State) -> Any:
+            if name not in state:
+                raise Stuck(f"{name} has no value")
+            return state[name]
+
+        return variable
+    elif isinstance(expr, Not):
+        operand = compile_(expr.operand)
+        return lambda state: not operand(state)
+    elif isinstance(expr, And):
+        args = [compile_(a) for a in expr.args]
+        return lambda state: all(a(state) for a in args)
+    elif isinstance(expr, Or):
+        args = [compile_(a) for a in expr.args]
+        return lambda state: any(a(state) for a in args)
+    elif isinstance(expr, Then):
+        if_, then = compile_(expr.if_), compile_(expr.then)
+        return lambda state: not if_(state) or then(state)
+    elif isinstance(expr, IfThenElse):
+        cond = compile_(expr.condition)
+        true, false = compile_(expr.value_true), compile_(expr.value_false)
+        return lambda state: true(state) if cond(state) else false(state)
+    elif isinstance(expr, RelExpr):
+        lhs, rhs = compile_(expr.lhs), compile_(expr.rhs)
+        if expr.operator in ("==", "!=") and not real:
+            negate = expr.operator == "!="
+            return lambda state: fp_eq(lhs(state), rhs(state)) != negate
+        op = RelExpr.SYM2OPERATOR[expr.operator]
+        return lambda state: op(lhs(state), rhs(state))
+    elif isinstance(expr, UnaryExpr):
+        operand = compile_(expr.operand)
+        if expr.operator == "+":
+            return operand
+        op = UnaryExpr.SYM2OPERATOR[expr.operator]
+        if expr.get_type() == INT:
+            assert bv or expr.operator != "~", "~ requires bv32 ints"
+            if bv:
+                return lambda state: wrap(op(operand(state)))
+        return lambda state: op(operand(state))
+    elif isinstance(expr, BinaryExpr):
+        return compile_binary(expr, compile_(expr.lhs), compile_(expr.rhs), encoding)
+    elif isinstance(expr, AsInt):
+        value = compile_(expr.expr)
+
+        def as_int(state: State) -> int:
+            number = value(state)
+            if isinstance(number, float) and not math.isfinite(number):
+                raise Stuck(f"int({number}) is unspecified")
+            integer = math.trunc(number)
+            if bv and wrap(integer) != integer:
+                raise Stuck(f"int({number}) overflows")
+            return integer
+
+        return as_int
+    elif isinstance(expr, AsReal):
+        value = compile_(expr.expr)
+        return lambda state: Fraction(value(state)) if real else float(value(state))
+    elif isinstance(expr, ArraySelect):
+        array, index = compile_(expr.array), compile_(expr.index)
+        return lambda state: array(state).select(index(state))
+    elif isinstance(expr, ArrayStore):
+        array, index = compile_(expr.array), compile_(expr.index)
+        value = compile_(expr.value)
+        return lambda state: array(state).store(index(state), value(state))
+    elif isinstance(expr, Let):
+        bindings = [(var.var, compile_(value)) for var, value in expr.bindings]
+        body = compile_(expr.body)
+
+        def let(state: State) -> Any:
+            inner = dict(state)
+            for name, value in bindings:
+                inner[name] = value(inner)
+            return body(inner)
+
+        return let
+    elif isinstance(expr, ForAllRange) or (
+        isinstance(expr, Exists) and not isinstance(expr.domain, Type)
+    ):
+        domain = expr.range if isinstance(expr, ForAllRange) else expr.domain
+        assert isinstance(domain, tuple)
+        lo, hi = compile_(domain[0]), compile_(domain[1])
+        prop, name = compile_(expr.prop), expr.var.var
+        quantifier = all if isinstance(expr, ForAllRange) else any
+
+        def bounded(state: State) -> bool:
+            start, end = lo(state), hi(state)
+            if end - start > MAX_RANGE:
+                raise Stuck(f"the range [{start}, {end}) is too large")
+            inner = dict(state)
+
+            def holds(i: int) -> bool:
+                inner[name] = i
+                return prop(inner)
+
+            return quantifier(holds(i) for i in range(start, end))
+
+        return bounded
+    else:
+        # unbounded quantifiers and horn predicates
+        def stuck(state: State) -> Any:
+            raise Stuck(f"{type(expr).__name__} can't be evaluated")
+
+        return stuck
+
+
+def compile_binary(
+    expr: BinaryExpr, lhs: Compiled, rhs: Compiled, encoding: Encoding
+) -> Compiled:
+    if expr.get_type() != INT:
+        real = encoding.float_mode == "real"
+        if expr.operator == "/":
+            div = real_div if real else fp_div
+            return lambda state: div(lhs(state), rhs(state))
+        elif expr.operator == "%":
+            assert not real, "% isn't defined on reals"
+            return lambda state: fp_rem(lhs(state), rhs(state))
+        op = BinaryExpr.SYM2OPERATOR[expr.operator]
+        return lambda state: op(lhs(state), rhs(state))
+    bv = encoding.int_mode == "bv32"
+    if expr.operator == "/":
+        return lambda state: int_div(lhs(state), rhs(state), bv)
+    elif expr.operator == "%":
+        return lambda state: int_rem(lhs(state), rhs(state), bv)
+    assert bv or expr.operator in "+-*", f"{expr.operator} requires bv32 ints"
+    if expr.operator in ("<<", ">>"):
+        operator = expr.operator
+        return lambda state: shift(operator, lhs(state), rhs(state))
+    op = BinaryExpr.SYM2OPERATOR[expr.operator]
+    if bv:
+        return lambda state: wrap(op(lhs(state), rhs(state)))
+    return lambda state: op(lhs(state), rhs(state))
+
+
+# the results of a step besides the index of the next node
+HALTED = -1
+FAILED = -2
+
+
+@dataclass(frozen=True)
+class Program:
+    """
+    a CFG compiled into closures, `steps[i]` executes `nodes[i]` on a state and
+    returns the index of the next node, `HALTED` or `FAILED`
+    """
+
+    nodes: list[CfgNode]
+    steps: list[Step]
+
+    def run(self, state: State, fuel: int) -> Optional[CfgNode]:
+        """
+        executes at most `fuel` nodes starting from `state`, which is updated
+        returns the node whose assertion failed, if any
+        """
+        index = 0
+        for _ in range(fuel):
+            next_index = self.steps[index](state)
+            if next_index == FAILED:
+                return self.nodes[index]
+            elif next_index == HALTED:
+                return None
+            index = next_index
+        return None
+
+
+def compile_cfg(cfg: CfgNode, encoding: Encoding = DEFAULT_ENCODING) -> Program:
+    nodes: list[CfgNode] = []
+    ids: dict[int, int] = {}
+
+    def get_index(node: CfgNode) -> int:
+        if id(node) not in ids:
+            ids[id(node)] = len(nodes)
+            nodes.append(node)
+        return ids[id(node)]
+
+    def check(prop: Optional[Expr], next_index: int, otherwise: int) -> Step:
+        if prop is None:
+            return lambda state: next_index
+        return branch(compile_expr(prop, encoding), next_index, otherwise)
+
+    def branch(cond: Compiled, true: int, false: int) -> Step:
+        return lambda state: true if cond(state) else false
+
+    def assign(name: str, value: Compiled, next_index: int) -> Step:
+        def step(state: State) -> int:
+            state[name] = value(state)
+            return next_index
+
+        return step
+
+    get_index(cfg)
+    steps: list[Step] = []
+    # `nodes` grows while the steps are compiled
+    for node in nodes:
+        if isinstance(node, StartNode):
+            step = check(node.requires, get_index(node.next_node), HALTED)
+        elif isinstance(node, EndNode):
+            step = check(node.assertion, HALTED, FAILED)
+        elif isinstance(node, AssertNode):
+            step = check(node.get_assertion(), get_index(node.next_node), FAILED)
+        elif isinstance(node, AssumeNode):
+            step = check(node.expression, get_index(node.next_node), HALTED)
+        elif isinstance(node, CondNode):
+            cond = compile_expr(node.condition, encoding)
+            step = branch(cond, get_index(node.true_br), get_index(node.false_br))
+        elif isinstance(node, AssignmentNode):
+            value = compile_expr(node.expression, encoding)
+            step = assign(node.var.var, value, get_index(node.next_node))
+        else:
+            assert False, f"unexpected node of type {type(node)}"
+        steps.append(step)
+    return Program(nodes, steps)
+
+
+def sample(type_: Type, rng: random.Random, encoding: Encoding) -> Any:
+    """
+    a random value of `type_`, biased towards small values and edge cases
+    """
+    if isinstance(type_, ArrayType):
+        values = {
+            i: sample(type_.element_type, rng, encoding) for i in range(-1, SMALL)
+        }
+        return Array(sample(type_.element_type, rng, encoding), values)
+    assert isinstance(type_, AtomicType)
+    if type_.name == "bool":
+        return rng.random() < 0.5
+    elif type_.name == "int":
+        if rng.random() < 0.9:
+            return rng.randint(-SMALL, SMALL)
+        bound = 2 ** (BV_WIDTH - 1)
+        return rng.choice([-bound, bound - 1, rng.randint(-bound, bound - 1)])
+    elif encoding.float_mode == "real":
+        return Fraction(rng.randint(-4 * SMALL, 4 * SMALL), rng.choice([1, 2, 4]))
+    elif rng.random() < 0.9:
+        return rng.randint(-4 * SMALL, 4 * SMALL) / rng.choice([1, 2, 4])
+    return rng.choice([0.0, -0.0, math.inf, -math.inf, math.nan, 1e308, 5e-324])
+
+
+def falsify(
+    cfg: CfgNode,
+    vars: list[Variable],
+    samples: int,
+    encoding: Encoding = DEFAULT_ENCODING,
+    fuel: int = 10_000,
+    seed: int = 0,
+) -> Optional[tuple[State, CfgNode]]:
+    """
+    runs `cfg` on `samples` random values of `vars` (inputs that violate the
+    precondition are discarded by the start node)
+    returns the inputs and the node of the first assertion that failed, if any
+    runs that get stuck or run out of fuel are inconclusive
+    """
+    program = compile_cfg(cfg, encoding)
+    rng = random.Random(seed)
+    for _ in range(samples):
+        inputs = {var.var: sample(var.type_, rng, encoding) for var in vars}
+        try:
+            failed = program.run(dict(inputs), fuel)
+        except (Stuck, OverflowError):
+            continue
+        if failed is not None:
+            return inputs, failed
+    return None
@@ -0,0 +1,225 @@
+from __future__ import annotations
+import marshal
+from dataclasses import fields, replace
+from typing import Any
+
+from cast import AstRange
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    BasicPath,
+    CfgNode,
+    CondNode,
+    DummyNode,
+    EndNode,
+    SliceStats,
+    StartNode,
+)
+from expr import (
+    And,
+    ArraySelect,
+    ArrayStore,
+    ArrayType,
+    AsInt,
+    AsReal,
+    AtomicType,
+    BinaryExpr,
+    BoolValue,
+    Encoding,
+    Exists,
+    ForAll,
+    ForAllRange,
+    IfThenElse,
+    IntValue,
+    Let,
+    Not,
+    Or,
+    Predicate,
+    RealValue,
+    RelExpr,
+    Then,
+    UnaryExpr,
+    Variable,
+)
+from function import (
+    BmcCounterExample,
+    Bounded,
+    ConcreteCounterExample,
+    CounterExample,
+    Fail,
+    Function,
+    HornFail,
+    HornFunction,
+    HornInvariant,
+    HornOk,
+    Ok,
+    Options,
+    PathReport,
+    Timeout,
+    TraceStep,
+    Unknown,
+)
+
+VERSION = 2
+
+# an encoded object is a tuple of its tag (the index of its class) and its fields
+# tags are part of the format, new classes must be appended
+CLASSES: tuple[type, ...] = (
+    AtomicType,
+    ArrayType,
+    RelExpr,
+    And,
+    Or,
+    Not,
+    Variable,
+    BinaryExpr,
+    UnaryExpr,
+    AsInt,
+    AsReal,
+    IntValue,
+    RealValue,
+    BoolValue,
+    IfThenElse,
+    ArrayStore,
+    ArraySelect,
+    Let,
+    Then,
+    ForAll,
+    ForAllRange,
+    Exists,
+    Predicate,
+    AstRange,
+    StartNode,
+    EndNode,
+    CondNode,
+    AssignmentNode,
+    AssumeNode,
+    AssertNode,
+    DummyNode,
+    BasicPath,
+    SliceStats,
+    Function,
+    HornFunction,
+    Ok,
+    Fail,
+    Unknown,
+    HornOk,
+    HornFail,
+    HornInvariant,
+    CounterExample,
+    PathReport,
+    Encoding,
+    Options,
+    ConcreteCounterExample,
+    TraceStep,
+    BmcCounterExample,
+    Bounded,
+    Timeout,
+)
+TAGS: dict[type, int] = {cls: tag for tag, cls in enumerate(CLASSES)}
+# tags of tuples and of references to CFG nodes
+TUPLE = -1
+NODE = -2
+
+
+def portable(value: Any) -> Any:
+    """
+    drops the z3 objects of `value`, they're tied to a context of this process
+    """
+    if isinstance(value, Predicate):
+        # `as_z3()` builds the sorts from `vars`
+        return replace(value, sorts=[])
+    if isinstance(value, Encoding):
+        return replace(value, ctx=None)
+    if isinstance(value, Options):
+        # budgets are tied to the requests of this process
+        return replace(value, budget=None)
+    return value
+
+
+def to_ir(obj: Any) -> tuple[Any, list[Any]]:
+    """
+    the intermediate form of `obj`, made only of builtin values
+    CFG nodes are stored in a table and referenced by index since CFGs are cyclic
+    """
+    nodes: list[CfgNode] = []
+    node_ids: dict[int, int] = {}
+    # shared subterms are encoded once, marshal then stores them once too
+    memo: dict[int, tuple[Any, Any]] = {}
+
+    def encode(value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        elif isinstance(value, list):
+            return [encode(v) for v in value]
+        elif isinstance(value, tuple):
+            return (TUPLE, *(encode(v) for v in value))
+        elif isinstance(value, dict):
+            return {encode(k): encode(v) for k, v in value.items()}
+        elif isinstance(value, CfgNode):
+            if id(value) not in node_ids:
+                node_ids[id(value)] = len(nodes)
+                nodes.append(value)
+            return (NODE, node_ids[id(value)])
+        elif id(value) in memo:
+            return memo[id(value)][1]
+        assert type(value) in TAGS, f"{type(value).__name__} has no IR"
+        fields_ = portable(value)
+        encoded = (
+            TAGS[type(value)],
+            *(encode(getattr(fields_, f.name)) for f in fields(fields_)),
+        )
+        memo[id(value)] = (value, encoded)
+        return encoded
+
+    root = encode(obj)
+    table = []
+    # the table grows while it's encoded, nodes are visited iteratively
+    for node in nodes:
+        fields_ = (encode(getattr(node, f.name)) for f in fields(node))
+        table.append((TAGS[type(node)], *fields_))
+    return root, table
+
+
+def from_ir(root: Any, table: list[Any]) -> Any:
+    # nodes are allocated first so that cyclic references can be resolved
+    nodes = [CLASSES[n[0]].__new__(CLASSES[n[0]]) for n in table]
+    memo: dict[int, Any] = {}
+
+    def decode(value: Any) -> Any:
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        elif isinstance(value, dict):
+            return {decode(k): decode(v) for k, v in value.items()}
+        elif not isinstance(value, tuple):
+            return value
+        elif value[0] == NODE:
+            return nodes[value[1]]
+        elif id(value) in memo:
+            return memo[id(value)]
+        elif value[0] == TUPLE:
+            decoded = tuple(decode(v) for v in value[1:])
+        else:
+            decoded = CLASSES[value[0]](*(decode(v) for v in value[1:]))
+        memo[id(value)] = decoded
+        return decoded
+
+    for node, encoded in zip(nodes, table):
+        for field, value in zip(fields(node), encoded[1:]):
+            object.__setattr__(node, field.name, decode(value))
+    return decode(root)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    encodes expressions, types, CFGs, paths, functions, options and check results
+    (and lists, tuples and dicts of them) with `marshal`
+    """
+    return marshal.dumps((VERSION, *to_ir(obj)))
+
+
+def loads(data: bytes) -> Any:
+    version, root, table = marshal.loads(data)
+    assert version == VERSION, f"unsupported IR version {version}"
+    return from_ir(root, table)
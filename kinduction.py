@@ -0,0 +1,167 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Union
+
+import z3
+
+from cfg import AssertNode, BasicPath, CfgNode, EndNode, StartNode
+from expr import (
+    And,
+    BoolValue,
+    DEFAULT_ENCODING,
+    Encoding,
+    Expr,
+    INT,
+    IntValue,
+    Or,
+    Predicate,
+    RelExpr,
+    Then,
+    Variable,
+)
+
+if TYPE_CHECKING:
+    from function import Options, Unknown
+
+
+@dataclass(frozen=True)
+class CutpointSystem:
+    """
+    the basic paths between cut points as a transition system, its state is the
+    location (the index of the start node, a cut point or an end node in
+    `locations`) and the values of `vars`, those of step `i` are named `x@i`
+    """
+
+    locations: list[CfgNode]
+    paths: list[BasicPath]
+    vars: list[Variable]
+    # the index of each location by its id
+    indices: dict[int, int]
+
+    @staticmethod
+    def from_paths(paths: list[BasicPath], vars: list[Variable]) -> CutpointSystem:
+        locations: list[CfgNode] = []
+        indices: dict[int, int] = {}
+        for path in paths:
+            for node in (path.nodes[0], path.nodes[-1]):
+                if id(node) not in indices:
+                    indices[id(node)] = len(locations)
+                    locations.append(node)
+        return CutpointSystem(locations, paths, vars, indices)
+
+    def location(self, step: int) -> Variable:
+        return Variable(f"@loc@{step}", INT)
+
+    def at(self, step: int, node: CfgNode) -> Expr:
+        return RelExpr("==", self.location(step), IntValue(self.indices[id(node)]))
+
+    def state(self, step: int) -> dict[str, Expr]:
+        return {var.var: Variable(f"{var.var}@{step}", var.type_) for var in self.vars}
+
+    def initial(self) -> Expr:
+        starts: list[Expr] = []
+        for node in self.locations:
+            if isinstance(node, StartNode):
+                requires = node.requires or BoolValue(True)
+                starts.append(And((self.at(0, node), requires.assign(self.state(0)))))
+        return Or(tuple(starts))
+
+    def transition(self, step: int) -> Expr:
+        """
+        a basic path is taken from step `step` to step `step + 1`
+        """
+        current, next_ = self.state(step), self.state(step + 1)
+        transitions: list[Expr] = []
+        for path in self.paths:
+            updates = {
+                var: path.transformation.get(var, value).assign(current)
+                for var, value in current.items()
+            }
+            start = path.nodes[0]
+            # the precondition holds on entry in the step case too
+            requires = (
+                (start.requires.assign(current),)
+                if isinstance(start, StartNode) and start.requires is not None
+                else ()
+            )
+            transitions.append(
+                And(
+                    (self.at(step, start), self.at(step + 1, path.nodes[-1]))
+                    + requires
+                    + tuple(cond.assign(current) for cond in path.reachability)
+                    + tuple(RelExpr("==", next_[v], updates[v]) for v in current)
+                )
+            )
+        return Or(tuple(transitions))
+
+    def property(self, step: int) -> Expr:
+        """
+        the assertion of the location of step `step` holds, the invariants that
+        horn's cut points are annotated with are unknowns and don't count
+        """
+        assertions: list[Expr] = []
+        for node in self.locations:
+            if isinstance(node, AssertNode):
+                assertion: Optional[Expr] = node.get_assertion()
+            elif isinstance(node, EndNode):
+                assertion = node.assertion
+            else:
+                continue
+            if assertion is not None and not isinstance(assertion, Predicate):
+                assertions.append(
+                    Then(self.at(step, node), assertion.assign(self.state(step)))
+                )
+        return And(tuple(assertions))
+
+    def get_trace(
+        self, model: z3.ModelRef, depth: int, encoding: Encoding = DEFAULT_ENCODING
+    ) -> list[tuple[CfgNode, dict[str, str]]]:
+        trace = []
+        for step in range(depth + 1):
+            z = model.eval(self.location(step).as_z3(encoding), model_completion=True)
+            node = self.locations[z.as_signed_long() if z3.is_bv(z) else z.as_long()]
+            values = {
+                var: str(model.eval(value.as_z3(encoding), model_completion=True))
+                for var, value in self.state(step).items()
+            }
+            trace.append((node, values))
+        return trace
+
+
+def kinduction(
+    system: CutpointSystem, max_k: int, options: Options
+) -> tuple[Union[z3.CheckSatResult, Unknown, None], int, Optional[z3.ModelRef]]:
+    """
+    proves that every location's assertion holds by k-induction for k up to
+    `max_k`, both cases are deepened one step at a time on incremental solvers:
+    - base case: executions of k steps from the start satisfy the property
+    - step case: k steps that satisfy the property are followed by one that does
+    the assertions of cut points (loop invariants, possibly too weak to be
+    inductive on their own) strengthen the step case
+    returns like `bmc()`: `sat` with the depth and a model of a failing execution,
+    `unsat` with the k the property is k-inductive for, `Unknown` if z3 gave up
+    (within the limits of `options`) and `None` if the property isn't
+    `max_k`-inductive
+    """
+    encoding = options.encoding
+    base = z3.Solver(ctx=encoding.ctx)
+    base.add(system.initial().as_z3(encoding))
+    step = z3.Solver(ctx=encoding.ctx)
+    for k in range(max_k + 1):
+        prop = system.property(k).as_z3(encoding)
+        for solver, is_base in ((base, True), (step, False)):
+            solver.push()
+            solver.add(z3.Not(prop))
+            result = options.check(options.limit(solver))
+            if result == z3.unknown:
+                return options.get_unknown(solver), k, None
+            model = solver.model() if result == z3.sat else None
+            solver.pop()
+            if is_base and result == z3.sat:
+                return result, k, model
+            elif not is_base and result == z3.unsat:
+                return result, k, None
+        transition = system.transition(k).as_z3(encoding)
+        base.add(transition)
+        step.add(prop, transition)
+    return None, max_k, None
@@ -10,7 +10,7 @@ def compile_functions(filename: str, horn: bool = False) -> dict[str, BaseFuncti
     err = os.system(f'./comp-benchmark.sh "{filename}"')
     if err != 0:
         raise Exception(f"error code: {err}")
-    return get_functions(f"benchmarks/{filename}.json")
+    return get_functions(f"benchmarks/{filename}.json", horn=horn)
 
 
 def get_functions(path: str, horn: bool = False) -> dict[str, BaseFunction]:
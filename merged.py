@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import Optional
+
+from cfg import (
+    AssertNode,
+    AssignmentNode,
+    AssumeNode,
+    CfgNode,
+    CondNode,
+    EndNode,
+    StartNode,
+    get_nodes,
+    get_successors,
+)
+from expr import BOOL, And, BoolValue, Expr, Not, Or, RelExpr, Then, Variable
+
+
+def get_region(source: CfgNode) -> list[CfgNode]:
+    """
+    the nodes after `source` up to the assertions and end nodes the paths that
+    start at `source` end at (those included), in topological order
+    `source` may be among them if a path loops back to it
+    """
+    order: list[CfgNode] = []
+    done: set[int] = set()
+    stack: list[tuple[CfgNode, bool]] = [
+        (successor, False) for successor in reversed(get_successors(source))
+    ]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in done:
+            continue
+        if expanded:
+            done.add(id(node))
+            order.append(node)
+            continue
+        stack.append((node, True))
+        if not isinstance(node, AssertNode):
+            stack.extend((s, False) for s in reversed(get_successors(node)))
+    return order[::-1]
+
+
+def get_guard(node: CfgNode, successor: CfgNode) -> Expr:
+    """
+    the condition under which `node` is followed by `successor`
+    """
+    if isinstance(node, CondNode):
+        guards: list[Expr] = []
+        if node.true_br is successor:
+            guards.append(node.condition)
+        if node.false_br is successor:
+            guards.append(Not(node.condition))
+        return guards[0] if len(guards) == 1 else BoolValue(True)
+    elif isinstance(node, AssumeNode):
+        return node.expression
+    return BoolValue(True)
+
+
+def get_merged_rule(source: CfgNode, vars: list[Variable]) -> Optional[Expr]:
+    """
+    the proof rule of all the paths that start at `source` at once, its size is
+    linear in the number of nodes they go through rather than in the number of
+    paths:
+    - node `i` of the region (0 is `source`) has its copy of `vars`, `x@i`, the
+      values of the variables when it's reached
+    - `@at@i` holds when node `i` is reached, it's reached from a predecessor
+      whose guard holds and whose effect gives its copy of the variables
+    - the assertions of the nodes that are reached hold
+    `None` if no path starting at `source` ends with an assertion
+    """
+    region = get_region(source)
+    indices = {id(node): i + 1 for i, node in enumerate(region)}
+
+    def state(index: int) -> dict[str, Expr]:
+        return {var.var: Variable(f"{var.var}@{index}", var.type_) for var in vars}
+
+    def at(index: int) -> Expr:
+        return BoolValue(True) if index == 0 else Variable(f"@at@{index}", BOOL)
+
+    hypotheses: list[Expr] = []
+    if isinstance(source, StartNode) and source.requires is not None:
+        hypotheses.append(source.requires.assign(state(0)))
+    elif isinstance(source, AssertNode):
+        assumed = (source.assertion,) + source.remembers + source.facts
+        hypotheses.append(And(assumed).assign(state(0)))
+
+    incoming: dict[int, list[Expr]] = {i: [] for i in indices.values()}
+    for index, node in [(0, source)] + [(indices[id(n)], n) for n in region]:
+        if index != 0 and isinstance(node, AssertNode):
+            continue
+        current = state(index)
+        updates = {var: value for var, value in current.items()}
+        if isinstance(node, AssignmentNode):
+            updates[node.var.var] = node.expression.assign(current)
+        for successor in get_successors(node):
+            target = indices[id(successor)]
+            edge = And((at(index), get_guard(node, successor).assign(current)))
+            incoming[target].append(edge)
+            next_ = state(target)
+            effect = [RelExpr("==", next_[var], updates[var]) for var in next_]
+            hypotheses.append(Then(edge, And(tuple(effect))))
+    for index, edges in incoming.items():
+        hypotheses.append(Then(at(index), Or(tuple(edges))))
+
+    goals: list[Expr] = []
+    for node in region:
+        if isinstance(node, AssertNode):
+            assertion: Optional[Expr] = node.get_assertion()
+        elif isinstance(node, EndNode):
+            assertion = node.assertion
+        else:
+            continue
+        if assertion is not None:
+            index = indices[id(node)]
+            goals.append(Then(at(index), assertion.assign(state(index))))
+    if not goals:
+        return None
+    return Then(And(tuple(hypotheses)), And(tuple(goals)))
+
+
+def get_merged_proof_rule(cfg: CfgNode, vars: list[Variable]) -> Expr:
+    """
+    the proof rule of `cfg` with the paths between each pair of cut points
+    merged (see `get_merged_rule()`), an alternative to the conjunction of the
+    proof rules of the paths for when there are too many of them
+    """
+    sources = [cfg] + [node for node in get_nodes(cfg) if isinstance(node, AssertNode)]
+    rules = [get_merged_rule(source, vars) for source in sources]
+    return And(tuple(rule for rule in rules if rule is not None))
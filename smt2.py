@@ -0,0 +1,98 @@
+from __future__ import annotations
+import os
+
+import z3
+
+from expr import (
+    DEFAULT_ENCODING,
+    Encoding,
+    Exists,
+    Expr,
+    ForAll,
+    ForAllRange,
+    Let,
+    Predicate,
+    Variable,
+    smt2_symbol,
+)
+
+
+def get_declarations(
+    props: list[Expr], encoding: Encoding = DEFAULT_ENCODING
+) -> list[str]:
+    """
+    the declarations of the free variables and predicates used by `props`
+    """
+    declarations: dict[str, str] = {}
+
+    def collect(expr: Expr, bound: frozenset[str]):
+        if isinstance(expr, Variable):
+            if expr.var not in bound and expr.var not in declarations:
+                declarations[expr.var] = (
+                    f"(declare-const {smt2_symbol(expr.var)} "
+                    f"{expr.type_.as_smt2(encoding)})"
+                )
+            return
+        elif isinstance(expr, Predicate) and expr.name not in declarations:
+            sorts = " ".join(var.type_.as_smt2(encoding) for var in expr.vars)
+            declarations[expr.name] = (
+                f"(declare-fun {smt2_symbol(expr.name)} ({sorts}) Bool)"
+            )
+        if isinstance(expr, (ForAllRange, Exists)):
+            bound = bound | {expr.var.var}
+        elif isinstance(expr, ForAll):
+            bound = bound | {var.var for var in expr.vars}
+        elif isinstance(expr, Let):
+            bound = bound | expr.get_bound()
+        for child in expr.children():
+            collect(child, bound)
+
+    for prop in props:
+        collect(prop, frozenset())
+    return list(declarations.values())
+
+
+def to_smt2(
+    props: list[Expr], encoding: Encoding = DEFAULT_ENCODING, check: bool = False
+) -> str:
+    """
+    an SMT-LIB2 script that declares the symbols of `props` and asserts each of them
+    if `check` is set the script asserts the negation of the props' conjunction
+    and ends with `(check-sat)` so it can be replayed by any SMT solver
+    """
+    lines = get_declarations(props, encoding)
+    if check:
+        conjunction = " ".join(prop.as_smt2(encoding) for prop in props)
+        lines.append(f"(assert (not (and true {conjunction})))")
+        lines.append("(check-sat)")
+    else:
+        lines.extend(f"(assert {prop.as_smt2(encoding)})" for prop in props)
+    return "\n".join(lines) + "\n"
+
+
+def parse_props(
+    props: list[Expr], encoding: Encoding = DEFAULT_ENCODING
+) -> list[z3.BoolRef]:
+    """
+    translates `props` into z3 (in `encoding.ctx`) with a single call to the
+    SMT-LIB2 parser instead of one z3 API call per node
+    """
+    if not props:
+        return []
+    parsed = z3.parse_smt2_string(to_smt2(props, encoding), ctx=encoding.ctx)
+    assert len(parsed) == len(props)
+    return list(parsed)
+
+
+def write_smt2(
+    path: str, props: list[Expr], encoding: Encoding = DEFAULT_ENCODING
+) -> None:
+    """
+    writes a standalone query that checks the validity of the props' conjunction
+    (`unsat` means valid) so slow queries can be replayed with `z3 <path>`
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(to_smt2(props, encoding, check=True))
@@ -102,7 +102,7 @@ int array_max_bug(int arr[], int size) {
                 }
                 document.getElementById("clear_locations").onclick = () => this.clear_all_marks();
             } else {
-                output.innerHTML = "<p>FAIL</p>";
+                output.innerHTML = `<p>${js.timeout ? "TIMEOUT" : "FAIL"}</p>`;
                 this.invariants = null;
             }
         } else {
@@ -116,13 +116,25 @@ int array_max_bug(int arr[], int size) {
         const output = this.panels.output.querySelector("#output");
         const fail_panel = this.panels.output.querySelector("#v-fail");
         if (js.ok) {
+            let count = `${js.path_count} path${js.path_count == 1 ? "" : "s"}`;
+            if (js.timeouts) {
+                count += `, ${js.timeouts} timed out`;
+            }
+            // nothing failed but z3 gave up on some obligations
+            const status = js.timeouts && js.body.length == 0 ? "TIMEOUT" : "FAIL";
             if (js.verified) {
-                output.textContent = "OK";
+                output.textContent = `OK (${count})`;
                 fail_panel.innerHTML = "";
                 this.paths = null;
+            } else if (js.budget || js.body.length == 0) {
+                output.innerHTML = `<p>${status} (${count})</p>`;
+                fail_panel.innerHTML = js.budget
+                    ? `<p>${js.budget}, the paths aren't listed</p>`
+                    : "";
+                this.paths = null;
             } else {
                 output.innerHTML =
-                    '<p>FAIL</p><button id="clear_paths">clear paths</button>';
+                    `<p>FAIL (${count})</p><button id="clear_paths">clear paths</button>`;
                 document.getElementById("clear_paths").onclick = () =>
                     this.clear_all_marks();
                 let ht = "";
@@ -0,0 +1,206 @@
+from __future__ import annotations
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import z3
+
+from cfg import PathBudgetExceeded, count_paths
+from expr import BoolValue, get_logic
+from function import (
+    CheckResult,
+    CounterExample,
+    Function,
+    Ok,
+    Options,
+    Unknown,
+    z3_context,
+)
+
+# seconds the first strategy runs alone before the other one races it
+TIMEOUT = 5.0
+# seconds between two interruptions of a cancelled strategy
+INTERRUPT_INTERVAL = 0.01
+# functions whose paths' proof rules have more nodes are checked path by path
+MAX_MONOLITHIC_SIZE = 20_000
+
+
+def check_paths(
+    f: Function, options: Options, stopped: Optional[threading.Event] = None
+) -> CheckResult:
+    """
+    like `Function.check_iter()` but paths z3 gives up on don't keep the other
+    paths from being checked, the result is `Unknown` if there's one and no path
+    fails
+    """
+    result: CheckResult = Ok()
+    for path in options.get_paths(f.cfg):
+        if stopped is not None and stopped.is_set():
+            return Unknown(z3.unknown.r)
+        prop = options.prepare(path.get_proof_rule())
+        if prop == BoolValue(True):
+            continue
+        solver = options.get_solver(prop)
+        solver.add(z3.Not(options.encode(prop)))
+        answer = options.check(solver)
+        if answer == z3.sat:
+            return CounterExample.from_z3(solver.model())
+        elif answer == z3.unknown:
+            result = options.get_unknown(solver)
+    return result
+
+
+STRATEGIES: dict[str, Callable[[Function, Options, threading.Event], CheckResult]] = {
+    "monolithic": lambda f, options, stopped: f.check(options),
+    "paths": check_paths,
+}
+
+
+def get_other(strategy: str) -> str:
+    return "paths" if strategy == "monolithic" else "monolithic"
+
+
+def estimate(f: Function, options: Options = Options()) -> str:
+    """
+    the strategy that's likely faster for `f`:
+    - a single query when the paths go over the budgets of `options` (it's
+      merged then), when there's at most one path and when the proof rules are
+      small and quantifier-free
+    - a query per path when they're quantified, z3 instantiates quantifiers
+      better in small queries, or when they're large
+    """
+    if options.merge or count_paths(f.cfg) <= 1:
+        return "monolithic"
+    try:
+        rules = [options.prepare(p.get_proof_rule()) for p in options.get_paths(f.cfg)]
+    except PathBudgetExceeded:
+        return "monolithic"
+    for rule in rules:
+        logic = get_logic(rule, options.encoding)
+        if logic == "ALL" or not logic.startswith("QF_"):
+            return "paths"
+    if sum(rule.size() for rule in rules) > MAX_MONOLITHIC_SIZE:
+        return "paths"
+    return "monolithic"
+
+
+class Attempt:
+    """
+    a strategy that runs on a thread and a z3 context of its own
+    """
+
+    def __init__(
+        self,
+        f: Function,
+        strategy: str,
+        options: Options,
+        finished: queue.Queue[Attempt],
+    ):
+        self.strategy = strategy
+        self.result: Optional[CheckResult] = None
+        self.error: Optional[Exception] = None
+        self.stopped = threading.Event()
+        # the context while the strategy runs, contexts are reused once it's done
+        self.ctx: Optional[z3.Context] = None
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.run, args=(f, options, finished), daemon=True
+        )
+        self.thread.start()
+
+    def run(self, f: Function, options: Options, finished: queue.Queue[Attempt]):
+        with z3_context() as ctx:
+            with self.lock:
+                self.ctx = ctx
+            try:
+                check = STRATEGIES[self.strategy]
+                self.result = check(f, options.in_context(ctx), self.stopped)
+            except Exception as e:
+                self.error = e
+            finally:
+                with self.lock:
+                    self.ctx = None
+        finished.put(self)
+
+    def is_decided(self) -> bool:
+        return self.result is not None and not isinstance(self.result, Unknown)
+
+    def cancel(self):
+        self.stopped.set()
+        while self.thread.is_alive():
+            with self.lock:
+                if self.ctx is not None:
+                    self.ctx.interrupt()
+            self.thread.join(INTERRUPT_INTERVAL)
+
+
+def check_auto(
+    f: Function, options: Options, first: str, timeout: float = TIMEOUT
+) -> tuple[str, CheckResult]:
+    """
+    checks `f` with the strategy `first`, the other strategy starts once `first`
+    gives up (falls back) or after `timeout` seconds (races it), the first one
+    with an answer other than `Unknown` wins and the other one is interrupted
+    returns the strategy that won (or `first`) and its result
+    """
+    finished: queue.Queue[Attempt] = queue.Queue()
+    attempts = [Attempt(f, first, options, finished)]
+    winner: Optional[Attempt] = None
+    done: list[Attempt] = []
+    while len(done) < len(attempts):
+        try:
+            attempt = finished.get(timeout=timeout if len(attempts) == 1 else None)
+        except queue.Empty:
+            attempts.append(Attempt(f, get_other(first), options, finished))
+            continue
+        done.append(attempt)
+        if attempt.is_decided():
+            winner = attempt
+            break
+        if len(attempts) == 1:
+            attempts.append(Attempt(f, get_other(first), options, finished))
+    for attempt in attempts:
+        attempt.cancel()
+    if winner is not None:
+        assert winner.result is not None
+        return winner.strategy, winner.result
+    for attempt in done:
+        if attempt.result is not None:
+            return attempt.strategy, attempt.result
+    assert done[0].error is not None
+    raise done[0].error
+
+
+@dataclass(frozen=True)
+class StrategyStore:
+    """
+    the strategy that won the last time each function was checked (see
+    `check_auto()`), the next check of a function of the same name starts with it
+    """
+
+    winners: dict[tuple[str, str], str] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get(self, f: Function) -> Optional[str]:
+        with self.lock:
+            return self.winners.get((f.filename, f.name))
+
+    def put(self, f: Function, strategy: str):
+        with self.lock:
+            self.winners[(f.filename, f.name)] = strategy
+
+    def check(
+        self, f: Function, options: Options = Options(), timeout: float = TIMEOUT
+    ) -> tuple[str, CheckResult]:
+        """
+        `f.check()` with the strategy that won last time, or the estimated one
+        (see `estimate()`), racing the other one or falling back on it
+        returns the strategy the result is that of (see `check_auto()`), it's only
+        kept for next time if the result isn't `Unknown`
+        """
+        first = self.get(f) or estimate(f, options)
+        strategy, result = check_auto(f, options, first, timeout)
+        if not isinstance(result, Unknown):
+            self.put(f, strategy)
+        return strategy, result
@@ -1,6 +1,33 @@
+import io
+import json
 import unittest
 
+import batch
+import ir
 import main
+from app import LIMITS, get_limit
+from cfg import PathBudgetExceeded, count_paths, get_paths
+from daemon import (
+    INVALID_PARAMS,
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    Connection,
+    Daemon,
+)
+from expr import Encoding
+from function import (
+    BmcCounterExample,
+    Bounded,
+    Budget,
+    ConcreteCounterExample,
+    HornOk,
+    Options,
+    PathCache,
+    Timeout,
+)
+from strategy import StrategyStore
+from warmstart import InvariantStore
 
 
 class VerifierTests(unittest.TestCase):
@@ -55,6 +82,392 @@ class VerifierTests(unittest.TestCase):
             with self.subTest(f"test_{f} failed\n"):
                 self.assertTrue(fns[f].check_iter().is_ok())
 
+    def test_sliced_check(self):
+        fns = main.compile_functions("random")
+        for f in ["binary_search", "bubble_sort", "max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertEqual(
+                    len(list(fns[f].get_failing_paths(sliced=True))),
+                    len(list(fns[f].get_failing_paths())),
+                )
+                for stats in fns[f].get_slice_stats():
+                    self.assertLessEqual(stats.size_after, stats.size_before)
+
+    def test_split_check(self):
+        fns = main.compile_functions("random")
+        for f in ["binary_search", "insertion_sort", "merge"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check_split().is_ok())
+        for f in ["max2_bug", "de_morgan_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                failing = list(fns[f].get_failing_conjuncts())
+                self.assertTrue(failing)
+                self.assertTrue(all(conjuncts for _, conjuncts in failing))
+
+    def test_hoisted_check(self):
+        fns = main.compile_functions("random")
+        for f in ["binary_search", "bubble_sort", "insertion_sort", "partition"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check_hoisted().is_ok())
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check_hoisted().is_ok())
+
+    def test_expanded_check(self):
+        options = Options(expand_threshold=8)
+        fns = main.compile_functions("array")
+        for f in ["max3_array", "max3_array_indirect", "sort3"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+
+    def test_triggers(self):
+        options = Options(encoding=Encoding(triggers=True))
+        fns = main.compile_functions("random")
+        for f in ["binary_search", "bubble_sort", "array_reverse"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check_iter(options).is_ok())
+        for f in ["insertion_sort"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check_iter(options).is_ok())
+                self.assertTrue(
+                    any(stats for _, stats in fns[f].get_quantifier_stats(options))
+                )
+
+    def test_simplified_check(self):
+        options = Options(simplify=True)
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "array_reverse", "binary_search", "merge"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+        for f in ["max2_bug", "de_morgan_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+
+    def test_lazy_check(self):
+        options = Options(lazy=True)
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "array_reverse", "vector_add", "merge"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+        for f in ["insertion_sort", "additive_factorial"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check_iter(options).is_ok())
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+
+    def test_smt2_check(self):
+        options = Options(smt2=True)
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "array_reverse", "binary_search", "max2_float"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+                self.assertEqual(list(fns[f].get_failing_paths(options=options)), [])
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+                self.assertNotEqual(list(fns[f].get_failing_paths(options=options)), [])
+
+    def test_select_logic(self):
+        options = Options(select_logic=True)
+        fns = main.compile_functions("random")
+        for f in ["max2", "max2_float", "binary_search", "bubble_sort"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+                self.assertTrue(all(r.valid for r in fns[f].get_path_reports(options)))
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+        reports = fns["max2"].get_path_reports(options)
+        self.assertEqual({r.logic for r in reports}, {"QF_LIA"})
+
+    def test_real_floats(self):
+        options = Options(encoding=Encoding(float_mode="real"), select_logic=True)
+        fns = main.compile_functions("random")
+        for f in ["max2_float", "sqrt_v1"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+        reports = fns["max2_float"].get_path_reports(options)
+        self.assertEqual({r.logic for r in reports}, {"QF_LRA"})
+        with self.assertRaises(ValueError):
+            Options.from_json({"float_mode": "double"})
+
+    def test_bitvector_check(self):
+        options = Options(encoding=Encoding(int_mode="bv32"), select_logic=True)
+        fns = main.compile_functions("random")
+        verified = [("random", "max2"), ("max3", "max3_v1"), ("array", "sort3")]
+        for filename, f in verified:
+            with self.subTest(f"test_{f} failed\n"):
+                g = main.compile_functions(filename)[f]
+                self.assertTrue(g.check(options).is_ok())
+        for f in ["max2_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+        reports = fns["max2"].get_path_reports(options)
+        self.assertEqual({r.logic for r in reports}, {"QF_BV"})
+        with self.assertRaises(ValueError):
+            Options.from_json({"int_mode": "bv64"})
+
+    def test_parallel_check(self):
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "binary_search", "max2_float"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertEqual(list(fns[f].get_failing_paths(workers=4)), [])
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertNotEqual(list(fns[f].get_failing_paths(workers=4)), [])
+
+    def test_ir_roundtrip(self):
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "binary_search", "max2_float", "max2_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                g = ir.loads(ir.dumps(fns[f]))
+                self.assertEqual(
+                    [p.get_proof_rule() for p in get_paths(g.cfg)],
+                    [p.get_proof_rule() for p in get_paths(fns[f].cfg)],
+                )
+                result = fns[f].check()
+                self.assertEqual(ir.loads(ir.dumps(result)), result)
+
+    def test_falsify(self):
+        options = Options(falsify=1000)
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "binary_search", "max2_float"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertTrue(fns[f].check(options).is_ok())
+        for f in ["max2_bug", "de_morgan_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertFalse(fns[f].check(options).is_ok())
+        result = fns["max2_bug"].check(options)
+        self.assertIsInstance(result, ConcreteCounterExample)
+
+    def test_batch_violations(self):
+        options = Options(falsify=1000)
+        fns = main.compile_functions("random")
+        for f in ["bubble_sort", "binary_search", "max2_float"]:
+            with self.subTest(f"test_{f} failed\n"):
+                paths = list(get_paths(fns[f].cfg))
+                models = fns[f].get_violations(paths, options)
+                self.assertEqual(models, [None] * len(paths))
+        for f in ["max2_bug", "array_max_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                paths = list(get_paths(fns[f].cfg))
+                models = fns[f].get_violations(paths, options)
+                self.assertTrue(any(model is not None for model in models))
+
+    def test_batch_reachable(self):
+        fns = main.compile_functions("random")
+        for f in ["max2", "max2_bug", "de_morgan"]:
+            with self.subTest(f"test_{f} failed\n"):
+                columns = batch.sample_columns(fns[f].params + fns[f].vars, 1000)
+                taken = [
+                    batch.reachable(path, columns, 1000)
+                    for path in get_paths(fns[f].cfg)
+                ]
+                # the paths start at the same node, inputs take at most one
+                self.assertTrue(all(t.any() for t in taken))
+                self.assertTrue((sum(t.astype(int) for t in taken) <= 1).all())
+
+    def test_bmc(self):
+        verified = [
+            ("random", "max2"),
+            ("max3", "max3_v1"),
+            ("array", "sort3"),
+            ("bmc_loops", "count_to"),
+        ]
+        for filename, f in verified:
+            with self.subTest(f"test_{f} failed\n"):
+                g = main.compile_functions(filename)[f]
+                self.assertTrue(g.check_bmc(50).is_ok())
+        fns = main.compile_functions("random")
+        for f in ["max2_bug", "de_morgan_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                result = fns[f].check_bmc(50)
+                self.assertIsInstance(result, BmcCounterExample)
+                self.assertNotEqual(result.trace, [])
+        # loops without invariants are unrolled
+        loops = main.compile_functions("bmc_loops")
+        self.assertEqual(loops["count_to"].check_bmc(3), Bounded(3))
+        f = main.compile_functions("horn_array_zero")["array_max"]
+        self.assertEqual(f.check_bmc(20), Bounded(20))
+        result = loops["count_to_bug"].check_bmc(50)
+        self.assertIsInstance(result, BmcCounterExample)
+        # the failing execution goes around the loop
+        self.assertIn("2", [step.values["i"] for step in result.trace])
+
+    def test_kinduction(self):
+        verified = [
+            ("random", "max2"),
+            ("max3", "max3_v1"),
+            ("array", "sort3"),
+            ("bmc_loops", "count_up"),
+        ]
+        for filename, f in verified:
+            with self.subTest(f"test_{f} failed\n"):
+                g = main.compile_functions(filename)[f]
+                self.assertTrue(g.check_kinduction(5).is_ok())
+        fns = main.compile_functions("random")
+        for f in ["max2_bug", "de_morgan_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertIsInstance(fns[f].check_kinduction(5), BmcCounterExample)
+        # the loops of horn functions are cut by predicates, which don't count
+        loops = main.compile_functions("bmc_loops", horn=True)
+        self.assertTrue(loops["count_to"].check_kinduction(5).is_ok())
+        result = loops["count_to_bug"].check_kinduction(5)
+        self.assertIsInstance(result, BmcCounterExample)
+        # zeroing the array isn't inductive without an invariant
+        fns = main.compile_functions("horn_array_zero", horn=True)
+        self.assertEqual(fns["array_max"].check_kinduction(5), Bounded(5))
+
+    def test_absint(self):
+        for filename in ["horn_array_zero", "horn_vector_add"]:
+            for f in main.compile_functions(filename, horn=True).values():
+                with self.subTest(f"test_{f.name} failed\n"):
+                    self.assertGreater(f.seed_invariants(), 0)
+                    self.assertIsInstance(f.check(), HornOk)
+
+    def test_houdini(self):
+        fns = main.compile_functions("horn_array_zero")
+        for f in ["array_max"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertNotEqual(fns[f].infer_invariants(), [])
+                self.assertTrue(fns[f].check().is_ok())
+
+    def test_warmstart(self):
+        store = InvariantStore()
+        for run in ["cold", "warm"]:
+            f = main.compile_functions("horn_array_zero", horn=True)["array_max"]
+            # as in the web interface, spacer assumes the bounds absint finds
+            f.seed_invariants()
+            with self.subTest(f"test_{run} failed\n"):
+                if run == "warm":
+                    # the stored invariants still hold, spacer doesn't run
+                    known = store.get(f)
+                    cutpoints = store.get_predicate_nodes(f)
+                    self.assertEqual(len(known), len(cutpoints))
+                    self.assertTrue(store.is_inductive(f, known))
+                self.assertIsInstance(store.check(f), HornOk)
+        self.assertNotEqual(store.invariants, {})
+
+    def test_path_cache(self):
+        cache = PathCache()
+        for f in ["bubble_sort", "max2_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                fns = main.compile_functions("random")
+                cold = fns[f].get_path_reports(cache=cache)
+                fns = main.compile_functions("random")
+                warm = fns[f].get_path_reports(cache=cache)
+                self.assertFalse(any(report.reused for report in cold))
+                self.assertTrue(all(report.reused for report in warm))
+                self.assertEqual(
+                    [report.valid for report in cold], [report.valid for report in warm]
+                )
+
+    def test_path_count(self):
+        fns = main.compile_functions("random")
+        for f in ["insertion_sort", "bubble_sort", "binary_search", "max2_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                paths = list(get_paths(fns[f].cfg))
+                self.assertEqual(count_paths(fns[f].cfg), len(paths))
+        with self.assertRaises(PathBudgetExceeded):
+            list(get_paths(fns["bubble_sort"].cfg, max_paths=1))
+
+    def test_merged_check(self):
+        fns = main.compile_functions("random")
+        for options in [Options(merge=True), Options(max_paths=1)]:
+            for f in ["insertion_sort", "bubble_sort", "binary_search"]:
+                with self.subTest(f"test_{f} failed\n"):
+                    self.assertTrue(fns[f].check(options).is_ok())
+            for f in ["max2_bug", "de_morgan_bug", "array_max_bug"]:
+                with self.subTest(f"test_{f} failed\n"):
+                    self.assertFalse(fns[f].check(options).is_ok())
+
+    def test_auto_check(self):
+        store = StrategyStore()
+        for run in ["cold", "warm"]:
+            fns = main.compile_functions("random")
+            for f in ["insertion_sort", "sqrt_v2", "bubble_sort", "binary_search"]:
+                with self.subTest(f"test_{f} failed\n"):
+                    self.assertTrue(store.check(fns[f])[1].is_ok())
+            for f in ["max2_bug", "array_max_bug"]:
+                with self.subTest(f"test_{f} failed\n"):
+                    self.assertFalse(store.check(fns[f])[1].is_ok())
+        self.assertEqual(len(store.winners), 6)
+
+    def test_daemon(self):
+        daemon = Daemon()
+        connection = Connection(io.BytesIO())
+        request = {"method": "verify", "params": {"filename": "random"}}
+        for run in ["cold", "warm"]:
+            line = json.dumps({"jsonrpc": "2.0", "id": run, **request}).encode()
+            response = daemon.handle(connection, line)
+            assert response is not None
+            results = response["result"]
+            with self.subTest(f"test_{run} failed\n"):
+                self.assertTrue(results["bubble_sort"]["verified"])
+                self.assertFalse(results["max2_bug"]["verified"])
+        self.assertGreater(results["bubble_sort"]["reused"], 0)
+
+    def test_daemon_errors(self):
+        daemon = Daemon()
+        check = {"id": 1, "method": "check", "params": {"strategy": "bogus"}}
+        requests = [
+            (b"{bad", PARSE_ERROR),
+            (b"\xff", PARSE_ERROR),
+            (b"[]", INVALID_REQUEST),
+            (b"1", INVALID_REQUEST),
+            (b'{"id": 1, "method": "nope"}', METHOD_NOT_FOUND),
+            (b'{"id": 1, "method": "verify", "params": []}', INVALID_PARAMS),
+            (b'{"id": 1, "method": "verify", "params": {}}', INVALID_PARAMS),
+            (json.dumps(check).encode(), INVALID_PARAMS),
+        ]
+        for line, code in requests:
+            with self.subTest(f"test_{line!r} failed\n"):
+                response = daemon.handle(Connection(io.BytesIO()), line)
+                assert response is not None
+                self.assertEqual(response["error"]["code"], code)
+        # the client is still served after malformed requests
+        output = io.BytesIO()
+        daemon.serve(io.BytesIO(b"\n".join(line for line, _ in requests)), output)
+        self.assertEqual(len(output.getvalue().splitlines()), len(requests))
+
+    def test_timeout(self):
+        fns = main.compile_functions("random")
+        budget = Budget.of(60)
+        budget.cancel()
+        options = Options(timeout=10_000, budget=budget)
+        for f in ["bubble_sort", "max2_bug"]:
+            with self.subTest(f"test_{f} failed\n"):
+                self.assertIsInstance(fns[f].check(options), Timeout)
+                reports = fns[f].get_path_reports(options)
+                self.assertTrue(all(r.timeout for r in reports if not r.valid))
+        reports = fns["bubble_sort"].get_path_reports(Options(timeout=10_000))
+        self.assertFalse(any(report.timeout for report in reports))
+        # the engines that unroll loops respect the budget too
+        f = main.compile_functions("bmc_loops")["count_to"]
+        self.assertIsInstance(f.check_bmc(50, options), Timeout)
+        f = main.compile_functions("bmc_loops", horn=True)["count_to"]
+        self.assertIsInstance(f.check_kinduction(5, options), Timeout)
+        # obligations z3 gave up on aren't reported as failing
+        results = fns["max2_bug"].get_failing_path_results(True, options)
+        self.assertTrue(all(isinstance(r, Timeout) for _, r in results))
+        for _, results in fns["max2_bug"].get_failing_conjuncts(options=options):
+            self.assertTrue(all(isinstance(r, Timeout) for _, r in results))
+
+    def test_limits(self):
+        for value in [None, 0, -1, True, "1", float("nan"), 10**9]:
+            with self.subTest(f"test_{value} failed\n"):
+                self.assertEqual(get_limit({"timeout": value}, "timeout"), 10_000)
+        self.assertEqual(get_limit({"timeout": 500}, "timeout"), 500)
+        self.assertEqual(get_limit({}, "request_timeout"), LIMITS["request_timeout"])
+        for value in [0, -1, True, 1.5, "1"]:
+            with self.subTest(f"test_{value} failed\n"):
+                with self.assertRaises(ValueError):
+                    Options.from_json({"timeout": value})
+                with self.assertRaises(ValueError):
+                    Options.from_json({"max_memory": value})
+        self.assertEqual(Options.from_json({"timeout": 500}).timeout, 500)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+import z3
+
+from cast import AstRange
+from cfg import AssertNode, get_paths
+from expr import And, Expr, Predicate, Variable
+from function import (
+    CheckResult,
+    HornFail,
+    HornFunction,
+    HornInvariant,
+    HornOk,
+    Options,
+    Timeout,
+)
+from houdini import houdini
+
+# milliseconds the revalidation of a path may take at most
+TIMEOUT = 1_000
+
+# a function's name and the location of one of its cut points
+Key = tuple[str, Optional[AstRange]]
+
+
+def instantiate(expr: Expr, bodies: dict[str, tuple[list[Variable], Expr]]) -> Expr:
+    """
+    replaces the applications of the predicates of `bodies` by their bodies
+    """
+    if isinstance(expr, Predicate) and expr.name in bodies:
+        vars, body = bodies[expr.name]
+        return body.assign({v.var: a for v, a in zip(vars, expr.arguments)})
+    return expr.map(lambda e: instantiate(e, bodies))
+
+
+@dataclass(frozen=True)
+class InvariantStore:
+    """
+    the invariants horn solving found, they're kept with the names of the
+    variables of their predicate and are only reused for the same variables
+    """
+
+    invariants: dict[Key, tuple[tuple[str, ...], Expr]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @staticmethod
+    def get_predicate_nodes(f: HornFunction) -> list[AssertNode]:
+        """
+        the cut points of the predicates of `f`, in the order of `f.invariants`
+        """
+        return [n for n in f.cutpoints if isinstance(n.assertion, Predicate)]
+
+    def get(self, f: HornFunction) -> dict[int, Expr]:
+        """
+        the stored invariants of the cut points of `f` (by id)
+        """
+        known: dict[int, Expr] = {}
+        with self.lock:
+            for node in self.get_predicate_nodes(f):
+                assert isinstance(node.assertion, Predicate)
+                stored = self.invariants.get((f.name, node.code_location))
+                names = tuple(v.var for v in node.assertion.vars)
+                if stored is not None and stored[0] == names:
+                    known[id(node)] = stored[1]
+        return known
+
+    def with_facts(self, f: HornFunction, result: HornOk) -> HornOk:
+        """
+        spacer's interpretations only hold along with the facts that are assumed
+        at the cut points (see `AssertNode.facts`), the invariants are their
+        conjunctions
+        """
+        invariants = []
+        for node, invariant in zip(self.get_predicate_nodes(f), result.invariants):
+            if node.facts and not invariant.mapping and invariant.else_expr is not None:
+                body = And(node.facts + (invariant.else_expr,))
+                invariant = replace(invariant, else_expr=body)
+            invariants.append(invariant)
+        return HornOk(invariants)
+
+    def put(self, f: HornFunction, result: HornOk):
+        with self.lock:
+            for node, invariant in zip(self.get_predicate_nodes(f), result.invariants):
+                assert isinstance(node.assertion, Predicate)
+                # interpretations that list points aren't reused
+                if invariant.mapping or invariant.else_expr is None:
+                    continue
+                names = tuple(v.var for v in node.assertion.vars)
+                key = (f.name, node.code_location)
+                self.invariants[key] = (names, invariant.else_expr)
+
+    def is_inductive(
+        self, f: HornFunction, known: dict[int, Expr], options: Options = Options()
+    ) -> bool:
+        """
+        whether the proof rules of `f` hold with the predicates replaced by
+        `known`, checked one path at a time within the limits of `options` (and
+        `TIMEOUT`)
+        """
+        timeout = TIMEOUT if options.timeout is None else min(TIMEOUT, options.timeout)
+        options = replace(options, timeout=timeout)
+        bodies = {}
+        for node in self.get_predicate_nodes(f):
+            assert isinstance(node.assertion, Predicate)
+            bodies[node.assertion.name] = (node.assertion.vars, known[id(node)])
+        for rule in f.get_proof_rule():
+            solver = options.limit(z3.Solver())
+            solver.add(z3.Not(instantiate(rule, bodies).as_z3()))
+            if options.check(solver) != z3.unsat:
+                return False
+        return True
+
+    def check(self, f: HornFunction, options: Options = Options()) -> CheckResult:
+        """
+        `f.check()` starting from the invariants of the previous run on a function
+        of the same name:
+        - if they still hold they're returned without running spacer
+        - otherwise their conjuncts that are still inductive are assumed at the cut
+          points (as `AssertNode.facts`) and spacer looks for the rest
+        the invariants that are returned and stored include the facts that were
+        assumed, so that they're inductive on their own
+        """
+        cutpoints = self.get_predicate_nodes(f)
+        known = self.get(f)
+        if (
+            cutpoints
+            and len(known) == len(cutpoints)
+            and self.is_inductive(f, known, options)
+        ):
+            invariants = []
+            for node in cutpoints:
+                assert isinstance(node.assertion, Predicate)
+                invariants.append(
+                    HornInvariant(node.assertion.name, [], known[id(node)])
+                )
+            return HornOk(invariants)
+        result: Optional[CheckResult] = None
+        if known:
+            candidates = {node: list(body.conjuncts()) for node, body in known.items()}
+            facts = houdini(list(get_paths(f.cfg)), candidates, options)
+            previous = [node.facts for node in cutpoints]
+            for node in cutpoints:
+                node.facts += tuple(facts.get(id(node), []))
+            result = f.check(options)
+            if not isinstance(result, (HornOk, HornFail, Timeout)):
+                # quantified facts can keep spacer from finding counterexamples
+                for node, node_facts in zip(cutpoints, previous):
+                    node.facts = node_facts
+                result = None
+        if result is None:
+            result = f.check(options)
+        if isinstance(result, HornOk):
+            result = self.with_facts(f, result)
+            self.put(f, result)
+        return result